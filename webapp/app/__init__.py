@@ -0,0 +1,7 @@
+import sys
+from pathlib import Path
+
+# общий код сервисов шлюз импортирует так же, как сами сервисы и режим
+# local (microservices/pipeline.py), — пакетом common: модуль в процессе
+# один, и метрики, замок pdfium и кэш растров у всех общие
+sys.path.append(str(Path(__file__).resolve().parent.parent / "microservices"))
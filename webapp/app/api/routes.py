@@ -1,100 +1,236 @@
-import os
-import uuid
+import re
 import json
+import uuid
+import asyncio
+import hashlib
 from pathlib import Path
+from typing import AsyncIterator, List, Optional
+
+from fastapi import APIRouter, UploadFile, File, HTTPException, Query, Request, Response
+from fastapi.responses import FileResponse, StreamingResponse
 
-import httpx
-import pypdfium2 as pdfium
-from fastapi import APIRouter, UploadFile, File, HTTPException, Response
+from app.events import events
+from app.jobs import queue, DONE, FAILED
+from common import metrics
+from common.uploads import CHUNK_SIZE
+from app.pipeline import link_cached_result
+from app.previews import MEDIA_TYPES, get_preview
+from app.report import load_index, page_errors, summary
+from app.retention import usage
+from app.settings import UPLOAD_BASE, PREVIEW_FORMAT, PREVIEW_LEVELS
 
 router = APIRouter()
 
-# локальные адреса микросервисов
-SERVICES = {
-    "pdf":     "http://127.0.0.1:8001",
-    "layout":  "http://127.0.0.1:8010",
-    "combine": "http://127.0.0.1:8011",
-    "errors":  "http://127.0.0.1:8012",
-}
+JOB_ID_RE = re.compile(r"^[0-9a-f]{32}$")
+
+# сколько страниц ошибок отдаём за один запрос
+MAX_REPORT_PAGES = 20
+
+# раз в сколько секунд тишины SSE-поток шлёт комментарий и сверяется с базой
+SSE_KEEPALIVE = 15
+
 
-BASE_DIR     = Path(__file__).resolve().parent.parent
-UPLOAD_BASE  = BASE_DIR / "static" / "uploads"   # …/static/uploads
-TIMEOUT      = httpx.Timeout(120,  connect=60)
-LONG_TIMEOUT = httpx.Timeout(600,  connect=60)   # 10 мин ожидания
+def _job_pdf(job_id: str) -> Path:
+    """Исходный PDF задачи; job_id проверяем, прежде чем строить из него путь."""
+    pdf_path = UPLOAD_BASE / job_id / f"{job_id}.pdf"
+    if not JOB_ID_RE.match(job_id) or not pdf_path.is_file():
+        raise HTTPException(404, "Задача не найдена")
+    return pdf_path
 
-@router.post("/upload", summary="Запустить полный pipeline")
+
+async def _save_upload(file: UploadFile, dest: Path) -> str:
+    """Пишет загрузку на диск кусками и возвращает её SHA-256."""
+    digest = hashlib.sha256()
+    with open(dest, "wb") as out:
+        while chunk := await file.read(CHUNK_SIZE):
+            digest.update(chunk)
+            out.write(chunk)
+    return digest.hexdigest()
+
+
+@router.post("/upload", summary="Поставить PDF в очередь на полный pipeline", status_code=202)
 async def upload_and_process(file: UploadFile = File(...)) -> Response:
     if file.content_type != "application/pdf":
         raise HTTPException(400, "Файл должен быть PDF")
 
-    pdf_bytes = await file.read()
-
     # ── 0) создаём рабочую папку ────────────────────────────────────────────────
-    job_id       = uuid.uuid4().hex
-    job_dir      = UPLOAD_BASE / job_id
-    previews_dir = job_dir / "previews"
+    job_id  = uuid.uuid4().hex
+    job_dir = UPLOAD_BASE / job_id
+    # trace id задачи: по нему её запросы к сервисам находятся в их логах;
+    # это id самого запроса загрузки (X-Trace-Id клиента или выданный шлюзом)
+    trace_id = metrics.trace_id() or metrics.new_trace_id()
     job_dir.mkdir(parents=True, exist_ok=True)
-    previews_dir.mkdir(exist_ok=True)
 
+    # размер тела уже ограничен LimitUploadSize; файл не читаем в память целиком
     orig_pdf_path = job_dir / f"{job_id}.pdf"
-    orig_pdf_path.write_bytes(pdf_bytes)
-
-    # ── 1) PDF-parser → pdfminer_json ──────────────────────────────────────────
-    async with httpx.AsyncClient(timeout=TIMEOUT) as client:
-        resp = await client.post(
-            f"{SERVICES['pdf']}/parse",
-            files={"file": (file.filename, pdf_bytes, file.content_type)}
-        )
-    resp.raise_for_status()
-    pdfminer_json = resp.json()
-
-    # ── 2) layout_analyzer → layout_json ──────────────────────────────────────
-    async with httpx.AsyncClient(timeout=TIMEOUT) as client:
-        resp = await client.post(
-            f"{SERVICES['layout']}/analyze",
-            files={"file": (file.filename, pdf_bytes, file.content_type)}
-        )
-    resp.raise_for_status()
-    layout_json = resp.json()
-
-    # ── 3) combiner → combined_json ───────────────────────────────────────────
-    async with httpx.AsyncClient(timeout=LONG_TIMEOUT) as client:
-        resp = await client.post(
-            f"{SERVICES['combine']}/combine",
-            files={
-                "file":           (file.filename, pdf_bytes, file.content_type),
-                "struct_file":    ("layout.json",   json.dumps(layout_json,   ensure_ascii=False), "application/json"),
-                "pdfminer_file":  ("miner.json",    json.dumps(pdfminer_json, ensure_ascii=False), "application/json"),
-            }
-        )
-    resp.raise_for_status()
-    combined_json = resp.json()
-
-    # ── 4) error_detector → final_json ────────────────────────────────────────
-    async with httpx.AsyncClient(timeout=LONG_TIMEOUT) as client:
-        resp = await client.post(
-            f"{SERVICES['errors']}/detect",
-            files={"combined_file": ("combined.json",
-                                     json.dumps(combined_json, ensure_ascii=False),
-                                     "application/json")}
-        )
-    resp.raise_for_status()
-    final_json = resp.json()
-
-    # ── 5) сохраняем итоговый JSON ────────────────────────────────────────────
-    err_json_path = job_dir / f"{job_id}_errors.json"
-    err_json_path.write_text(json.dumps(final_json, ensure_ascii=False, indent=2),
-                             encoding="utf-8")
-
-    # ── 6) делаем PNG-превью (400 dpi) ────────────────────────────────────────
-    pdf = pdfium.PdfDocument(str(orig_pdf_path))
-    scale = 400 / 72
-    for i in range(len(pdf)):
-        page = pdf.get_page(i)
-        bmp  = page.render(scale=scale)
-        bmp.to_pil().save(previews_dir / f"page_{i+1}.png")
-        page.close()
-    pdf.close()
+    digest = await _save_upload(file, orig_pdf_path)
+
+    # ── 1) тот же PDF уже обрабатывался — отдаём готовый результат из кэша ──────
+    if link_cached_result(job_id, digest):
+        queue.add_done(job_id, file.filename, digest, trace_id)
+        await asyncio.to_thread(usage.refresh, job_id)
+        return Response(content=job_id, media_type="text/plain", status_code=200)
+
+    # размер задачи — в индекс хранения (см. app/retention.py)
+    await asyncio.to_thread(usage.add, job_id, orig_pdf_path.stat().st_size)
+
+    # ── 2) ставим задачу в очередь — pipeline выполнят фоновые воркеры ─────────
+    queue.enqueue(job_id, file.filename, digest, trace_id)
 
     # вернём только job_id
-    return Response(content=job_id, media_type="text/plain")
+    return Response(content=job_id, media_type="text/plain", status_code=202)
+
+
+@router.get("/jobs/{job_id}", summary="Статус задачи")
+async def job_status(job_id: str) -> dict:
+    job = queue.get(job_id)
+    if job is None:
+        raise HTTPException(404, "Задача не найдена")
+
+    job["result_url"] = f"/api/jobs/{job_id}/result" if job["status"] == DONE else None
+    return job
+
+
+def _sse(event: str, data: dict, event_id: Optional[int] = None) -> str:
+    head = f"id: {event_id}\n" if event_id is not None else ""
+    return f"{head}event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+def _sse_final(job: Optional[dict]) -> str:
+    if job is None:
+        # задачу удалила очистка хранилища, пока клиент ждал
+        return _sse("gone", {"error": "Задача удалена"})
+    if job["status"] == DONE:
+        return _sse("done", {"result_url": f"/api/jobs/{job['job_id']}/result"})
+    return _sse("failed", {"error": job["error"]})
+
+
+async def _job_stream(job_id: str, last_id: Optional[int]) -> AsyncIterator[str]:
+    job = queue.get(job_id)
+    if job is None or job["status"] in (DONE, FAILED) and not events.known(job_id):
+        yield _sse_final(job)
+        return
+
+    async for item in events.subscribe(job_id, last_id, timeout=SSE_KEEPALIVE):
+        if item is None:
+            # событий давно нет: задачу мог выполнить другой процесс шлюза
+            job = queue.get(job_id)
+            if job is None or job["status"] in (DONE, FAILED):
+                yield _sse_final(job)
+                return
+            yield ": keep-alive\n\n"
+            continue
+        event_id, event, data = item
+        yield _sse(event, data, event_id)
+
+
+@router.get("/jobs/{job_id}/events", summary="Прогресс задачи (Server-Sent Events)")
+async def job_events(job_id: str, request: Request) -> StreamingResponse:
+    """
+    События: start {pages}, stage {stage}, progress {stage, page, pages},
+    page {page, pages, errors} — ошибки готового листа, done / failed;
+    gone — задачу удалили, пока поток был открыт.
+    При переподключении браузер шлёт Last-Event-ID и получает пропущенное.
+    """
+    if queue.get(job_id) is None:
+        raise HTTPException(404, "Задача не найдена")
+
+    last_id = request.headers.get("last-event-id", "")
+    return StreamingResponse(
+        _job_stream(job_id, int(last_id) if last_id.isdigit() else None),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@router.get("/jobs/{job_id}/result", summary="Итоговый JSON с ошибками")
+async def job_result(job_id: str) -> FileResponse:
+    job = queue.get(job_id)
+    if job is None:
+        raise HTTPException(404, "Задача не найдена")
+    if job["status"] == FAILED:
+        raise HTTPException(500, f"Задача завершилась ошибкой: {job['error']}")
+    if job["status"] != DONE:
+        raise HTTPException(409, "Задача ещё выполняется")
+
+    usage.touch(job_id)
+    return FileResponse(UPLOAD_BASE / job_id / f"{job_id}_errors.json",
+                        media_type="application/json")
+
+
+async def _report_index(job_id: str) -> dict:
+    if not JOB_ID_RE.match(job_id):
+        raise HTTPException(404, "Задача не найдена")
+    index = await asyncio.to_thread(load_index, job_id)
+    if index is None:
+        job = queue.get(job_id)
+        if job is None:
+            raise HTTPException(404, "Задача не найдена")
+        if job["status"] == FAILED:
+            raise HTTPException(500, f"Задача завершилась ошибкой: {job['error']}")
+        raise HTTPException(409, "Задача ещё выполняется")
+    usage.touch(job_id)   # отчёт открыли — задача дольше не вытесняется
+    return index
+
+
+def _filters(values: Optional[List[str]]) -> Optional[set]:
+    # ?category=A&category=B и ?category=A,B — одно и то же
+    return {v for item in values for v in item.split(",") if v} if values else None
+
+
+@router.get("/jobs/{job_id}/report", summary="Сводка ошибок по страницам")
+async def job_report(
+    job_id: str,
+    category: Optional[List[str]] = Query(None),
+    issue_type: Optional[List[str]] = Query(None, alias="issueType"),
+) -> dict:
+    """Число ошибок на каждой странице и итоги по category / issueType."""
+    index = await _report_index(job_id)
+    return summary(index, _filters(category), _filters(issue_type))
+
+
+@router.get("/jobs/{job_id}/errors", summary="Ошибки страницы или диапазона страниц")
+async def job_errors(
+    job_id: str,
+    page_from: int = Query(1, ge=1),
+    page_to: Optional[int] = Query(None, ge=1),
+    category: Optional[List[str]] = Query(None),
+    issue_type: Optional[List[str]] = Query(None, alias="issueType"),
+) -> dict:
+    """
+    Ошибки страниц page_from…page_to (не больше MAX_REPORT_PAGES за раз),
+    только выбранных category / issueType, если фильтры заданы.
+    """
+    index = await _report_index(job_id)
+    page_to = page_from if page_to is None else page_to
+    if page_to < page_from:
+        raise HTTPException(400, "page_to меньше page_from")
+    page_to = min(page_to, page_from + MAX_REPORT_PAGES - 1)
+
+    categories, issue_types = _filters(category), _filters(issue_type)
+    wanted = [p["page"] for p in index["pages"] if page_from <= p["page"] <= page_to]
+
+    def read():
+        return [page_errors(job_id, n, categories, issue_types) for n in wanted]
+
+    pages = [pg for pg in await asyncio.to_thread(read) if pg is not None]
+    return {"pages": pages, "page_from": page_from, "page_to": page_to}
+
+
+@router.get("/jobs/{job_id}/previews/{page}", summary="Превью страницы")
+async def job_preview(job_id: str, page: int, zoom: int = 2) -> FileResponse:
+    if zoom not in PREVIEW_LEVELS:
+        raise HTTPException(400, f"zoom должен быть одним из {sorted(PREVIEW_LEVELS)}")
+    if page < 1:
+        raise HTTPException(404, "Страница не найдена")
+
+    pdf_path = _job_pdf(job_id)
+    usage.touch(job_id)
+    try:
+        path = await get_preview(pdf_path.parent, pdf_path, page, zoom)
+    except IndexError:
+        raise HTTPException(404, "Страница не найдена")
+
+    # превью неизменно для задачи — браузер может держать его в кэше
+    return FileResponse(path, media_type=MEDIA_TYPES[PREVIEW_FORMAT],
+                        headers={"Cache-Control": "public, max-age=86400, immutable"})
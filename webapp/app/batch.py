@@ -0,0 +1,195 @@
+"""
+Пакетная проверка папок с PDF — без шлюза и HTTP, прямыми вызовами стадий
+(microservices/pipeline.py) в пуле процессов.
+
+    python -m app.batch архив/ "проекты/**/*.pdf" -o out/ -j 4 --gpu-slots 1
+
+Каждый процесс загружает модели один раз и обрабатывает документы целиком;
+разметку (GPU) одновременно выполняют не больше --gpu-slots страниц на все
+процессы, остальные стадии идут параллельно. В out/:
+
+    results/<имя>-<sha256[:12]>_errors.json   — то же, что errors.json задачи шлюза
+    checkpoint.jsonl                          — строка на каждый обработанный документ
+    summary.json                              — итоги: документов в час, время стадий
+
+Повторный запуск с тем же -o продолжает с места остановки: документы, уже
+записанные в checkpoint.jsonl как готовые (по SHA-256), пропускаются, упавшие
+пробуются снова.
+"""
+import sys
+import json
+import glob
+import time
+import hashlib
+import argparse
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+from pathlib import Path
+from typing import Iterator
+
+STAGES = ("parse", "layout", "combine", "errors")
+
+
+def find_pdfs(patterns: list) -> Iterator[Path]:
+    """PDF по путям, папкам (рекурсивно) и glob-шаблонам, без повторов."""
+    seen = set()
+    for pattern in patterns:
+        path = Path(pattern)
+        if path.is_dir():
+            found = sorted(p for p in path.rglob("*") if p.suffix.lower() == ".pdf")
+        elif path.is_file():
+            found = [path]
+        else:
+            found = sorted(Path(p) for p in glob.glob(pattern, recursive=True))
+        for p in found:
+            key = p.resolve()
+            if p.is_file() and key not in seen:
+                seen.add(key)
+                yield p
+
+
+def file_digest(path: Path) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def load_checkpoint(path: Path) -> dict:
+    """SHA-256 → последняя запись checkpoint.jsonl о документе."""
+    done = {}
+    try:
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    rec = json.loads(line)
+                except json.JSONDecodeError:     # строка, недописанная при падении
+                    continue
+                done[rec["sha256"]] = rec
+    except FileNotFoundError:
+        pass
+    return done
+
+
+# ── процесс пула ─────────────────────────────────────────────────────────────
+
+def _init_worker(gpu_slots) -> None:
+    from microservices import pipeline as local
+    local.share_layout_lock(gpu_slots)
+
+
+def _process(pdf_path: str, digest: str, out_path: str) -> dict:
+    """Выполняется в процессе пула: весь pipeline для одного PDF."""
+    from microservices import pipeline as local
+
+    timings = {}
+    t0 = time.perf_counter()
+    rec = {"path": pdf_path, "sha256": digest, "timings": timings}
+    try:
+        final_json = local.run_pipeline(pdf_path, timings)["errors"]
+    except Exception as e:
+        rec.update(status="failed", error=f"{type(e).__name__}: {e}")
+    else:
+        tmp = Path(f"{out_path}.tmp")
+        tmp.write_text(json.dumps(final_json, ensure_ascii=False, indent=2), encoding="utf-8")
+        tmp.replace(out_path)
+        rec.update(status="done", result=out_path, pages=len(final_json),
+                   errors=sum(len(p.get("errors", [])) for p in final_json))
+    rec["seconds"] = time.perf_counter() - t0
+    return rec
+
+
+# ── итоги ────────────────────────────────────────────────────────────────────
+
+def summarize(records: list, wall_seconds: float) -> dict:
+    done   = [r for r in records if r["status"] == "done"]
+    failed = [r for r in records if r["status"] == "failed"]
+    stage_totals = {s: sum(r["timings"].get(s, 0) for r in done) for s in STAGES}
+    return {
+        "documents":          len(records),
+        "done":               len(done),
+        "failed":             len(failed),
+        "pages":              sum(r["pages"] for r in done),
+        "errors":             sum(r["errors"] for r in done),
+        "wall_seconds":       round(wall_seconds, 1),
+        "documents_per_hour": round(len(done) * 3600 / wall_seconds, 1) if wall_seconds else None,
+        # время стадий суммируется по документам: parse и layout идут одновременно
+        "stage_seconds":      {s: round(v, 1) for s, v in stage_totals.items()},
+        "stage_seconds_per_page": {
+            s: round(v / max(1, sum(r["pages"] for r in done)), 3) for s, v in stage_totals.items()
+        },
+        "failed_documents":   [{"path": r["path"], "error": r["error"]} for r in failed],
+    }
+
+
+def main(argv=None) -> None:
+    ap = argparse.ArgumentParser(prog="python -m app.batch",
+                                 description="Пакетная проверка PDF без шлюза")
+    ap.add_argument("inputs", nargs="+", help="PDF, папки или glob-шаблоны")
+    ap.add_argument("-o", "--out", required=True, type=Path, help="папка результатов")
+    ap.add_argument("-j", "--workers", type=int, default=max(1, multiprocessing.cpu_count() // 2),
+                    help="процессов (в каждом свои копии моделей)")
+    ap.add_argument("--gpu-slots", type=int, default=1,
+                    help="сколько страниц размечаются одновременно на все процессы")
+    args = ap.parse_args(argv)
+
+    results_dir = args.out.resolve() / "results"
+    results_dir.mkdir(parents=True, exist_ok=True)
+    checkpoint = args.out / "checkpoint.jsonl"
+    previous = load_checkpoint(checkpoint)
+
+    # ── 1) что осталось сделать ──────────────────────────────────────────────
+    todo, skipped, seen = [], [], set()
+    for pdf in find_pdfs(args.inputs):
+        digest = file_digest(pdf)
+        if digest in seen:                      # одинаковые файлы считаем один раз
+            continue
+        seen.add(digest)
+        rec = previous.get(digest)
+        if rec is not None and rec["status"] == "done" and Path(rec["result"]).exists():
+            skipped.append(rec)
+        else:
+            out_path = results_dir / f"{pdf.stem}-{digest[:12]}_errors.json"
+            todo.append((str(pdf), digest, str(out_path)))
+    print(f"документов: {len(skipped) + len(todo)}, уже готово: {len(skipped)}, "
+          f"в работе: {len(todo)}", file=sys.stderr)
+
+    # ── 2) пул процессов; каждая готовая запись сразу уходит в checkpoint ────
+    # spawn: CUDA и потоки моделей не переживают fork
+    ctx = multiprocessing.get_context("spawn")
+    started = time.perf_counter()
+    records = []
+    broken  = False
+    with open(checkpoint, "a", encoding="utf-8") as log, \
+            ProcessPoolExecutor(max_workers=args.workers, mp_context=ctx,
+                                initializer=_init_worker,
+                                initargs=(ctx.Semaphore(args.gpu_slots),)) as pool:
+        futures = {pool.submit(_process, *item): item for item in todo}
+        for n, fut in enumerate(as_completed(futures), 1):
+            try:
+                rec = fut.result()
+            except BrokenProcessPool:
+                # процесс пула умер (OOM, segfault) — остальное доделает перезапуск
+                broken = True
+                break
+            log.write(json.dumps(rec, ensure_ascii=False) + "\n")
+            log.flush()
+            records.append(rec)
+            print(f"[{n}/{len(todo)}] {rec['status']:6} {rec['seconds']:7.1f} с  {rec['path']}",
+                  file=sys.stderr)
+
+    # ── 3) итоги этого запуска ───────────────────────────────────────────────
+    summary = summarize(records, time.perf_counter() - started)
+    summary["skipped"] = len(skipped)
+    (args.out / "summary.json").write_text(json.dumps(summary, ensure_ascii=False, indent=2),
+                                           encoding="utf-8")
+    print(f"готово: {summary['done']}, с ошибкой: {summary['failed']}, "
+          f"документов в час: {summary['documents_per_hour']}", file=sys.stderr)
+    if broken:
+        sys.exit("пул процессов остановлен аварийно; запустите команду ещё раз, чтобы продолжить")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+import os
+import sys
+import json
+import shutil
+import hashlib
+import argparse
+from pathlib import Path
+from typing import Any, Optional
+
+from app.settings import CACHE_DIR
+
+
+def stage_tags(stages: dict, versions: dict) -> dict:
+    """
+    Тег версии для каждой стадии графа: её собственная версия плюс теги
+    зависимостей. Смена версии layout сбрасывает и combine, и errors.
+    """
+    tags: dict = {}
+    for name, (_, deps) in stages.items():   # порядок графа — топологический
+        raw = "|".join([f"{name}={versions.get(name, '0')}"] + [tags[d] for d in deps])
+        tags[name] = hashlib.sha256(raw.encode()).hexdigest()[:12]
+    return tags
+
+
+class ResultCache:
+    """
+    Результаты стадий, адресованные SHA-256 исходного PDF:
+    <root>/<digest[:2]>/<digest>/<stage>-<tag>.json
+    """
+
+    def __init__(self, root: Path):
+        self.root = Path(root)
+
+    def entry(self, digest: str) -> Path:
+        """Папка всех результатов одного PDF."""
+        return self.root / digest[:2] / digest
+
+    def path(self, digest: str, stage: str, tag: str) -> Path:
+        return self.entry(digest) / f"{stage}-{tag}.json"
+
+    def digests(self) -> set:
+        return {d.name for d in self.root.glob("*/*") if d.is_dir()}
+
+    def remove(self, digest: str) -> None:
+        d = self.entry(digest)
+        shutil.rmtree(d, ignore_errors=True)
+        try:
+            d.parent.rmdir()                # префикс, если опустел
+        except OSError:
+            pass
+
+    def get(self, digest: str, stage: str, tag: str) -> Optional[Any]:
+        try:
+            with open(self.path(digest, stage, tag), encoding="utf-8") as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+
+    def put(self, digest: str, stage: str, tag: str, data: Any) -> None:
+        path = self.path(digest, stage, tag)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+        tmp.write_text(json.dumps(data, ensure_ascii=False), encoding="utf-8")
+        os.replace(tmp, path)
+
+    def link(self, digest: str, stage: str, tag: str, dest: Path) -> bool:
+        """Кладёт закэшированный результат в dest жёсткой ссылкой (или копией)."""
+        src = self.path(digest, stage, tag)
+        if not src.exists():
+            return False
+        try:
+            os.link(src, dest)
+        except OSError:
+            shutil.copyfile(src, dest)
+        return True
+
+    def purge(self, keep_tags: Optional[dict] = None) -> int:
+        """
+        Удаляет записи кэша. С keep_tags (стадия → тег) оставляет
+        актуальные версии и удаляет только устаревшие.
+        """
+        removed = 0
+        for path in self.root.glob("*/*/*.json"):
+            stage, _, tag = path.stem.partition("-")
+            if keep_tags is not None and keep_tags.get(stage) == tag:
+                continue
+            path.unlink(missing_ok=True)
+            removed += 1
+        for d in sorted(self.root.glob("*/*"), reverse=True) + sorted(self.root.glob("*")):
+            if d.is_dir() and not any(d.iterdir()):
+                d.rmdir()
+        return removed
+
+
+cache = ResultCache(CACHE_DIR)
+
+
+def main(argv=None) -> None:
+    from app.pipeline import STAGES
+    from app.settings import STAGE_VERSIONS
+
+    ap = argparse.ArgumentParser(prog="python -m app.cache",
+                                 description="Управление кэшем результатов pipeline")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    p = sub.add_parser("purge", help="удалить записи кэша")
+    p.add_argument("--stale", action="store_true",
+                   help="только записи с устаревшими версиями стадий")
+    args = ap.parse_args(argv)
+
+    if args.cmd == "purge":
+        from app.retention import usage
+        keep = stage_tags(STAGES, STAGE_VERSIONS) if args.stale else None
+        print(f"удалено записей: {cache.purge(keep)}", file=sys.stderr)
+        for digest in usage.cache_digests():        # размеры в индексе хранения
+            usage.refresh_cache(digest)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+import asyncio
+from typing import AsyncIterator, Optional
+
+# сколько держать историю событий завершённой задачи (сек): клиент,
+# переподключившийся сразу после конца, всё равно получит done/failed
+KEEP_FINISHED = 60
+# сколько держать историю задачи, по которой давно нет событий (сек):
+# воркер мог упасть, а задачу — удалить очистка хранилища
+KEEP_IDLE = 3600
+
+# события, после которых поток задачи закрывается
+FINAL = ("done", "failed")
+
+
+class JobEvents:
+    """
+    Публикация событий задачи подписчикам (SSE) внутри процесса шлюза.
+    Каждое событие получает порядковый id; история хранится до конца
+    задачи, поэтому подписчик, пришедший позже или переподключившийся
+    с Last-Event-ID, получает пропущенное и затем — новые события.
+    """
+
+    def __init__(self):
+        self._history: dict = {}       # job_id → [(id, event, data)]
+        self._subscribers: dict = {}   # job_id → {asyncio.Queue}
+        self._timers: dict = {}        # job_id → отложенный _forget
+        self._loop = None              # цикл событий шлюза, в котором публикуют
+
+    def publish(self, job_id: str, event: str, data: dict) -> None:
+        history = self._history.setdefault(job_id, [])
+        item = (len(history), event, data)
+        history.append(item)
+        for q in self._subscribers.get(job_id, ()):
+            q.put_nowait(item)
+        timer = self._timers.pop(job_id, None)
+        if timer is not None:
+            timer.cancel()
+        delay = KEEP_FINISHED if event in FINAL else KEEP_IDLE
+        self._loop = asyncio.get_running_loop()
+        self._timers[job_id] = self._loop.call_later(delay, self._forget, job_id)
+
+    def known(self, job_id: str) -> bool:
+        return job_id in self._history
+
+    async def subscribe(self, job_id: str, last_id: Optional[int] = None,
+                        timeout: Optional[float] = None) -> AsyncIterator[Optional[tuple]]:
+        """
+        (id, event, data) начиная с last_id + 1; заканчивается на done/failed.
+        Если за timeout секунд событий не было, отдаёт None — подписчик может
+        проверить задачу сам (например, её выполняет другой процесс шлюза).
+        """
+        q = asyncio.Queue()
+        history = self._history.get(job_id, [])
+        for item in history:
+            if last_id is None or item[0] > last_id:
+                q.put_nowait(item)
+        if q.empty() and history and history[-1][1] in FINAL:
+            return   # клиент уже видел финальное событие
+        self._subscribers.setdefault(job_id, set()).add(q)
+        try:
+            while True:
+                try:
+                    item = await asyncio.wait_for(q.get(), timeout)
+                except asyncio.TimeoutError:
+                    yield None
+                    continue
+                yield item
+                if item[1] in FINAL:
+                    return
+        finally:
+            subs = self._subscribers.get(job_id)
+            if subs is not None:
+                subs.discard(q)
+                if not subs:
+                    del self._subscribers[job_id]
+
+    def forget(self, job_id: str) -> None:
+        """
+        Сбрасывает историю удалённой задачи. Очистка хранилища работает в
+        пуле потоков — тогда сброс передаётся в цикл событий шлюза.
+        """
+        loop = self._loop
+        if loop is not None and not loop.is_closed():
+            try:
+                running = asyncio.get_running_loop()
+            except RuntimeError:
+                running = None
+            if running is not loop:
+                loop.call_soon_threadsafe(self._forget, job_id)
+                return
+        self._forget(job_id)
+
+    def _forget(self, job_id: str) -> None:
+        self._history.pop(job_id, None)
+        timer = self._timers.pop(job_id, None)
+        if timer is not None:
+            timer.cancel()
+
+
+events = JobEvents()
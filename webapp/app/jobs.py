@@ -0,0 +1,206 @@
+import time
+import asyncio
+import logging
+import sqlite3
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Awaitable, Callable, Iterator, Optional
+
+from app.events import events
+from app.settings import JOBS_DB, JOB_WORKERS, JOB_POLL_EVERY
+
+log = logging.getLogger(__name__)
+
+# статусы задачи
+QUEUED, RUNNING, DONE, FAILED = "queued", "running", "done", "failed"
+
+
+class JobQueue:
+    """
+    Долговечная очередь задач на SQLite.
+    Задача — это уже сохранённый PDF в static/uploads/<job_id>;
+    в базе хранится только её состояние, поэтому после перезапуска
+    шлюза незавершённые задачи просто возвращаются в очередь.
+    """
+
+    def __init__(self, db_path: Path):
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._wakeup = asyncio.Event()
+        with self._connect() as db:
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("""
+                CREATE TABLE IF NOT EXISTS jobs (
+                    job_id   TEXT PRIMARY KEY,
+                    filename TEXT,
+                    digest   TEXT,
+                    trace_id TEXT,
+                    status   TEXT NOT NULL,
+                    stage    TEXT,
+                    error    TEXT,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    created  REAL NOT NULL,
+                    started  REAL,
+                    finished REAL
+                )
+            """)
+            db.execute("CREATE INDEX IF NOT EXISTS jobs_status ON jobs(status, created)")
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        # autocommit: каждая команда — своя транзакция, кроме явных BEGIN
+        db = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        db.row_factory = sqlite3.Row
+        try:
+            yield db
+        finally:
+            db.close()
+
+    # ── постановка и выборка ───────────────────────────────────────────────
+    def enqueue(self, job_id: str, filename: str, digest: Optional[str] = None,
+                trace_id: Optional[str] = None) -> None:
+        with self._connect() as db:
+            db.execute(
+                "INSERT INTO jobs(job_id, filename, digest, trace_id, status, created) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (job_id, filename, digest, trace_id, QUEUED, time.time()),
+            )
+        self._wakeup.set()
+
+    def add_done(self, job_id: str, filename: str, digest: Optional[str] = None,
+                 trace_id: Optional[str] = None) -> None:
+        """Записывает задачу, результат которой уже готов (взят из кэша)."""
+        now = time.time()
+        with self._connect() as db:
+            db.execute(
+                "INSERT INTO jobs(job_id, filename, digest, trace_id, status, created, started, finished) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (job_id, filename, digest, trace_id, DONE, now, now, now),
+            )
+
+    def claim(self) -> Optional[dict]:
+        """Атомарно забирает самую старую задачу из очереди."""
+        with self._connect() as db:
+            db.execute("BEGIN IMMEDIATE")
+            try:
+                row = db.execute(
+                    "SELECT job_id, filename, digest, trace_id FROM jobs WHERE status = ? "
+                    "ORDER BY created LIMIT 1",
+                    (QUEUED,),
+                ).fetchone()
+                if row is not None:
+                    db.execute(
+                        "UPDATE jobs SET status = ?, started = ?, attempts = attempts + 1 "
+                        "WHERE job_id = ?",
+                        (RUNNING, time.time(), row["job_id"]),
+                    )
+                db.execute("COMMIT")
+            except Exception:
+                db.execute("ROLLBACK")
+                raise
+        return dict(row) if row else None
+
+    async def wait(self, timeout: float = JOB_POLL_EVERY) -> None:
+        try:
+            await asyncio.wait_for(self._wakeup.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        self._wakeup.clear()
+
+    # ── смена состояния ────────────────────────────────────────────────────
+    def set_stage(self, job_id: str, stage: str) -> None:
+        with self._connect() as db:
+            db.execute("UPDATE jobs SET stage = ? WHERE job_id = ?", (stage, job_id))
+
+    def finish(self, job_id: str) -> None:
+        with self._connect() as db:
+            db.execute(
+                "UPDATE jobs SET status = ?, stage = NULL, finished = ? WHERE job_id = ?",
+                (DONE, time.time(), job_id),
+            )
+
+    def fail(self, job_id: str, error: str) -> None:
+        with self._connect() as db:
+            db.execute(
+                "UPDATE jobs SET status = ?, error = ?, finished = ? WHERE job_id = ?",
+                (FAILED, error, time.time(), job_id),
+            )
+
+    def requeue_running(self) -> int:
+        """Возвращает в очередь задачи, прерванные остановкой шлюза."""
+        with self._connect() as db:
+            cur = db.execute(
+                "UPDATE jobs SET status = ?, stage = NULL WHERE status = ?",
+                (QUEUED, RUNNING),
+            )
+        return cur.rowcount
+
+    def active_ids(self) -> set:
+        """Задачи в очереди и в работе — их папки трогать нельзя."""
+        with self._connect() as db:
+            rows = db.execute("SELECT job_id FROM jobs WHERE status IN (?, ?)", (QUEUED, RUNNING))
+            return {r["job_id"] for r in rows}
+
+    def active_digests(self) -> set:
+        """sha256 PDF задач в очереди и в работе — их записи кэша трогать нельзя."""
+        with self._connect() as db:
+            rows = db.execute("SELECT digest FROM jobs WHERE status IN (?, ?) AND digest IS NOT NULL",
+                              (QUEUED, RUNNING))
+            return {r["digest"] for r in rows}
+
+    def ids_with_digest(self, digest: str) -> list:
+        """Задачи того же PDF — у них могут быть жёсткие ссылки на файлы кэша."""
+        with self._connect() as db:
+            return [r["job_id"] for r in db.execute("SELECT job_id FROM jobs WHERE digest = ?", (digest,))]
+
+    def delete(self, job_id: str) -> None:
+        with self._connect() as db:
+            db.execute("DELETE FROM jobs WHERE job_id = ?", (job_id,))
+
+    def get(self, job_id: str) -> Optional[dict]:
+        with self._connect() as db:
+            row = db.execute("SELECT * FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+        return dict(row) if row else None
+
+
+queue = JobQueue(JOBS_DB)
+
+Handler = Callable[[dict], Awaitable[None]]
+
+
+async def _worker(n: int, handler: Handler) -> None:
+    while True:
+        job = queue.claim()
+        if job is None:
+            await queue.wait()
+            continue
+
+        job_id = job["job_id"]
+        log.info("worker %d: задача %s начата", n, job_id)
+        try:
+            await handler(job)
+        except asyncio.CancelledError:
+            # шлюз останавливается — задача останется RUNNING и
+            # вернётся в очередь при следующем старте
+            raise
+        except Exception as e:
+            log.exception("задача %s завершилась ошибкой", job_id)
+            queue.fail(job_id, f"{type(e).__name__}: {e}")
+            events.publish(job_id, "failed", {"error": f"{type(e).__name__}: {e}"})
+        else:
+            queue.finish(job_id)
+            events.publish(job_id, "done", {"result_url": f"/api/jobs/{job_id}/result"})
+            log.info("worker %d: задача %s готова", n, job_id)
+
+
+def start_workers(handler: Handler, count: int = JOB_WORKERS) -> list:
+    requeued = queue.requeue_running()
+    if requeued:
+        log.info("возвращено в очередь незавершённых задач: %d", requeued)
+    return [asyncio.create_task(_worker(n, handler)) for n in range(count)]
+
+
+async def stop_workers(tasks: list) -> None:
+    for t in tasks:
+        t.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
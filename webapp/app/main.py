@@ -1,17 +1,43 @@
-from pathlib import Path
-import json
+import asyncio
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, Request, HTTPException
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
 
 from app.api.routes import router as api_router
+from common import metrics
+from common.uploads import LimitUploadSize
+from app.jobs import start_workers, stop_workers
+from app.pipeline import process_job, open_clients, close_clients
+from app import previews
+from app.retention import retention_loop, usage
+from app.settings import (BASE_DIR, PREVIEW_LEVELS, MAX_UPLOAD_BYTES,
+                          RETENTION_DAYS, RETENTION_QUOTA_BYTES)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # пул соединений к микросервисам и фоновые воркеры очереди
+    # живут столько же, сколько приложение
+    await open_clients()
+    workers = start_workers(process_job)
+    # сборка мусора в static/uploads — если задан срок хранения или квота
+    if RETENTION_DAYS > 0 or RETENTION_QUOTA_BYTES > 0:
+        workers.append(asyncio.create_task(retention_loop()))
+    yield
+    await stop_workers(workers)
+    await close_clients()
+    previews.shutdown()
 
-BASE_DIR = Path(__file__).resolve().parent
 
 app = FastAPI(
     title="API Gateway — Интеллектуальный анализ строительных проектов",
     description="Фронтенд + маршруты к микросервисам",
+    lifespan=lifespan,
 )
+app.add_middleware(LimitUploadSize, max_bytes=MAX_UPLOAD_BYTES)
+# X-Trace-Id, время запросов и GET /metrics (в том числе стадий и кэша результатов)
+metrics.install(app, "gateway")
 
 # статика
 app.mount("/static", StaticFiles(directory=BASE_DIR / "static"), name="static")
@@ -31,14 +57,15 @@ async def show_errors(request: Request, job_id: str):
     if not json_path.exists():
         raise HTTPException(404, "Результат не найден")
 
-    with open(json_path, encoding="utf-8") as f:
-        errors_data = json.load(f)
-
+    usage.touch(job_id)
+    # сами ошибки страница подгружает по мере прокрутки (/api/jobs/<job_id>/errors)
     return templates.TemplateResponse(
         "errors.html",
         {
             "request":     request,
-            "errors":      errors_data,                
-            "preview_uri": f"/static/uploads/{job_id}/previews"
+            "report_uri":  f"/api/jobs/{job_id}/report",
+            "errors_uri":  f"/api/jobs/{job_id}/errors",
+            "preview_uri": f"/api/jobs/{job_id}/previews",
+            "preview_dpi": PREVIEW_LEVELS,
         }
     )
\ No newline at end of file
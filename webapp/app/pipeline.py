@@ -0,0 +1,542 @@
+import io
+import json
+import shutil
+import asyncio
+import logging
+from contextlib import contextmanager
+from typing import AsyncIterator, Iterator, Optional
+
+import httpx
+import pypdfium2 as pdfium
+from starlette.concurrency import iterate_in_threadpool
+
+from app.cache import cache, stage_tags
+from app.events import events
+from app.jobs import queue
+from app.report import build_report
+from app.retention import usage
+from app.settings import (UPLOAD_BASE, PDF_TRANSFER, CACHE_ENABLED, STAGE_VERSIONS,
+                          PIPELINE_MODE, PIPELINE_FORMAT, PIPELINE_COMPRESSION,
+                          PIPELINE_STREAMING, DETECT_CONCURRENCY, KEEP_RASTERS)
+from common import codec, metrics
+from common.pdfium_lock import pdfium_lock
+
+log = logging.getLogger(__name__)
+
+# в режиме local стадии вызываются в процессе шлюза, без сервисов
+LOCAL = PIPELINE_MODE == "local"
+if LOCAL:
+    from microservices import pipeline as local
+
+# локальные адреса микросервисов
+SERVICES = {
+    "pdf":     "http://127.0.0.1:8001",
+    "layout":  "http://127.0.0.1:8010",
+    "combine": "http://127.0.0.1:8011",
+    "errors":  "http://127.0.0.1:8012",
+}
+
+TIMEOUT      = httpx.Timeout(120,  connect=60)
+LONG_TIMEOUT = httpx.Timeout(600,  connect=60)   # 10 мин ожидания
+
+SERVICE_TIMEOUTS = {
+    "pdf":     TIMEOUT,
+    "layout":  TIMEOUT,
+    "combine": LONG_TIMEOUT,
+    "errors":  LONG_TIMEOUT,
+}
+
+# пул соединений на сервис; keep-alive, чтобы задачи не платили за TCP-handshake
+POOL_LIMITS = httpx.Limits(max_connections=32, max_keepalive_connections=16,
+                           keepalive_expiry=120)
+
+# в каком виде гоняем результаты стадий: сервисы отвечают по Accept /
+# Accept-Encoding, а JSON-части запроса несут свой Content-Type и Content-Encoding
+MEDIA_TYPE = codec.MSGPACK if PIPELINE_FORMAT == "msgpack" else codec.JSON
+HEADERS    = {"Accept": MEDIA_TYPE, "Accept-Encoding": PIPELINE_COMPRESSION}
+
+NDJSON = "application/x-ndjson"
+
+# клиенты живут всё время работы шлюза (см. lifespan в main.py)
+_clients: dict = {}
+
+
+async def _add_trace(request: httpx.Request) -> None:
+    # запросы задачи к сервисам несут её trace id (см. microservices/common/metrics.py)
+    trace_id = metrics.trace_id()
+    if trace_id:
+        request.headers[metrics.TRACE_HEADER] = trace_id
+
+
+async def open_clients() -> None:
+    for name, url in SERVICES.items():
+        _clients[name] = httpx.AsyncClient(base_url=url,
+                                           timeout=SERVICE_TIMEOUTS[name],
+                                           limits=POOL_LIMITS,
+                                           event_hooks={"request": [_add_trace]})
+
+
+async def close_clients() -> None:
+    clients = list(_clients.values())
+    _clients.clear()
+    await asyncio.gather(*(c.aclose() for c in clients))
+
+
+async def _send(service: str, path: str, **kwargs) -> tuple:
+    """(тело, заголовки) ответа сервиса."""
+    # тело читаем как есть и распаковываем сами: zstd умеет не каждая версия httpx
+    async with _clients[service].stream("POST", path, headers=HEADERS, **kwargs) as resp:
+        resp.raise_for_status()
+        raw = b"".join([chunk async for chunk in resp.aiter_raw()])
+
+    raw        = codec.decompress(raw, resp.headers.get("content-encoding"))
+    media_type = codec.MEDIA_TYPES.get(resp.headers.get("content-type", "").split(";")[0], codec.JSON)
+    return codec.loads(raw, media_type), resp.headers
+
+
+async def _post(service: str, path: str, **kwargs):
+    body, _ = await _send(service, path, **kwargs)
+    return body
+
+
+async def _stream(service: str, path: str, **kwargs) -> AsyncIterator[dict]:
+    """Страницы NDJSON-ответа сервиса по мере их готовности."""
+    headers = {"Accept": NDJSON, "Accept-Encoding": "identity"}
+    async with _clients[service].stream("POST", path, headers=headers, **kwargs) as resp:
+        resp.raise_for_status()
+        async for line in resp.aiter_lines():
+            if not line:
+                continue
+            page = codec.loads(line.encode("utf-8"))
+            if len(page) == 1 and "error" in page:     # сервис упал посреди документа
+                raise RuntimeError(f"{service}{path}: {page['error']}")
+            yield page
+
+
+def _part(filename: str, obj) -> tuple:
+    """Результат стадии как часть multipart в выбранном формате и сжатии."""
+    raw, headers = codec.dumps(obj, MEDIA_TYPE), {}
+    if PIPELINE_COMPRESSION != "identity":
+        raw = codec.compress(raw, PIPELINE_COMPRESSION)
+        headers["Content-Encoding"] = PIPELINE_COMPRESSION
+    return filename, raw, MEDIA_TYPE, headers
+
+
+@contextmanager
+def _pdf_fields(job: dict) -> Iterator[tuple]:
+    """
+    (files, data) для передачи PDF сервису: ссылкой на задачу или самим
+    файлом — httpx читает его с диска кусками по мере отправки.
+    """
+    if PDF_TRANSFER == "job":
+        yield {}, {"job_id": job["job_id"]}
+        return
+    with open(job["pdf_path"], "rb") as f:
+        yield {"file": (job["filename"], f, "application/pdf")}, {}
+
+
+# ── стадии pipeline ──────────────────────────────────────────────────────────
+# каждая стадия получает задачу и результаты своих зависимостей по имени
+
+async def _parse(job: dict) -> dict:
+    with _pdf_fields(job) as (files, data):
+        return await _post("pdf", "/parse", files=files, data=data)
+
+
+async def _layout(job: dict) -> dict:
+    with _pdf_fields(job) as (files, data):
+        return await _post("layout", "/analyze", files=files, data=data)
+
+
+async def _combine(job: dict, parse: dict, layout: dict) -> list:
+    with _pdf_fields(job) as (files, data):
+        return await _post("combine", "/combine", data=data, files={
+            **files,
+            "struct_file":    _part("layout.json", layout),
+            "pdfminer_file":  _part("miner.json",  parse),
+        })
+
+
+async def _errors(job: dict, combine: list) -> list:
+    return await _post("errors", "/detect", files={
+        "combined_file": _part("combined.json", combine),
+    })
+
+
+# те же стадии в процессе шлюза: блокирующие функции — в потоках
+async def _parse_local(job: dict) -> dict:
+    return await asyncio.to_thread(local.parse, job["pdf_path"])
+
+
+async def _layout_local(job: dict) -> dict:
+    return await asyncio.to_thread(local.layout, job["pdf_path"])
+
+
+async def _combine_local(job: dict, parse: dict, layout: dict) -> list:
+    return await asyncio.to_thread(local.combine, job["pdf_path"], parse, layout)
+
+
+async def _errors_local(job: dict, combine: list) -> list:
+    return await asyncio.to_thread(local.errors, combine)
+
+
+# граф стадий: имя → (функция, зависимости); порядок — топологический.
+# parse и layout друг от друга не зависят и выполняются одновременно.
+STAGES = {
+    "parse":   (_parse_local   if LOCAL else _parse,   ()),
+    "layout":  (_layout_local  if LOCAL else _layout,  ()),
+    "combine": (_combine_local if LOCAL else _combine, ("parse", "layout")),
+    "errors":  (_errors_local  if LOCAL else _errors,  ("combine",)),
+}
+
+# ключи кэша: версия стадии вместе с версиями всего, от чего она зависит
+TAGS = stage_tags(STAGES, STAGE_VERSIONS)
+
+
+async def _cache_get(digest: str, name: str):
+    """Результат стадии из кэша или None; попадание продлевает жизнь записи."""
+    cached = await asyncio.to_thread(cache.get, digest, name, TAGS[name])
+    metrics.cache_result(f"result_{name}", cached is not None)
+    if cached is not None:
+        await asyncio.to_thread(usage.touch_cache, digest)
+    return cached
+
+
+async def _cache_put(digest: str, name: str, result) -> None:
+    await asyncio.to_thread(cache.put, digest, name, TAGS[name], result)
+    await asyncio.to_thread(usage.refresh_cache, digest)      # размер — в индекс хранения
+
+
+async def run_graph(stages: dict, job: dict, targets: tuple = ("errors",)) -> dict:
+    """
+    Вычисляет стадии targets, запуская зависимости по требованию:
+    стадия сначала ищет свой результат в кэше и только при промахе
+    ждёт зависимости (независимые — одновременно) и вызывает сервис.
+    Возвращает результаты вычисленных стадий по имени; при ошибке
+    любой стадии отменяет остальные.
+    """
+    tasks, running = {}, []
+    digest = job.get("digest") if CACHE_ENABLED else None
+
+    async def run(name):
+        fn, deps = stages[name]
+        if digest:
+            cached = await _cache_get(digest, name)
+            if cached is not None:
+                return cached
+
+        inputs = await asyncio.gather(*(resolve(d) for d in deps))
+        running.append(name)
+        _set_stage(job["job_id"], running)
+        try:
+            with metrics.timed(name):
+                result = await fn(job, **dict(zip(deps, inputs)))
+        finally:
+            running.remove(name)
+
+        if digest:
+            await _cache_put(digest, name, result)
+        return result
+
+    def resolve(name):
+        if name not in tasks:
+            tasks[name] = asyncio.ensure_future(run(name))
+        return tasks[name]
+
+    try:
+        await asyncio.gather(*(resolve(t) for t in targets))
+    except BaseException:
+        for t in tasks.values():
+            t.cancel()
+        await asyncio.gather(*tasks.values(), return_exceptions=True)
+        raise
+    return {name: t.result() for name, t in tasks.items()}
+
+
+def _set_stage(job_id: str, stages: list) -> None:
+    stage = ",".join(stages)
+    queue.set_stage(job_id, stage)
+    events.publish(job_id, "stage", {"stage": stage})
+
+
+# ── постраничный режим ───────────────────────────────────────────────────────
+# parse и layout отдают страницы потоком; combine идёт по страницам в порядке
+# документа (нумерация id сквозная, её счётчики передаются от листа к листу),
+# а проверка листа начинается, как только он объединён.
+
+def _page_count(pdf_path) -> int:
+    with pdfium_lock:
+        pdf = pdfium.PdfDocument(pdf_path)
+        try:
+            return len(pdf)
+        finally:
+            pdf.close()
+
+
+def _page_pdf(pdf_path, page: int) -> bytes:
+    """Одностраничный PDF с листом page — чтобы не пересылать весь файл ради листа."""
+    with pdfium_lock:
+        src, dst = pdfium.PdfDocument(pdf_path), pdfium.PdfDocument.new()
+        try:
+            dst.import_pages(src, [page - 1])
+            buf = io.BytesIO()
+            dst.save(buf)
+            return buf.getvalue()
+        finally:
+            dst.close()
+            src.close()
+
+
+async def _page_fields(job: dict, page: int) -> tuple:
+    """(files, data) с PDF для обработки одного листа."""
+    if PDF_TRANSFER == "job":
+        return {}, {"job_id": job["job_id"]}
+    raw = await asyncio.to_thread(_page_pdf, job["pdf_path"], page)
+    return {"file": (job["filename"], raw, "application/pdf")}, {"first_page": str(page)}
+
+
+class _PageFeed:
+    """
+    Страницы потока по номеру: потребитель ждёт страницу N, пока поток
+    до неё не дошёл; ошибка потока передаётся ждущему.
+    """
+
+    def __init__(self, key: str):
+        self.key      = key
+        self.pages    = {}
+        self.finished = False
+        self.error: Optional[BaseException] = None
+        self._changed = asyncio.Condition()
+
+    async def run(self, source: AsyncIterator[dict]) -> None:
+        try:
+            async for page in source:
+                self.pages[page[self.key]] = page
+                async with self._changed:
+                    self._changed.notify_all()
+        except Exception as e:
+            self.error = e
+        finally:
+            self.finished = True
+            async with self._changed:
+                self._changed.notify_all()
+
+    async def get(self, n: int) -> Optional[dict]:
+        async with self._changed:
+            await self._changed.wait_for(
+                lambda: n in self.pages or self.finished or self.error)
+        if self.error is not None:
+            raise self.error
+        return self.pages.get(n)
+
+    def result(self) -> dict:
+        return {"pages": [self.pages[n] for n in sorted(self.pages)]}
+
+
+# откуда берутся страницы parse и layout в постраничном режиме
+STREAMS = {
+    "parse":  ("pdf",    "/parse"),
+    "layout": ("layout", "/analyze"),
+}
+
+
+async def _page_stream(job: dict, name: str) -> AsyncIterator[dict]:
+    """Страницы стадии name по мере готовности: от сервиса или из функции в потоке."""
+    if LOCAL:
+        pages = {"parse": local.iter_parse, "layout": local.iter_layout}[name](job["pdf_path"])
+        async for page in iterate_in_threadpool(pages):
+            yield page
+        return
+
+    service, path = STREAMS[name]
+    with _pdf_fields(job) as (files, data):
+        async for page in _stream(service, path, files=files, data=data):
+            yield page
+
+
+async def _stage_pages(job: dict, name: str, key: str, total: int) -> AsyncIterator[dict]:
+    """Страницы стадии: из кэша целиком или потоком от сервиса (и затем в кэш)."""
+    job_id = job["job_id"]
+    digest = job.get("digest") if CACHE_ENABLED else None
+    if digest:
+        cached = await _cache_get(digest, name)
+        if cached is not None:
+            for page in cached["pages"]:
+                yield page
+            return
+
+    pages = []
+    with metrics.timed(name):
+        async for page in _page_stream(job, name):
+            pages.append(page)
+            events.publish(job_id, "progress", {"stage": name, "page": page[key], "pages": total})
+            yield page
+
+    if digest:
+        await _cache_put(digest, name, {"pages": pages})
+
+
+async def _combine_page(job: dict, layout: dict, parse: Optional[dict], counters: dict) -> tuple:
+    """Объединяет один лист; возвращает его и счётчики id для следующего."""
+    if LOCAL:
+        counters = dict(counters)
+        pages = await asyncio.to_thread(local.combine, job["pdf_path"],
+                                        {"pages": [parse] if parse else []},
+                                        {"pages": [layout]}, counters)
+        return pages[0], counters
+
+    files, data = await _page_fields(job, layout["page"])
+    body, headers = await _send("combine", "/combine",
+                                data={**data, "id_counters": json.dumps(counters)},
+                                files={
+        **files,
+        "struct_file":    _part("layout.json", {"pages": [layout]}),
+        "pdfminer_file":  _part("miner.json",  {"pages": [parse] if parse else []}),
+    })
+    return body[0], json.loads(headers["x-id-counters"])
+
+
+async def run_pages(job: dict) -> dict:
+    """
+    Постраничный pipeline. Прогресс и ошибки каждого листа публикуются
+    в events; результаты — те же, что у run_graph, и так же кэшируются.
+    """
+    job_id = job["job_id"]
+    digest = job.get("digest") if CACHE_ENABLED else None
+    total  = await asyncio.to_thread(_page_count, job["pdf_path"])
+    events.publish(job_id, "start", {"pages": total})
+
+    parse  = _PageFeed("page_number")
+    layout = _PageFeed("page")
+    feeds  = [
+        asyncio.ensure_future(parse.run(_stage_pages(job, "parse", "page_number", total))),
+        asyncio.ensure_future(layout.run(_stage_pages(job, "layout", "page", total))),
+    ]
+    _set_stage(job_id, ["parse", "layout"])
+
+    limit    = asyncio.Semaphore(DETECT_CONCURRENCY)
+    combined = []
+    checked  = {}
+    checks   = []
+
+    detect = STAGES["errors"][0]
+
+    async def check(page):
+        async with limit:
+            with metrics.timed("errors_page"):
+                result = (await detect(job, [page]))[0]
+        checked[page["page"]] = result
+        events.publish(job_id, "page", {"page": page["page"], "pages": total,
+                                        "errors": result.get("errors", [])})
+
+    try:
+        counters   = {"table": 0, "cell": 0, "text": 0}
+        last_stage = None
+        n = 0
+        while True:
+            n += 1
+            layout_page = await layout.get(n)
+            if layout_page is None:
+                break
+            parse_page = await parse.get(n)
+
+            stage = [s for s, f in (("parse", parse), ("layout", layout)) if not f.finished]
+            if stage != last_stage:
+                _set_stage(job_id, stage + ["combine", "errors"])
+                last_stage = stage
+            with metrics.timed("combine_page"):
+                page, counters = await _combine_page(job, layout_page, parse_page, counters)
+            combined.append(page)
+            events.publish(job_id, "progress", {"stage": "combine", "page": n, "pages": total})
+            checks.append(asyncio.ensure_future(check(page)))
+
+        _set_stage(job_id, ["errors"])
+        await asyncio.gather(*feeds, *checks)
+    except BaseException:
+        for t in feeds + checks:
+            t.cancel()
+        await asyncio.gather(*feeds, *checks, return_exceptions=True)
+        raise
+
+    results = {
+        "parse":   parse.result(),
+        "layout":  layout.result(),
+        "combine": combined,
+        "errors":  [checked[p["page"]] for p in combined],
+    }
+    if digest:
+        for name in ("combine", "errors"):
+            await _cache_put(digest, name, results[name])
+    return results
+
+
+async def _streamable(job: dict) -> bool:
+    """Постраничный режим имеет смысл, пока поздние стадии не лежат в кэше."""
+    if not PIPELINE_STREAMING:
+        return False
+    digest = job.get("digest") if CACHE_ENABLED else None
+    if not digest:
+        return True
+    for name in ("combine", "errors"):
+        if await asyncio.to_thread(cache.path(digest, name, TAGS[name]).exists):
+            return False
+    return True
+
+
+async def process_job(job: dict) -> None:
+    """Полный pipeline для задачи, чей PDF уже лежит в static/uploads/<job_id>."""
+    # всё, что делает задача, включая запросы к сервисам, идёт под её trace id;
+    # итог по стадиям и кэшу — в лог, рядом с итогами сервисов по тому же id
+    with metrics.trace(job.get("trace_id") or job["job_id"]) as trace_id:
+        try:
+            with metrics.timed("job"):
+                await _run_job(job)
+        finally:
+            log.info("trace=%s задача %s: %s", trace_id, job["job_id"], metrics.summary())
+
+
+async def _run_job(job: dict) -> None:
+    job_id  = job["job_id"]
+    job_dir = UPLOAD_BASE / job_id
+
+    job = dict(job, pdf_path=job_dir / f"{job_id}.pdf")
+
+    # ── 1) parse ∥ layout → combine → errors ─────────────────────────────────
+    # стадии, уже посчитанные для этого же PDF, берутся из кэша; если поздних
+    # стадий в кэше нет, идём по страницам — первые листы готовы раньше
+    try:
+        if await _streamable(job):
+            results = await run_pages(job)
+        else:
+            results = await run_graph(STAGES, job)
+    finally:
+        # растры страниц, общие для layout и combine, больше не нужны
+        if not KEEP_RASTERS:
+            await asyncio.to_thread(shutil.rmtree, job_dir / "rasters", True)
+    final_json = results["errors"]
+
+    # превью страниц не ждём: их рендерит /api/jobs/{job_id}/previews по запросу
+
+    # ── 2) индекс и ошибки по страницам для просмотрщика ─────────────────────
+    await asyncio.to_thread(build_report, job_id, final_json)
+
+    # ── 3) сохраняем итоговый JSON ────────────────────────────────────────────
+    # пишем последним: наличие файла означает, что отчёт полностью готов
+    err_json_path = job_dir / f"{job_id}_errors.json"
+    err_json_path.write_text(json.dumps(final_json, ensure_ascii=False, indent=2),
+                             encoding="utf-8")
+    await asyncio.to_thread(usage.refresh, job_id)
+
+
+def link_cached_result(job_id: str, digest: str) -> bool:
+    """
+    Если итог для такого же PDF уже есть в кэше, кладёт его в папку задачи
+    (жёсткой ссылкой) и возвращает True — pipeline запускать не нужно.
+    """
+    if not CACHE_ENABLED:
+        return False
+    dest = UPLOAD_BASE / job_id / f"{job_id}_errors.json"
+    if not cache.link(digest, "errors", TAGS["errors"], dest):
+        return False
+    usage.touch_cache(digest)
+    return True
@@ -0,0 +1,95 @@
+import os
+import asyncio
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Optional
+
+import numpy as np
+import pypdfium2 as pdfium
+from PIL import Image
+
+from app.retention import usage
+from common.rasters import PageRasters
+from app.settings import PREVIEW_FORMAT, PREVIEW_LEVELS, PREVIEW_QUALITY, PREVIEW_WORKERS
+
+MEDIA_TYPES = {"webp": "image/webp", "jpeg": "image/jpeg"}
+
+_pool: Optional[ProcessPoolExecutor] = None
+# рендеры в процессе: повторный запрос той же картинки ждёт уже запущенный
+_inflight: dict = {}
+
+
+def _render(pdf_path: str, page_index: int, dpi: int, out_path: str) -> None:
+    """
+    Выполняется в процессе пула: рендер одной страницы в файл. Если стадии
+    pipeline уже положили растр страницы в кэш задачи, уменьшаем его,
+    а не рендерим PDF ещё раз.
+    """
+    rasters = PageRasters(pdf_path)
+    cached  = rasters.path(page_index)
+    if cached is not None and cached.exists():
+        bgr   = np.load(cached, mmap_mode="r")
+        h, w  = bgr.shape[:2]
+        img   = Image.frombuffer("RGB", (w, h), bgr, "raw", "BGR", 0, 1)
+        scale = dpi / rasters.dpi
+        img = img.resize((max(1, round(w * scale)), max(1, round(h * scale))),
+                         Image.LANCZOS, reducing_gap=3.0)
+    else:
+        pdf = pdfium.PdfDocument(pdf_path)
+        try:
+            if not 0 <= page_index < len(pdf):
+                raise IndexError(f"в документе нет страницы {page_index + 1}")
+            page = pdf[page_index]
+            img  = page.render(scale=dpi / 72).to_pil()
+            page.close()
+        finally:
+            pdf.close()
+
+    # пишем во временный файл и переименовываем: читатели не увидят половину картинки
+    tmp = f"{out_path}.{os.getpid()}.tmp"
+    img.save(tmp, format=PREVIEW_FORMAT.upper(), quality=PREVIEW_QUALITY)
+    os.replace(tmp, out_path)
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool
+    if _pool is None:
+        # spawn: форк процесса с потоками event loop небезопасен
+        _pool = ProcessPoolExecutor(max_workers=PREVIEW_WORKERS,
+                                    mp_context=multiprocessing.get_context("spawn"))
+    return _pool
+
+
+def shutdown() -> None:
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+
+async def get_preview(job_dir: Path, pdf_path: Path, page: int, level: int) -> Path:
+    """
+    Путь к превью страницы `page` (с 1) уровня `level`.
+    Рендерит в пуле процессов при первом обращении, дальше отдаёт из кэша.
+    """
+    out = job_dir / "previews" / f"page_{page}_z{level}.{PREVIEW_FORMAT}"
+    if out.exists():
+        return out
+
+    fut = _inflight.get(out)
+    if fut is not None:
+        await asyncio.shield(fut)
+        return out
+
+    out.parent.mkdir(exist_ok=True)
+    loop = asyncio.get_running_loop()
+    fut = loop.run_in_executor(_get_pool(), _render, str(pdf_path), page - 1,
+                               PREVIEW_LEVELS[level], str(out))
+    _inflight[out] = fut
+    fut.add_done_callback(lambda _: _inflight.pop(out, None))
+    await asyncio.shield(fut)
+
+    # новое превью — в размер задачи (индекс хранения)
+    await asyncio.to_thread(usage.add, job_dir.name, 0, out.stat().st_size)
+    return out
@@ -0,0 +1,116 @@
+import os
+import json
+from collections import Counter
+from pathlib import Path
+from typing import Optional
+
+from app.settings import UPLOAD_BASE
+
+# версия раскладки report/; при смене формата старые отчёты пересобираются
+REPORT_VERSION = 1
+
+
+def report_dir(job_id: str) -> Path:
+    return UPLOAD_BASE / job_id / "report"
+
+
+def _write_json(path: Path, data) -> None:
+    tmp = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    tmp.write_text(json.dumps(data, ensure_ascii=False, separators=(",", ":")), encoding="utf-8")
+    os.replace(tmp, path)
+
+
+def _key(err: dict) -> str:
+    return f"{err.get('category')}|{err.get('issueType')}"
+
+
+def build_report(job_id: str, data: Optional[list] = None) -> dict:
+    """
+    Раскладывает итоговый JSON задачи на компактный индекс и файлы ошибок
+    по страницам (report/index.json, report/page_<n>.json). Индекс пишется
+    последним: его наличие означает, что отчёт собран полностью.
+    """
+    if data is None:
+        with open(UPLOAD_BASE / job_id / f"{job_id}_errors.json", encoding="utf-8") as f:
+            data = json.load(f)
+
+    out = report_dir(job_id)
+    out.mkdir(exist_ok=True)
+
+    pages = []
+    for pg in data:
+        errors = pg.get("errors", [])
+        _write_json(out / f"page_{pg['page']}.json",
+                    {"page": pg["page"], "dpi": pg.get("dpi"), "errors": errors})
+        pages.append({
+            "page":   pg["page"],
+            "dpi":    pg.get("dpi"),
+            "errors": len(errors),
+            # «category|issueType» → число: хватает для любых сочетаний фильтров
+            "counts": dict(Counter(_key(e) for e in errors)),
+        })
+
+    index = {"version": REPORT_VERSION, "pages": pages}
+    _write_json(out / "index.json", index)
+    return index
+
+
+def load_index(job_id: str) -> Optional[dict]:
+    """
+    Индекс отчёта; для задач, завершённых до появления report/, собирается
+    из итогового JSON при первом обращении. None — итога ещё нет.
+    """
+    try:
+        with open(report_dir(job_id) / "index.json", encoding="utf-8") as f:
+            index = json.load(f)
+        if index.get("version") == REPORT_VERSION:
+            return index
+    except (FileNotFoundError, json.JSONDecodeError):
+        pass
+
+    if not (UPLOAD_BASE / job_id / f"{job_id}_errors.json").is_file():
+        return None
+    return build_report(job_id)
+
+
+def _matches(key: str, categories: Optional[set], issue_types: Optional[set]) -> bool:
+    category, _, issue_type = key.partition("|")
+    return ((not categories or category in categories)
+            and (not issue_types or issue_type in issue_types))
+
+
+def summary(index: dict, categories: Optional[set] = None, issue_types: Optional[set] = None) -> dict:
+    """Число ошибок по страницам и итоги по категориям/типам с учётом фильтров."""
+    by_category, by_type = Counter(), Counter()
+    pages = []
+    for pg in index["pages"]:
+        n = 0
+        for key, cnt in pg["counts"].items():
+            category, _, issue_type = key.partition("|")
+            if _matches(key, categories, issue_types):
+                n += cnt
+            # итоги по одному фильтру считаем с учётом другого — для счётчиков в списках
+            if _matches(key, None, issue_types):
+                by_category[category] += cnt
+            if _matches(key, categories, None):
+                by_type[issue_type] += cnt
+        pages.append({"page": pg["page"], "dpi": pg["dpi"], "errors": n})
+
+    return {
+        "pages":      pages,
+        "total":      sum(p["errors"] for p in pages),
+        "categories": dict(by_category),
+        "issueTypes": dict(by_type),
+    }
+
+
+def page_errors(job_id: str, page: int, categories: Optional[set] = None,
+                issue_types: Optional[set] = None) -> Optional[dict]:
+    try:
+        with open(report_dir(job_id) / f"page_{page}.json", encoding="utf-8") as f:
+            pg = json.load(f)
+    except FileNotFoundError:
+        return None
+    if categories or issue_types:
+        pg["errors"] = [e for e in pg["errors"] if _matches(_key(e), categories, issue_types)]
+    return pg
@@ -0,0 +1,392 @@
+"""
+Срок хранения и квота для папок задач в static/uploads и записей кэша
+результатов (app/cache.py).
+
+Размеры задач ведутся в таблице job_usage той же SQLite-базы, что и очередь:
+шлюз дописывает их, когда сохраняет PDF, завершает задачу и рендерит превью,
+и отмечает last_access, когда отчёт или превью открывают. Поэтому сборка
+мусора не обходит дерево, а читает индекс. Папки, которых в индексе нет
+(появились до него или положены руками), учитываются при первом проходе.
+Записи кэша — в таблице cache_usage: размер пересчитывается при записи в
+кэш, last_access — при каждом попадании.
+
+Итог из кэша кладётся в папку задачи жёсткой ссылкой; такой файл занимает
+место один раз и считается только за кэшем. Когда запись кэша удаляется,
+задачи того же PDF пересчитываются — их файлы становятся собственными.
+
+Порядок вытеснения:
+  1) задачи и записи кэша, которые не открывали дольше RETENTION_DAYS;
+  2) пока занято больше квоты — превью и растры страниц давно не
+     открывавшихся задач (если RETENTION_PREVIEWS_FIRST), затем записи
+     кэша, затем сами задачи, всё по LRU.
+Задачи в очереди и в работе и записи кэша их PDF не трогаются никогда, но
+в квоту входят: папки задач в работе (с растрами страниц, которые пишут
+стадии) меряются по диску на каждом проходе.
+
+По умолчанию срок и квота выключены (0) и сборка мусора не запускается;
+включаются через GATEWAY_RETENTION_DAYS и GATEWAY_RETENTION_QUOTA_GB.
+
+    python -m app.retention stats
+    python -m app.retention run [--dry-run]
+"""
+import sys
+import time
+import shutil
+import asyncio
+import logging
+import argparse
+import sqlite3
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Iterator
+
+from app.cache import cache
+from app.events import events
+from app.jobs import queue
+from app.settings import (UPLOAD_BASE, JOBS_DB, RETENTION_DAYS, RETENTION_QUOTA_BYTES,
+                          RETENTION_PREVIEWS_FIRST, RETENTION_EVERY)
+
+log = logging.getLogger(__name__)
+
+# last_access пишем не чаще раза в столько секунд на задачу
+TOUCH_EVERY = 60
+
+
+# то, что можно отрендерить заново: вытесняется раньше результатов
+REGENERABLE = ("previews", "rasters")
+
+
+def dir_usage(job_dir: Path) -> tuple:
+    """
+    (байт результатов, байт превью и растров) одной папки задачи.
+    Файлы с жёсткими ссылками — это записи кэша, их место считает кэш.
+    """
+    result = preview = 0
+    for path in job_dir.rglob("*"):
+        if path.is_file():
+            st = path.stat()
+            if st.st_nlink > 1:
+                continue
+            if path.relative_to(job_dir).parts[0] in REGENERABLE:
+                preview += st.st_size
+            else:
+                result += st.st_size
+    return result, preview
+
+
+def cache_usage(digest: str) -> int:
+    return sum(p.stat().st_size for p in cache.entry(digest).rglob("*") if p.is_file())
+
+
+class UsageIndex:
+    """Размеры и время последнего просмотра задач и записей кэша."""
+
+    def __init__(self, db_path: Path):
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._touched: dict = {}
+        with self._connect() as db:
+            db.execute("""
+                CREATE TABLE IF NOT EXISTS job_usage (
+                    job_id        TEXT PRIMARY KEY,
+                    result_bytes  INTEGER NOT NULL DEFAULT 0,
+                    preview_bytes INTEGER NOT NULL DEFAULT 0,
+                    created       REAL NOT NULL,
+                    last_access   REAL NOT NULL
+                )
+            """)
+            db.execute("CREATE INDEX IF NOT EXISTS job_usage_lru ON job_usage(last_access)")
+            db.execute("""
+                CREATE TABLE IF NOT EXISTS cache_usage (
+                    digest      TEXT PRIMARY KEY,
+                    bytes       INTEGER NOT NULL DEFAULT 0,
+                    created     REAL NOT NULL,
+                    last_access REAL NOT NULL
+                )
+            """)
+            db.execute("CREATE INDEX IF NOT EXISTS cache_usage_lru ON cache_usage(last_access)")
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        db = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        db.row_factory = sqlite3.Row
+        try:
+            yield db
+        finally:
+            db.close()
+
+    # ── учёт ───────────────────────────────────────────────────────────────
+    def add(self, job_id: str, result_bytes: int = 0, preview_bytes: int = 0,
+            created: float = None) -> None:
+        now = created or time.time()
+        with self._connect() as db:
+            db.execute(
+                "INSERT INTO job_usage(job_id, result_bytes, preview_bytes, created, last_access) "
+                "VALUES (?, ?, ?, ?, ?) ON CONFLICT(job_id) DO UPDATE SET "
+                "result_bytes = result_bytes + excluded.result_bytes, "
+                "preview_bytes = preview_bytes + excluded.preview_bytes",
+                (job_id, result_bytes, preview_bytes, now, now),
+            )
+
+    def refresh(self, job_id: str) -> int:
+        """Пересчитывает размер одной задачи (после завершения pipeline); байт результатов."""
+        result, preview = dir_usage(UPLOAD_BASE / job_id)
+        now = time.time()
+        with self._connect() as db:
+            db.execute(
+                "INSERT INTO job_usage(job_id, result_bytes, preview_bytes, created, last_access) "
+                "VALUES (?, ?, ?, ?, ?) ON CONFLICT(job_id) DO UPDATE SET "
+                "result_bytes = excluded.result_bytes, preview_bytes = excluded.preview_bytes",
+                (job_id, result, preview, now, now),
+            )
+        return result
+
+    def touch(self, job_id: str) -> None:
+        now = time.time()
+        if now - self._touched.get(job_id, 0) < TOUCH_EVERY:
+            return
+        self._touched[job_id] = now
+        with self._connect() as db:
+            db.execute("UPDATE job_usage SET last_access = ? WHERE job_id = ?", (now, job_id))
+
+    def forget(self, job_id: str) -> None:
+        self._touched.pop(job_id, None)
+        with self._connect() as db:
+            db.execute("DELETE FROM job_usage WHERE job_id = ?", (job_id,))
+
+    def drop_previews(self, job_id: str) -> None:
+        with self._connect() as db:
+            db.execute("UPDATE job_usage SET preview_bytes = 0 WHERE job_id = ?", (job_id,))
+
+    # ── кэш результатов ─────────────────────────────────────────────────────
+    def refresh_cache(self, digest: str, created: float = None) -> None:
+        """Пересчитывает размер записи кэша (после записи в неё или purge)."""
+        if not cache.entry(digest).is_dir():
+            self.forget_cache(digest)
+            return
+        size = cache_usage(digest)
+        now = created or time.time()
+        with self._connect() as db:
+            db.execute(
+                "INSERT INTO cache_usage(digest, bytes, created, last_access) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT(digest) DO UPDATE SET bytes = excluded.bytes",
+                (digest, size, now, now),
+            )
+
+    def touch_cache(self, digest: str) -> None:
+        key = ("cache", digest)
+        now = time.time()
+        if now - self._touched.get(key, 0) < TOUCH_EVERY:
+            return
+        self._touched[key] = now
+        with self._connect() as db:
+            db.execute("UPDATE cache_usage SET last_access = ? WHERE digest = ?", (now, digest))
+
+    def forget_cache(self, digest: str) -> None:
+        self._touched.pop(("cache", digest), None)
+        with self._connect() as db:
+            db.execute("DELETE FROM cache_usage WHERE digest = ?", (digest,))
+
+    # ── выборки ────────────────────────────────────────────────────────────
+    def job_ids(self) -> set:
+        with self._connect() as db:
+            return {r["job_id"] for r in db.execute("SELECT job_id FROM job_usage")}
+
+    def cache_digests(self) -> set:
+        with self._connect() as db:
+            return {r["digest"] for r in db.execute("SELECT digest FROM cache_usage")}
+
+    def totals(self) -> dict:
+        with self._connect() as db:
+            row = db.execute(
+                "SELECT COUNT(*) AS jobs, COALESCE(SUM(result_bytes), 0) AS result_bytes, "
+                "COALESCE(SUM(preview_bytes), 0) AS preview_bytes FROM job_usage"
+            ).fetchone()
+            cached = db.execute(
+                "SELECT COUNT(*) AS cache_entries, COALESCE(SUM(bytes), 0) AS cache_bytes FROM cache_usage"
+            ).fetchone()
+        return {**dict(row), **dict(cached)}
+
+    def lru(self) -> list:
+        """Задачи от давно не открывавшихся к недавним."""
+        with self._connect() as db:
+            return [dict(r) for r in db.execute("SELECT * FROM job_usage ORDER BY last_access")]
+
+    def cache_lru(self) -> list:
+        """Записи кэша от давно не использованных к недавним."""
+        with self._connect() as db:
+            return [dict(r) for r in db.execute("SELECT * FROM cache_usage ORDER BY last_access")]
+
+
+usage = UsageIndex(JOBS_DB)
+
+
+# ── сборка мусора ────────────────────────────────────────────────────────────
+def sync() -> int:
+    """
+    Добавляет в индекс папки задач и записи кэша, которых в нём нет, и
+    убирает записи о папках, удалённых вручную. Размер считается только
+    у новых папок.
+    """
+    known = usage.job_ids()
+    on_disk = {d.name for d in UPLOAD_BASE.iterdir()
+               if d.is_dir() and not d.name.startswith(("_", "."))}
+    for job_id in on_disk - known:
+        result, preview = dir_usage(UPLOAD_BASE / job_id)
+        usage.add(job_id, result, preview, created=(UPLOAD_BASE / job_id).stat().st_mtime)
+    for job_id in known - on_disk:
+        usage.forget(job_id)
+
+    known_cache = usage.cache_digests()
+    cached = cache.digests()
+    for digest in cached - known_cache:
+        usage.refresh_cache(digest, created=cache.entry(digest).stat().st_mtime)
+    for digest in known_cache - cached:
+        usage.forget_cache(digest)
+    return len(on_disk - known) + len(cached - known_cache)
+
+
+def _remove_job(job_id: str) -> None:
+    shutil.rmtree(UPLOAD_BASE / job_id, ignore_errors=True)
+    usage.forget(job_id)
+    queue.delete(job_id)
+    events.forget(job_id)
+
+
+def _remove_previews(job_id: str) -> None:
+    for name in REGENERABLE:
+        shutil.rmtree(UPLOAD_BASE / job_id / name, ignore_errors=True)
+    usage.drop_previews(job_id)
+
+
+def _remove_cache(digest: str) -> dict:
+    """
+    Удаляет запись кэша. Файлы, которые задачи того же PDF делили с ней,
+    теперь только их: возвращает новые байты результатов этих задач.
+    """
+    cache.remove(digest)
+    usage.forget_cache(digest)
+    known = usage.job_ids()
+    return {job_id: usage.refresh(job_id) for job_id in queue.ids_with_digest(digest)
+            if job_id in known and (UPLOAD_BASE / job_id).is_dir()}
+
+
+def collect(dry_run: bool = False, now: float = None) -> dict:
+    """Один проход: срок хранения, затем квота. Возвращает, что удалено."""
+    now = now or time.time()
+    sync()
+    active = queue.active_ids()
+    jobs = [j for j in usage.lru() if j["job_id"] not in active]
+    busy = queue.active_digests()
+    all_entries = usage.cache_lru()
+    entries = [c for c in all_entries if c["digest"] not in busy]
+    stats = {"jobs_removed": 0, "previews_removed": 0, "cache_removed": 0, "bytes_freed": 0}
+
+    def drop_job(j):
+        stats["jobs_removed"] += 1
+        stats["bytes_freed"] += j["result_bytes"] + j["preview_bytes"]
+        if not dry_run:
+            _remove_job(j["job_id"])
+
+    def drop_cache(c) -> int:
+        """Удаляет запись кэша; возвращает, на сколько выросли результаты задач её PDF."""
+        stats["cache_removed"] += 1
+        stats["bytes_freed"] += c["bytes"]
+        if dry_run:
+            return 0
+        sizes, grown = _remove_cache(c["digest"]), 0
+        for j in jobs:
+            if j["job_id"] in sizes:
+                grown += sizes[j["job_id"]] - j["result_bytes"]
+                j["result_bytes"] = sizes[j["job_id"]]
+        stats["bytes_freed"] -= grown          # эти байты остались на диске за задачами
+        return grown
+
+    # 1) срок хранения
+    if RETENTION_DAYS > 0:
+        deadline = now - RETENTION_DAYS * 86400
+        for j in [j for j in jobs if j["last_access"] < deadline]:
+            drop_job(j)
+        jobs = [j for j in jobs if j["last_access"] >= deadline]
+        for c in [c for c in entries if c["last_access"] < deadline]:
+            drop_cache(c)
+        entries = [c for c in entries if c["last_access"] >= deadline]
+
+    # 2) квота
+    if RETENTION_QUOTA_BYTES > 0:
+        # задачи в работе не вытесняются, но место занимают — и не то, что в
+        # индексе: растры страниц (сотни МБ на лист) пишутся прямо сейчас,
+        # поэтому их папки меряются по диску
+        live = sum(sum(dir_usage(UPLOAD_BASE / job_id)) for job_id in active
+                   if (UPLOAD_BASE / job_id).is_dir())
+        used = (live
+                + sum(j["result_bytes"] + j["preview_bytes"] for j in jobs)
+                + sum(c["bytes"] for c in entries)
+                + sum(c["bytes"] for c in all_entries if c["digest"] in busy))
+
+        if RETENTION_PREVIEWS_FIRST:
+            for j in jobs:
+                if used <= RETENTION_QUOTA_BYTES:
+                    break
+                if j["preview_bytes"]:
+                    used -= j["preview_bytes"]
+                    stats["previews_removed"] += 1
+                    stats["bytes_freed"] += j["preview_bytes"]
+                    if not dry_run:
+                        _remove_previews(j["job_id"])
+                    j["preview_bytes"] = 0
+
+        # записи кэша можно посчитать заново — они вытесняются раньше задач;
+        # общие с задачами файлы после удаления записи остаются за задачами
+        for c in entries:
+            if used <= RETENTION_QUOTA_BYTES:
+                break
+            used -= c["bytes"]
+            used += drop_cache(c)
+
+        for j in jobs:
+            if used <= RETENTION_QUOTA_BYTES:
+                break
+            used -= j["result_bytes"] + j["preview_bytes"]
+            drop_job(j)
+
+    return stats
+
+
+async def retention_loop(every: float = RETENTION_EVERY) -> None:
+    """Фоновая задача шлюза: сборка мусора раз в every секунд."""
+    while True:
+        try:
+            stats = await asyncio.to_thread(collect)
+            if stats["jobs_removed"] or stats["previews_removed"] or stats["cache_removed"]:
+                log.info("retention: %s", stats)
+        except Exception:
+            log.exception("retention: проход завершился ошибкой")
+        await asyncio.sleep(every)
+
+
+def main(argv=None) -> None:
+    ap = argparse.ArgumentParser(prog="python -m app.retention",
+                                 description="Срок хранения и квота папок задач")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    sub.add_parser("stats", help="занятое место по индексу")
+    p = sub.add_parser("run", help="один проход сборки мусора")
+    p.add_argument("--dry-run", action="store_true", help="только показать, что будет удалено")
+    args = ap.parse_args(argv)
+
+    if args.cmd == "stats":
+        sync()
+        t = usage.totals()
+        print(f"задач: {t['jobs']}, результаты: {t['result_bytes'] / 2**20:.1f} МБ, "
+              f"превью: {t['preview_bytes'] / 2**20:.1f} МБ, "
+              f"кэш: {t['cache_entries']} PDF, {t['cache_bytes'] / 2**20:.1f} МБ", file=sys.stderr)
+    elif args.cmd == "run":
+        stats = collect(dry_run=args.dry_run)
+        print(f"удалено задач: {stats['jobs_removed']}, превью: {stats['previews_removed']}, "
+              f"записей кэша: {stats['cache_removed']}, "
+              f"освобождено: {stats['bytes_freed'] / 2**20:.1f} МБ"
+              + (" (dry run)" if args.dry_run else ""), file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
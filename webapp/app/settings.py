@@ -0,0 +1,86 @@
+import os
+from pathlib import Path
+
+BASE_DIR    = Path(__file__).resolve().parent          # …/app
+UPLOAD_BASE = BASE_DIR / "static" / "uploads"          # …/static/uploads
+# служебные данные шлюза — вне static/: всё, что там лежит, отдаётся по /static
+DATA_DIR    = Path(os.getenv("GATEWAY_DATA_DIR", BASE_DIR.parent / "data"))   # …/webapp/data
+
+# очередь задач: SQLite-файл в DATA_DIR (в нём job_id всех задач, наружу
+# его отдавать нельзя)
+JOBS_DB        = Path(os.getenv("GATEWAY_JOBS_DB", DATA_DIR / "jobs.sqlite3"))
+# сколько задач шлюз обрабатывает одновременно
+JOB_WORKERS    = int(os.getenv("GATEWAY_JOB_WORKERS", "4"))
+# как часто воркер сам заглядывает в очередь, если его не разбудили (сек)
+JOB_POLL_EVERY = float(os.getenv("GATEWAY_JOB_POLL", "2"))
+
+# где выполняются стадии pipeline:
+#   http  — в микросервисах (по умолчанию; их можно разнести по машинам);
+#   local — в процессе шлюза, прямыми вызовами функций (microservices/pipeline.py):
+#           без сериализации и временных файлов, но модели грузятся в шлюз
+PIPELINE_MODE = os.getenv("GATEWAY_PIPELINE_MODE", "http")
+
+# как передавать PDF микросервисам:
+#   upload — multipart-загрузкой (сервисы на других машинах); сервис видит
+#            только временный файл, поэтому общий кэш растров страниц
+#            (KEEP_RASTERS ниже) не работает: каждая стадия рендерит сама;
+#   job    — только job_id: сервисы открывают static/uploads/<job_id>/<job_id>.pdf
+#            сами (один узел или общий том, см. SHARED_UPLOADS_DIR у сервисов),
+#            и растры, отрендеренные одной стадией, читают остальные.
+#            Так же и в PIPELINE_MODE=local
+PDF_TRANSFER = os.getenv("GATEWAY_PDF_TRANSFER", "upload")
+
+# формат обмена результатами стадий между шлюзом и сервисами:
+#   json    — совместимо с любым клиентом (по умолчанию);
+#   msgpack — компактнее и быстрее разбирается на больших документах
+PIPELINE_FORMAT      = os.getenv("GATEWAY_PIPELINE_FORMAT", "json")
+# сжатие тел запросов и ответов: identity | gzip | zstd
+PIPELINE_COMPRESSION = os.getenv("GATEWAY_PIPELINE_COMPRESSION", "identity")
+
+# постраничный режим: стадии передают друг другу страницы по мере готовности
+# (NDJSON), а браузер получает прогресс и ошибки первых листов по SSE
+PIPELINE_STREAMING = os.getenv("GATEWAY_STREAMING", "1") != "0"
+# сколько листов одновременно проверяет error_detector в этом режиме
+DETECT_CONCURRENCY = int(os.getenv("GATEWAY_DETECT_CONCURRENCY", "2"))
+
+# превью страниц: рендерятся по первому запросу и кэшируются в previews/
+# уровень масштаба → dpi (координаты ошибок при этом остаются в 400 dpi)
+PREVIEW_LEVELS  = {1: 72, 2: 150, 3: 300}
+PREVIEW_FORMAT  = os.getenv("GATEWAY_PREVIEW_FORMAT", "webp")     # webp | jpeg
+PREVIEW_QUALITY = int(os.getenv("GATEWAY_PREVIEW_QUALITY", "80"))
+PREVIEW_WORKERS = int(os.getenv("GATEWAY_PREVIEW_WORKERS", "2"))  # процессов рендера
+
+# растры страниц 400 dpi, общие для стадий задачи (<job_id>/rasters, см.
+# microservices/common/rasters.py) — только при PDF_TRANSFER=job или
+# PIPELINE_MODE=local. Это несжатые .npy, сотни МБ на лист: пока задача идёт,
+# они входят в квоту хранения (папка меряется по диску), а когда задача готова,
+# по умолчанию удаляются; с GATEWAY_KEEP_RASTERS=1 остаются для превью и
+# вытесняются вместе с ними (app/retention.py)
+KEEP_RASTERS = os.getenv("GATEWAY_KEEP_RASTERS", "0") == "1"
+
+# кэш результатов по SHA-256 PDF: повторная загрузка того же файла не гоняет pipeline.
+# Лежит в DATA_DIR, а не в static/: по sha256 документа иначе читались бы его
+# результаты без job_id
+CACHE_DIR     = Path(os.getenv("GATEWAY_CACHE_DIR", DATA_DIR / "cache"))
+CACHE_ENABLED = os.getenv("GATEWAY_CACHE", "1") != "0"
+# версии стадий: поднимите при смене модели/правил — старые записи перестанут
+# совпадать (удалить их: python -m app.cache purge --stale)
+STAGE_VERSIONS = {
+    "parse":   os.getenv("CACHE_VERSION_PARSE",   "1"),
+    "layout":  os.getenv("CACHE_VERSION_LAYOUT",  "1"),
+    "combine": os.getenv("CACHE_VERSION_COMBINE", "1"),
+    "errors":  os.getenv("CACHE_VERSION_ERRORS",  "1"),
+}
+
+# предел размера загружаемого PDF; больше — 413 ещё до чтения тела
+MAX_UPLOAD_BYTES = int(os.getenv("GATEWAY_MAX_UPLOAD_MB", "512")) * 1024 * 1024
+
+# хранение папок задач (см. app/retention.py): задачи, которые не открывали
+# дольше RETENTION_DAYS, удаляются; сверх квоты вытесняются давно не
+# открывавшиеся — сначала их превью, затем сами задачи. 0 — без ограничения.
+# По умолчанию оба выключены и ничего не удаляется; включить, например:
+#   GATEWAY_RETENTION_DAYS=30 GATEWAY_RETENTION_QUOTA_GB=200
+RETENTION_DAYS           = float(os.getenv("GATEWAY_RETENTION_DAYS", "0"))
+RETENTION_QUOTA_BYTES    = int(float(os.getenv("GATEWAY_RETENTION_QUOTA_GB", "0")) * 1024 ** 3)
+RETENTION_PREVIEWS_FIRST = os.getenv("GATEWAY_RETENTION_PREVIEWS_FIRST", "1") != "0"
+RETENTION_EVERY          = float(os.getenv("GATEWAY_RETENTION_EVERY", "3600"))    # сек между проходами
@@ -0,0 +1,180 @@
+"""
+Фильтры боксов пост-обработки layout_analyzer против прежних попарных
+циклов Python (они здесь — эталон, reference_*): матрицы NumPy в nms и
+drop_*, сетка кандидатов в merge_plain_text.
+
+    python -m benchmarks.boxes                     # 100, 300 и 1000 объектов на лист
+    python -m benchmarks.boxes --objects 500 --repeats 10
+
+Детекции — как у двух моделей на плотном листе A1 при conf=0.05: каждый
+объект с парой сдвинутых дублей низкой уверенности, текст, чертежи и
+таблицы вперемешку (boxes ≈ 3 × objects). Каждый фильтр получает тот же
+вход, что в postprocess: nms — сырые детекции, остальные — выход nms.
+Результаты обеих реализаций сравниваются поэлементно; расхождение — код 1.
+"""
+import sys
+import copy
+import time
+import random
+import argparse
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parent.parent / "microservices"))
+
+from benchmarks.synth import A1, PX
+from layout_analyzer import postprocess as pp
+from layout_analyzer.postprocess import iou
+
+
+# ── эталон: реализация до перехода на матрицы ────────────────────────────────
+
+def reference_nms(items, iou_thr=0.9):
+    items = sorted(items, key=lambda x: x['conf'], reverse=True)
+    keep = []
+    for it in items:
+        if all(iou(it['bbox'], k['bbox']) < iou_thr for k in keep):
+            keep.append(it)
+    return keep
+
+
+def _touches(outer, b):
+    return (iou(outer, b) > 0
+            or (b[0] >= outer[0] and b[1] >= outer[1] and b[2] <= outer[2] and b[3] <= outer[3]))
+
+
+def reference_drop_noisy_tables(items, max_overlaps=2):
+    tables = [it for it in items if it['class'] == 'table']
+    others = [it for it in items if it['class'] != 'table']
+    kept = [t for t in tables if sum(1 for o in others if _touches(t['bbox'], o['bbox'])) <= max_overlaps]
+    return kept + others
+
+
+def reference_drop_nested_tables(items):
+    tables = [it for it in items if it['class'] == 'table']
+    others = [it for it in items if it['class'] != 'table']
+    kept = []
+    for tbl in tables:
+        x1, y1, x2, y2 = tbl['bbox']
+        if not any(o['bbox'][0] <= x1 and o['bbox'][1] <= y1 and o['bbox'][2] >= x2 and o['bbox'][3] >= y2
+                   for o in others):
+            kept.append(tbl)
+    return kept + others
+
+
+def reference_merge_plain_text(items, gap_thr=7):
+    texts = [it for it in items if it['class'] == 'text']
+    others = [it for it in items if it['class'] != 'text']
+    n = len(texts)
+    adj = [[] for _ in range(n)]
+    for i in range(n):
+        for j in range(i + 1, n):
+            if pp.touching(texts[i]['bbox'], texts[j]['bbox'], gap_thr):
+                adj[i].append(j)
+                adj[j].append(i)
+    seen, merged = [False] * n, []
+    for i in range(n):
+        if seen[i]:
+            continue
+        stack, group = [i], []
+        while stack:
+            u = stack.pop()
+            if seen[u]:
+                continue
+            seen[u] = True
+            group.append(u)
+            stack += [v for v in adj[u] if not seen[v]]
+        xs = [texts[k]['bbox'][0] for k in group] + [texts[k]['bbox'][2] for k in group]
+        ys = [texts[k]['bbox'][1] for k in group] + [texts[k]['bbox'][3] for k in group]
+        merged.append({'bbox': [min(xs), min(ys), max(xs), max(ys)],
+                       'conf': sum(texts[k]['conf'] for k in group) / len(group),
+                       'class': 'text', 'subtype': 'plain_text'})
+    return merged + others
+
+
+def reference_drop_drawings_with_text(items, min_texts=2):
+    drawings = [it for it in items if it['class'] == 'drawing']
+    others   = [it for it in items if it['class'] != 'drawing']
+    texts    = [it for it in items if it['class'] == 'text' and it['subtype'] == 'plain_text']
+    kept = [d for d in drawings if sum(1 for t in texts if _touches(d['bbox'], t['bbox'])) < min_texts]
+    return kept + others
+
+
+FILTERS = {
+    "nms":                     (reference_nms, pp.nms),
+    "drop_noisy_tables":       (reference_drop_noisy_tables, pp.drop_noisy_tables),
+    "drop_nested_tables":      (reference_drop_nested_tables, pp.drop_nested_tables),
+    "merge_plain_text":        (reference_merge_plain_text, pp.merge_plain_text),
+    "drop_drawings_with_text": (reference_drop_drawings_with_text, pp.drop_drawings_with_text),
+}
+
+
+# ── детекции ─────────────────────────────────────────────────────────────────
+
+def detections(objects: int, rng: random.Random) -> list:
+    w, h = A1[0] * PX, A1[1] * PX
+    kinds = [("text", "plain_text")] * 14 + [("drawing", "section")] * 4 + [("table", "specification")] * 2
+    items = []
+    for _ in range(objects):
+        cls, subtype = rng.choice(kinds)
+        bw = rng.uniform(200, 2500) if cls != "text" else rng.uniform(150, 1500)
+        bh = rng.uniform(200, 2000) if cls != "text" else rng.uniform(40, 120)
+        x1, y1 = rng.uniform(0, w - bw), rng.uniform(0, h - bh)
+        items.append({"bbox": [x1, y1, x1 + bw, y1 + bh], "conf": rng.uniform(0.3, 0.95),
+                      "class": cls, "subtype": subtype})
+        for _ in range(2):                        # дубли низкой уверенности
+            d = rng.uniform(-6, 6)
+            items.append({"bbox": [x1 + d, y1 + d, x1 + bw + d, y1 + bh + d],
+                          "conf": rng.uniform(0.05, 0.3), "class": cls, "subtype": subtype})
+    return items
+
+
+# ── замер ────────────────────────────────────────────────────────────────────
+
+def best_time(fn, items, repeats: int) -> tuple:
+    """(минимум времени, результат) repeats прогонов fn на копиях items."""
+    best, out = float("inf"), None
+    for _ in range(repeats):
+        batch = copy.deepcopy(items)
+        t0 = time.perf_counter()
+        out = fn(batch)
+        best = min(best, time.perf_counter() - t0)
+    return best, out
+
+
+def run(objects: int, repeats: int, seed: int = 0) -> dict:
+    raw = detections(objects, random.Random(seed))
+    after_nms = reference_nms(copy.deepcopy(raw))
+    report = {"boxes": len(raw), "after_nms": len(after_nms)}
+    for name, (ref, new) in FILTERS.items():
+        items = raw if name == "nms" else after_nms
+        ref_s, ref_out = best_time(ref, items, repeats)
+        new_s, new_out = best_time(new, items, repeats)
+        report[name] = {"before_ms": round(ref_s * 1000, 3), "after_ms": round(new_s * 1000, 3),
+                        "speedup": round(ref_s / new_s, 1) if new_s else None,
+                        "same": ref_out == new_out}
+    return report
+
+
+def main(argv=None) -> None:
+    ap = argparse.ArgumentParser(prog="python -m benchmarks.boxes",
+                                 description="Фильтры боксов: новая реализация против циклов Python")
+    ap.add_argument("--objects", nargs="+", type=int, default=[100, 300, 1000],
+                    help="объектов на лист (боксов втрое больше)")
+    ap.add_argument("--repeats", type=int, default=5)
+    args = ap.parse_args(argv)
+
+    differ = False
+    for objects in args.objects:
+        r = run(objects, args.repeats)
+        print(f"{r['boxes']} боксов, после nms {r['after_nms']}", file=sys.stderr)
+        for name in FILTERS:
+            f = r[name]
+            differ |= not f["same"]
+            print(f"  {name:24} было {f['before_ms']:10.2f} мс  стало {f['after_ms']:8.2f} мс  "
+                  f"×{f['speedup']:<7} {'совпадает' if f['same'] else 'РАСХОДИТСЯ'}", file=sys.stderr)
+    if differ:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,158 @@
+"""
+Сравнение движков извлечения текста pdf_parser: pdfminer и pdfium.
+
+    python -m benchmarks.engines                         # синтетические PDF (benchmarks/synth.py)
+    python -m benchmarks.engines проекты/ a.pdf --out engines.json
+
+Для каждого документа:
+  время     — минимум из --repeats прогонов каждого движка, страниц в секунду;
+  блоки     — текстовые блоки pdfium сопоставляются блокам pdfminer по IoU
+              (жадно, от лучших пар, пара — при IoU ≥ --iou): доля совпавших
+              блоков pdfminer (recall) и pdfium (precision), средний IoU пар;
+  текст     — сходство текста пар (difflib, пробелы схлопнуты) и F1 по словам
+              страницы целиком: не зависит от того, как текст разбит на блоки.
+"""
+import re
+import sys
+import json
+import time
+import difflib
+import argparse
+import tempfile
+from collections import Counter
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parent.parent / "microservices"))
+
+from benchmarks import synth
+
+ENGINES = ("pdfminer", "pdfium")
+WORD    = re.compile(r"\w+")
+
+
+# ── сопоставление ────────────────────────────────────────────────────────────
+
+def iou(a: list, b: list) -> float:
+    ix = max(0.0, min(a[2], b[2]) - max(a[0], b[0]))
+    iy = max(0.0, min(a[3], b[3]) - max(a[1], b[1]))
+    inter = ix * iy
+    union = (a[2] - a[0]) * (a[3] - a[1]) + (b[2] - b[0]) * (b[3] - b[1]) - inter
+    return inter / union if union > 0 else 0.0
+
+
+def _texts(page: dict) -> list:
+    return [o for o in page["objects"] if o.get("type") == "text"]
+
+
+def match(ref: list, other: list, threshold: float) -> list:
+    """Пары (блок ref, блок other, IoU) — жадно от самых похожих, без повторов."""
+    candidates = sorted(((iou(a["bbox"], b["bbox"]), i, j)
+                         for i, a in enumerate(ref) for j, b in enumerate(other)), reverse=True)
+    used_ref, used_other, pairs = set(), set(), []
+    for score, i, j in candidates:
+        if score < threshold:
+            break
+        if i in used_ref or j in used_other:
+            continue
+        used_ref.add(i)
+        used_other.add(j)
+        pairs.append((ref[i], other[j], score))
+    return pairs
+
+
+def _norm(text: str) -> str:
+    return " ".join(text.split())
+
+
+def word_f1(ref: str, other: str) -> float:
+    a, b = Counter(WORD.findall(ref.lower())), Counter(WORD.findall(other.lower()))
+    common = sum((a & b).values())
+    if not a and not b:
+        return 1.0
+    return 2 * common / (sum(a.values()) + sum(b.values()))
+
+
+def agreement(ref: dict, other: dict, threshold: float) -> dict:
+    """Насколько результат other (pdfium) совпадает с ref (pdfminer)."""
+    n_ref = n_other = 0
+    pairs, f1 = [], []
+    for pr, po in zip(ref["pages"], other["pages"]):
+        tr, to = _texts(pr), _texts(po)
+        n_ref, n_other = n_ref + len(tr), n_other + len(to)
+        pairs += match(tr, to, threshold)
+        f1.append(word_f1(" ".join(o["text"] for o in tr), " ".join(o["text"] for o in to)))
+    return {
+        "blocks_pdfminer": n_ref,
+        "blocks_pdfium":   n_other,
+        "recall":          round(len(pairs) / n_ref, 3) if n_ref else None,
+        "precision":       round(len(pairs) / n_other, 3) if n_other else None,
+        "mean_iou":        round(sum(p[2] for p in pairs) / len(pairs), 3) if pairs else None,
+        "text_similarity": round(sum(difflib.SequenceMatcher(None, _norm(a["text"]), _norm(b["text"])).ratio()
+                                     for a, b, _ in pairs) / len(pairs), 3) if pairs else None,
+        "word_f1":         round(sum(f1) / len(f1), 3) if f1 else None,
+    }
+
+
+# ── замер ────────────────────────────────────────────────────────────────────
+
+def run(pdf_path: Path, repeats: int, threshold: float) -> dict:
+    from pdf_parser.parser import parse_pdf
+
+    results, out = {}, {}
+    for engine in ENGINES:
+        times = []
+        for _ in range(repeats):
+            t0 = time.perf_counter()
+            results[engine] = parse_pdf(str(pdf_path), workers=1, engine=engine)
+            times.append(time.perf_counter() - t0)
+        pages = len(results[engine]["pages"])
+        out[engine] = {"seconds": round(min(times), 4),
+                       "pages_per_s": round(pages / min(times), 2) if min(times) else None}
+    out["pages"]     = len(results["pdfminer"]["pages"])
+    out["speedup"]   = round(out["pdfminer"]["seconds"] / out["pdfium"]["seconds"], 1)
+    out["agreement"] = agreement(results["pdfminer"], results["pdfium"], threshold)
+    return out
+
+
+def _fmt(name: str, r: dict) -> str:
+    a = r["agreement"]
+    return (f"{name[:32]:32} {r['pages']:4} стр  pdfminer {r['pdfminer']['pages_per_s']:8.2f} стр/с  "
+            f"pdfium {r['pdfium']['pages_per_s']:8.2f} стр/с  ×{r['speedup']:<6} "
+            f"recall {a['recall']}  precision {a['precision']}  IoU {a['mean_iou']}  "
+            f"текст {a['text_similarity']}  слова F1 {a['word_f1']}")
+
+
+def main(argv=None) -> None:
+    ap = argparse.ArgumentParser(prog="python -m benchmarks.engines",
+                                 description="Скорость и согласие движков pdfminer и pdfium")
+    ap.add_argument("inputs", nargs="*", type=Path,
+                    help="PDF или папки (по умолчанию — синтетические документы)")
+    ap.add_argument("--pages", type=int, default=5, help="страниц в синтетических документах")
+    ap.add_argument("--repeats", type=int, default=3)
+    ap.add_argument("--iou", type=float, default=0.5, help="порог IoU для пары блоков")
+    ap.add_argument("--out", type=Path, help="куда записать результаты (JSON)")
+    args = ap.parse_args(argv)
+
+    report = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        if args.inputs:
+            pdfs = []
+            for p in args.inputs:
+                pdfs += sorted(p.rglob("*.pdf")) if p.is_dir() else [p]
+        else:
+            pdfs = []
+            for kind in synth.KINDS:
+                pdf_path = Path(tmp) / f"{kind}.pdf"
+                pdf_path.write_bytes(synth.generate(kind, args.pages)[0])
+                pdfs.append(pdf_path)
+
+        for pdf_path in pdfs:
+            report[str(pdf_path)] = r = run(pdf_path, args.repeats, args.iou)
+            print(_fmt(pdf_path.name, r), file=sys.stderr)
+
+    if args.out:
+        args.out.write_text(json.dumps(report, ensure_ascii=False, indent=2), encoding="utf-8")
+
+
+if __name__ == "__main__":
+    main()
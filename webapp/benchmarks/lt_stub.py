@@ -0,0 +1,90 @@
+"""
+Заглушка LanguageTool для замеров: POST /v2/check с тем же форматом ответа,
+что у api.languagetool.org, но без сети и ограничений на частоту запросов.
+Ошибкой считается каждое слово, хеш которого делится на RATE, — результат
+детерминирован, а задержка ответа задаётся явно.
+
+    python -m benchmarks.lt_stub --port 8081 --delay-ms 30
+    LT_URL=http://127.0.0.1:8081/v2/check uvicorn app:app --port 8012
+"""
+import re
+import json
+import time
+import zlib
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
+
+RATE = 17                      # примерно каждое семнадцатое слово — «ошибка»
+WORD = re.compile(r"\w+")
+
+
+def check(text: str) -> list:
+    matches = []
+    for m in WORD.finditer(text):
+        word = m.group()
+        if len(word) < 3 or zlib.crc32(word.encode("utf-8")) % RATE:
+            continue
+        matches.append({
+            "message":      "Возможно найдена орфографическая ошибка.",
+            "shortMessage": "Орфографическая ошибка",
+            "offset":       m.start(),
+            "length":       len(word),
+            "replacements": [{"value": word[::-1]}, {"value": word.upper()}],
+            "context":      {"text": text[max(0, m.start() - 20): m.end() + 20],
+                             "offset": min(20, m.start()), "length": len(word)},
+            "rule": {
+                "id":        "MORFOLOGIK_RULE_RU_RU",
+                "issueType": "misspelling",
+                "category":  {"id": "TYPOS", "name": "Орфография"},
+            },
+        })
+    return matches
+
+
+def make_handler(delay: float):
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            if self.path.rstrip("/") != "/v2/check":
+                self.send_error(404)
+                return
+            body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            text = parse_qs(body.decode("utf-8")).get("text", [""])[0]
+            if delay:
+                time.sleep(delay)
+            raw = json.dumps({"matches": check(text)}, ensure_ascii=False).encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(raw)))
+            self.end_headers()
+            self.wfile.write(raw)
+
+        def log_message(self, *args):
+            pass
+
+    return Handler
+
+
+def serve(port: int = 0, delay: float = 0.0) -> tuple:
+    """Запускает заглушку в фоновом потоке; возвращает (сервер, LT_URL)."""
+    server = ThreadingHTTPServer(("127.0.0.1", port), make_handler(delay))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}/v2/check"
+
+
+def main(argv=None) -> None:
+    ap = argparse.ArgumentParser(prog="python -m benchmarks.lt_stub",
+                                 description="Заглушка LanguageTool")
+    ap.add_argument("--port", type=int, default=8081)
+    ap.add_argument("--delay-ms", type=float, default=0, help="задержка каждого ответа")
+    args = ap.parse_args(argv)
+
+    server = ThreadingHTTPServer(("127.0.0.1", args.port), make_handler(args.delay_ms / 1000))
+    print(f"LT_URL=http://127.0.0.1:{args.port}/v2/check")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
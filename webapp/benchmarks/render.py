@@ -0,0 +1,130 @@
+"""
+Рендер страниц для layout_analyzer: 400 dpi (LAYOUT_RENDER=full, по умолчанию)
+против рендера сразу в размер входа детектора (LAYOUT_RENDER=detector).
+
+    python -m benchmarks.render                          # синтетические PDF (benchmarks/synth.py)
+    python -m benchmarks.render проекты/ a.pdf --long-side 1024
+
+Для каждого документа — среднее на страницу: время рендера (минимум из
+--repeats прогонов) и размер растра в МБ при 400 dpi и при dpi, где длинная
+сторона страницы равна --long-side (наибольший imgsz детекторов).
+
+И насколько различается то, что видит детектор. В режиме full растр 400 dpi
+уменьшается до входа модели в LetterBox (cv2.resize, INTER_LINEAR: два
+соседних пикселя по оси, без сглаживания) — здесь то же на NumPy; в режиме
+detector pdfium сразу рисует страницу в этот размер со сглаживанием. Оба
+входа сравниваются попиксельно: среднее отклонение (0–255), PSNR и доля
+«чернил» (пикселей темнее 128) — тонкие линии при уменьшении без
+сглаживания пропадают. Совпадение детекций по этим входам проверяет
+python -m layout_analyzer.render_check (нужны модели).
+"""
+import sys
+import json
+import time
+import argparse
+import tempfile
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parent.parent / "microservices"))
+
+import numpy as np
+
+from benchmarks import synth
+from common.rasters import RENDER_DPI, PageRasters
+
+
+def best_time(fn, repeats: int) -> tuple:
+    best, out = float("inf"), None
+    for _ in range(repeats):
+        t0 = time.perf_counter()
+        out = fn()
+        best = min(best, time.perf_counter() - t0)
+    return best, out
+
+
+def resize_linear(img: np.ndarray, size: tuple) -> np.ndarray:
+    """img в размер size = (ширина, высота), как cv2.resize(..., INTER_LINEAR)."""
+    def axis(n_out: int, n_in: int) -> tuple:
+        x = np.clip((np.arange(n_out) + 0.5) * (n_in / n_out) - 0.5, 0, n_in - 1)
+        i0 = np.floor(x).astype(np.intp)
+        return i0, np.minimum(i0 + 1, n_in - 1), (x - i0).astype(np.float32)
+
+    y0, y1, fy = axis(size[1], img.shape[0])
+    rows = img[y0] * (1 - fy)[:, None, None] + img[y1] * fy[:, None, None]
+    x0, x1, fx = axis(size[0], img.shape[1])
+    out = rows[:, x0] * (1 - fx)[None, :, None] + rows[:, x1] * fx[None, :, None]
+    return np.clip(np.rint(out), 0, 255).astype(np.uint8)
+
+
+def input_gap(full: np.ndarray, small: np.ndarray) -> dict:
+    """Вход детектора в режиме full (full, уменьшенный) против detector (small)."""
+    resized = resize_linear(full, (small.shape[1], small.shape[0]))
+    diff = np.abs(resized.astype(np.int16) - small.astype(np.int16))
+    mse = float(np.mean(diff.astype(np.float32) ** 2))
+    return {"mad":         float(diff.mean()),
+            "psnr_db":     10 * np.log10(255 ** 2 / mse) if mse else float("inf"),
+            "ink_full":    float((resized.min(axis=2) < 128).mean() * 100),
+            "ink_detector": float((small.min(axis=2) < 128).mean() * 100)}
+
+
+def run(pdf_path: Path, long_side: int, repeats: int) -> dict:
+    totals = {"full_s": 0.0, "full_mb": 0.0, "detector_s": 0.0, "detector_mb": 0.0,
+              "mad": 0.0, "psnr_db": 0.0, "ink_full": 0.0, "ink_detector": 0.0}
+    # PDF не из хранилища задач — кэш растров не участвует
+    with PageRasters(pdf_path, dpi=RENDER_DPI) as rasters:
+        pages = len(rasters)
+        for idx in range(pages):
+            imgs = {}
+            for mode, dpi in (("full", RENDER_DPI), ("detector", rasters.fit_dpi(idx, long_side))):
+                seconds, imgs[mode] = best_time(lambda: rasters.render(idx, dpi), repeats)
+                totals[f"{mode}_s"]  += seconds
+                totals[f"{mode}_mb"] += imgs[mode].nbytes / 2**20
+            for k, v in input_gap(imgs["full"], imgs["detector"]).items():
+                totals[k] += v
+            del imgs
+    out = {k: round(v / pages, 4 if k.endswith("_s") else 2) for k, v in totals.items()}
+    out["pages"]   = pages
+    out["speedup"] = round(totals["full_s"] / totals["detector_s"], 1) if totals["detector_s"] else None
+    out["saved_mb_per_page"] = round((totals["full_mb"] - totals["detector_mb"]) / pages, 2)
+    return out
+
+
+def main(argv=None) -> None:
+    ap = argparse.ArgumentParser(prog="python -m benchmarks.render",
+                                 description="Рендер 400 dpi против рендера в размер входа детектора")
+    ap.add_argument("inputs", nargs="*", type=Path,
+                    help="PDF или папки (по умолчанию — синтетические документы)")
+    ap.add_argument("--pages", type=int, default=3, help="страниц в синтетических документах")
+    ap.add_argument("--long-side", type=int, default=1024, help="длинная сторона входа детектора, px")
+    ap.add_argument("--repeats", type=int, default=3)
+    ap.add_argument("--out", type=Path, help="куда записать результаты (JSON)")
+    args = ap.parse_args(argv)
+
+    report = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        if args.inputs:
+            pdfs = []
+            for p in args.inputs:
+                pdfs += sorted(p.rglob("*.pdf")) if p.is_dir() else [p]
+        else:
+            pdfs = []
+            for kind in synth.KINDS:
+                pdf_path = Path(tmp) / f"{kind}.pdf"
+                pdf_path.write_bytes(synth.generate(kind, args.pages)[0])
+                pdfs.append(pdf_path)
+
+        for pdf_path in pdfs:
+            report[str(pdf_path)] = r = run(pdf_path, args.long_side, args.repeats)
+            print(f"{pdf_path.name[:32]:32} {r['pages']:4} стр  на страницу: "
+                  f"400 dpi {r['full_s'] * 1000:9.1f} мс {r['full_mb']:8.1f} МБ   "
+                  f"детектор {r['detector_s'] * 1000:7.1f} мс {r['detector_mb']:6.1f} МБ   "
+                  f"×{r['speedup']}  −{r['saved_mb_per_page']} МБ", file=sys.stderr)
+            print(f"{'':32}      вход детектора: отклонение {r['mad']:.2f}, PSNR {r['psnr_db']:.1f} дБ, "
+                  f"чернила {r['ink_full']:.2f}% (full) / {r['ink_detector']:.2f}% (detector)", file=sys.stderr)
+
+    if args.out:
+        args.out.write_text(json.dumps(report, ensure_ascii=False, indent=2), encoding="utf-8")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,255 @@
+"""
+Замеры стадий pipeline на синтетических PDF (benchmarks/synth.py) и
+сравнение с сохранённым базовым уровнем.
+
+    python -m benchmarks.run                     # замер, таблица в stderr
+    python -m benchmarks.run --save              # … и записать базовый уровень
+    python -m benchmarks.run --compare           # … и сравнить с ним (код 1 при регрессии)
+
+Для каждого вида документа (text, tables, scanned, sheet) по отдельности:
+  parse        — pdfminer (parse_pdf);
+  postprocess  — пост-обработка layout_analyzer на боксах, нарисованных
+                 генератором, с дублями и разбиением на строки, как у моделей;
+  combine      — combine_structure на той же разметке;
+  errors       — detect_errors против заглушки LanguageTool (benchmarks/lt_stub.py);
+  e2e          — весь pipeline в одном процессе (microservices/pipeline.py).
+Стадия, которой не хватает зависимостей (cv2, модели), помечается skipped.
+
+Записываются медиана и минимум времени, страниц в секунду и пик памяти
+Python (tracemalloc, отдельным прогоном). Базовый уровень свой для каждой
+машины: benchmarks/baselines/<hostname>.json.
+"""
+import os
+import sys
+import copy
+import json
+import time
+import random
+import socket
+import argparse
+import platform
+import resource
+import statistics
+import tempfile
+import tracemalloc
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parent.parent / "microservices"))
+
+from benchmarks import lt_stub, synth
+
+BASELINES = Path(__file__).resolve().parent / "baselines"
+STAGES    = ("parse", "postprocess", "combine", "errors", "e2e")
+
+# сравниваем минимум времени (он меньше всего зависит от соседей по машине);
+# разница меньше этих величин — шум, а не регрессия
+NOISE = {"min_seconds": 0.005, "peak_mb": 1.0}
+
+# чего не хватает стадии на этой машине: пакета (cv2, ultralytics) или весов модели
+MISSING = (ImportError, OSError)
+
+
+# ── входы стадий ─────────────────────────────────────────────────────────────
+
+def detections(layout_page: dict, rng: random.Random) -> list:
+    """
+    Сырые детекции в духе двух YOLO-моделей: каждый объект с уверенностью,
+    пара сдвинутых дублей (их снимает nms), текст — ещё и построчно
+    (его склеивает merge_plain_text).
+    """
+    items = []
+    for obj in layout_page["objects"]:
+        x1, y1, x2, y2 = obj["bbox"]
+        subtype = "table" if obj["class"] == "table" else obj["subtype"]
+        items.append({"bbox": [x1, y1, x2, y2], "conf": rng.uniform(0.5, 0.95),
+                      "class": obj["class"], "subtype": subtype})
+        for _ in range(2):
+            d = rng.uniform(-4, 4)
+            items.append({"bbox": [x1 + d, y1 + d, x2 + d, y2 + d], "conf": rng.uniform(0.05, 0.5),
+                          "class": obj["class"], "subtype": subtype})
+        if obj["class"] == "text":
+            step = 72
+            for y in range(int(y1), int(y2) - step, step):
+                items.append({"bbox": [x1, y, x2, y + step - 3], "conf": rng.uniform(0.1, 0.6),
+                              "class": "text", "subtype": "plain_text"})
+    return items
+
+
+def combined_from_parse(parsed: dict) -> list:
+    """
+    Вход error_detector без combine: текст pdfminer как plain_text в
+    координатах 400 dpi. Нужен, когда combine не может запуститься.
+    """
+    scale, pages, n = 400 / 72, [], 0
+    for pg in parsed["pages"]:
+        texts = []
+        for obj in pg["objects"]:
+            if obj.get("type") != "text":
+                continue
+            n += 1
+            x0, y0, x1, y1 = obj["bbox"]
+            texts.append({"id": f"x{n}", "bbox": [x0 * scale, y0 * scale, x1 * scale, y1 * scale],
+                          "text": obj["text"], "source": "pdfminer", "confidence": None})
+        pages.append({"page": pg["page_number"], "dpi": 400, "scale": scale,
+                      "tables": [], "plain_text": texts, "drawings": []})
+    return pages
+
+
+# ── замер ────────────────────────────────────────────────────────────────────
+
+def measure(fn, pages: int, repeats: int, prepare=None) -> dict:
+    """
+    Медиана и минимум repeats прогонов fn(*prepare()) и пик памяти Python
+    в отдельном прогоне (tracemalloc замедляет код, поэтому не вместе).
+    """
+    times = []
+    for _ in range(repeats):
+        args = prepare() if prepare else ()
+        t0 = time.perf_counter()
+        fn(*args)
+        times.append(time.perf_counter() - t0)
+
+    args = prepare() if prepare else ()
+    tracemalloc.start()
+    try:
+        fn(*args)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    median = statistics.median(times)
+    return {
+        "seconds":     round(median, 4),
+        "min_seconds": round(min(times), 4),
+        "pages_per_s": round(pages / median, 2) if median else None,
+        "peak_mb":     round(peak / 2**20, 1),
+    }
+
+
+def bench_kind(kind: str, pdf_path: Path, layout: dict, stages: tuple, repeats: int) -> dict:
+    from microservices import pipeline as local
+
+    pages, out = len(layout["pages"]), {}
+
+    def run(stage, fn, prepare=None):
+        if stage not in stages:
+            return
+        try:
+            out[f"{stage}/{kind}"] = measure(fn, pages, repeats, prepare)
+        except MISSING as e:
+            out[f"{stage}/{kind}"] = {"skipped": f"{type(e).__name__}: {e}"}
+        print(f"  {stage:12} {kind:8} {_fmt(out[f'{stage}/{kind}'])}", file=sys.stderr)
+
+    parsed = local.parse(pdf_path)
+    run("parse", lambda: local.parse(pdf_path))
+
+    from layout_analyzer.postprocess import postprocess
+    rng  = random.Random(kind)
+    raw  = [(detections(pg, rng), pg["width"], pg["height"]) for pg in layout["pages"]]
+    run("postprocess",
+        lambda batch: [postprocess(items, w, h) for items, w, h in batch],
+        lambda: (copy.deepcopy(raw),))
+
+    combined = None
+    try:
+        combined = local.combine(pdf_path, parsed, layout)
+    except MISSING:
+        pass
+    run("combine", lambda: local.combine(pdf_path, parsed, layout))
+
+    checked = combined if combined is not None else combined_from_parse(parsed)
+    run("errors", lambda: local.errors(checked))
+    run("e2e", lambda: local.run_pipeline(pdf_path))
+    return out
+
+
+def _fmt(r: dict) -> str:
+    if "skipped" in r:
+        return f"skipped: {r['skipped']}"
+    return (f"{r['seconds'] * 1000:9.1f} мс  {r['pages_per_s']:8.2f} стр/с  "
+            f"{r['peak_mb']:7.1f} МБ")
+
+
+# ── базовый уровень ──────────────────────────────────────────────────────────
+
+def compare(current: dict, baseline: dict, tolerance: float) -> list:
+    """Замеры, ставшие медленнее (или прожорливее) базового уровня больше чем на tolerance."""
+    worse = []
+    for key, cur in current["results"].items():
+        base = baseline["results"].get(key)
+        if not base or "skipped" in cur or "skipped" in base:
+            continue
+        for metric, noise in NOISE.items():
+            if (cur[metric] > base[metric] * (1 + tolerance)
+                    and cur[metric] - base[metric] > noise):
+                worse.append((key, metric, base[metric], cur[metric]))
+    return worse
+
+
+def main(argv=None) -> None:
+    ap = argparse.ArgumentParser(prog="python -m benchmarks.run",
+                                 description="Замеры стадий pipeline на синтетических PDF")
+    ap.add_argument("--kinds", nargs="+", default=list(synth.KINDS), choices=list(synth.KINDS))
+    ap.add_argument("--stages", nargs="+", default=list(STAGES), choices=list(STAGES))
+    ap.add_argument("--pages", type=int, default=5, help="страниц в каждом документе")
+    ap.add_argument("--repeats", type=int, default=3)
+    ap.add_argument("--lt-delay-ms", type=float, default=0, help="задержка заглушки LanguageTool")
+    ap.add_argument("--out", type=Path, help="куда записать результаты (JSON)")
+    ap.add_argument("--baseline", type=Path, default=BASELINES / f"{socket.gethostname()}.json")
+    ap.add_argument("--save", action="store_true", help="записать результаты как базовый уровень")
+    ap.add_argument("--compare", action="store_true", help="сравнить с базовым уровнем")
+    ap.add_argument("--tolerance", type=float, default=0.2, help="допустимое ухудшение (доля)")
+    args = ap.parse_args(argv)
+
+    # error_detector читает LT_URL при импорте — заглушка должна подняться раньше
+    server, lt_url = lt_stub.serve(delay=args.lt_delay_ms / 1000)
+    os.environ["LT_URL"] = lt_url
+
+    report = {
+        "meta": {
+            "host":        socket.gethostname(),
+            "python":      platform.python_version(),
+            "machine":     platform.machine(),
+            "cpus":        os.cpu_count(),
+            "pages":       args.pages,
+            "repeats":     args.repeats,
+            "lt_delay_ms": args.lt_delay_ms,
+            "date":        time.strftime("%Y-%m-%dT%H:%M:%S"),
+        },
+        "results": {},
+    }
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            for kind in args.kinds:
+                pdf, layout = synth.generate(kind, args.pages)
+                pdf_path = Path(tmp) / f"{kind}.pdf"
+                pdf_path.write_bytes(pdf)
+                report["results"].update(bench_kind(kind, pdf_path, layout,
+                                                    tuple(args.stages), args.repeats))
+    finally:
+        server.shutdown()
+    # пик RSS всего процесса: с моделями и буферами C-библиотек, которых не видит tracemalloc
+    report["meta"]["max_rss_mb"] = round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.out:
+        args.out.write_text(text, encoding="utf-8")
+    if args.save:
+        args.baseline.parent.mkdir(exist_ok=True)
+        args.baseline.write_text(text, encoding="utf-8")
+        print(f"базовый уровень: {args.baseline}", file=sys.stderr)
+    if args.compare:
+        try:
+            baseline = json.loads(args.baseline.read_text(encoding="utf-8"))
+        except FileNotFoundError:
+            sys.exit(f"нет базового уровня {args.baseline}; запустите с --save")
+        worse = compare(report, baseline, args.tolerance)
+        for key, metric, was, now in worse:
+            print(f"РЕГРЕССИЯ {key} {metric}: {was} → {now}", file=sys.stderr)
+        if worse:
+            sys.exit(1)
+        print("регрессий нет", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
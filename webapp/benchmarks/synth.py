@@ -0,0 +1,262 @@
+"""
+Синтетические PDF для замеров: текст, таблицы, скан без текстового слоя и
+большой лист чертежа. Файлы пишутся вручную (без reportlab/PyMuPDF), поэтому
+генератору нужны только numpy, Pillow и pypdfium2 (для «скана»).
+
+Шрифт не встраивается: текст рисуется тем, чем pdfium подменяет его из
+системных шрифтов. В контейнере без шрифтов (нет fonts-dejavu и т.п.)
+страницы и «скан» рендерятся без букв — pdfminer текст при этом видит.
+
+Кроме PDF генератор отдаёт разметку, которую он сам нарисовал, в формате
+ответа layout_analyzer (пиксели 400 dpi) — ей кормятся замеры combine и
+пост-обработки, которым без моделей больше неоткуда взять вход.
+
+    python -m benchmarks.synth out/ [--pages 5]
+"""
+import io
+import sys
+import random
+import argparse
+import zlib
+from pathlib import Path
+
+# кириллица стандартным шрифтом без встраивания: байты cp1251 0xC0–0xFF
+# получают имена глифов Adobe (afii10017 = «А» …), которые понимают
+# и pdfminer, и pdfium; «Ё» и «ё» в cp1251 стоят отдельно (0xA8, 0xB8)
+_UPPER = [n for n in range(10017, 10050) if n != 10023]     # А…Я без Ё
+_LOWER = [n for n in range(10065, 10098) if n != 10071]     # а…я без ё
+
+WORDS = ("бетон арматура фундамент перекрытие нагрузка опалубка колонна ригель "
+         "плита стена отметка класс прочность марка морозостойкость ведомость "
+         "спецификация узел разрез фасад монтаж проект расчёт сечение шаг "
+         "защитный слой узел сопряжения монолитный сборный кладка").split()
+
+A4 = (595, 842)
+A1 = (2384, 1684)              # альбомный лист чертежа
+PX = 400 / 72                  # пункты → пиксели рендера layout_analyzer
+
+
+def _font_obj() -> bytes:
+    diffs = "192 " + " ".join(f"/afii{n}" for n in _UPPER + _LOWER) + " 168 /afii10023 184 /afii10071"
+    # не из стандартных 14 шрифтов: для них pdfminer берёт ширины из своих
+    # метрик, где кириллицы нет, и ставит все буквы строки в одну точку
+    widths = " ".join("278" if c == 32 else "556" for c in range(32, 256))
+    return (b"<< /Type /Font /Subtype /Type1 /BaseFont /SynthSans "
+            b"/FirstChar 32 /LastChar 255 /Widths [" + widths.encode() + b"] "
+            b"/FontDescriptor << /Type /FontDescriptor /FontName /SynthSans /Flags 32 "
+            b"/FontBBox [-665 -325 2000 1006] /ItalicAngle 0 /Ascent 905 /Descent -212 "
+            b"/CapHeight 716 /StemV 80 >> "
+            b"/Encoding << /Type /Encoding /BaseEncoding /WinAnsiEncoding "
+            b"/Differences [" + diffs.encode() + b"] >> >>")
+
+
+def _text(s: str) -> bytes:
+    raw = s.encode("cp1251", errors="replace")
+    return b"(" + raw.replace(b"\\", b"\\\\").replace(b"(", b"\\(").replace(b")", b"\\)") + b")"
+
+
+class _Page:
+    """Содержимое одной страницы и нарисованная на ней разметка."""
+
+    def __init__(self, size: tuple):
+        self.w, self.h = size
+        self.ops: list = []
+        self.objects: list = []        # разметка в формате layout_analyzer
+        self.image = None              # (jpeg, ширина, высота) для «скана»
+
+    def _box(self, x0, y0, x1, y1, cls, subtype):
+        # y у PDF снизу, у рендера — сверху
+        self.objects.append({"bbox": [round(x0 * PX, 2), round((self.h - y1) * PX, 2),
+                                      round(x1 * PX, 2), round((self.h - y0) * PX, 2)],
+                             "class": cls, "subtype": subtype})
+
+    def text(self, x, y, s, size=10):
+        self.ops.append(b"BT /F1 %d Tf %.2f %.2f Td " % (size, x, y) + _text(s) + b" Tj ET")
+
+    def line(self, x0, y0, x1, y1, width=0.5):
+        self.ops.append(b"%.2f w %.2f %.2f m %.2f %.2f l S" % (width, x0, y0, x1, y1))
+
+    def paragraph(self, rng, x, y, width, lines, size=10) -> float:
+        """Абзац из lines строк; возвращает y под ним."""
+        top = y + size
+        for _ in range(lines):
+            words, cur = [], 0
+            while cur < width / (size * 0.55):
+                w = rng.choice(WORDS)
+                words.append(w)
+                cur += len(w) + 1
+            self.text(x, y, " ".join(words)[: int(width / (size * 0.5))], size)
+            y -= size * 1.3
+        self._box(x, y + size * 1.3 - 2, x + width, top, "text", "plain_text")
+        return y - size
+
+    def table(self, rng, x, y, cols, rows, cw=70, rh=16, subtype="specification") -> float:
+        """Таблица-сетка с текстом в ячейках; возвращает y под ней."""
+        w, h = cols * cw, rows * rh
+        for r in range(rows + 1):
+            self.line(x, y - r * rh, x + w, y - r * rh)
+        for c in range(cols + 1):
+            self.line(x + c * cw, y, x + c * cw, y - h)
+        for r in range(rows):
+            for c in range(cols):
+                self.text(x + c * cw + 3, y - (r + 1) * rh + 4, rng.choice(WORDS)[:10], 8)
+        self._box(x, y - h, x + w, y, "table", subtype)
+        return y - h - 20
+
+    def frame(self):
+        """Рамка листа и штамп в правом нижнем углу, как у чертежей."""
+        self.line(20, 20, self.w - 20, 20, 1.5)
+        self.line(20, self.h - 20, self.w - 20, self.h - 20, 1.5)
+        self.line(20, 20, 20, self.h - 20, 1.5)
+        self.line(self.w - 20, 20, self.w - 20, self.h - 20, 1.5)
+
+
+# ── виды страниц ─────────────────────────────────────────────────────────────
+
+def text_page(rng) -> _Page:
+    p = _Page(A4)
+    p.frame()
+    y = p.h - 60
+    while y > 120:
+        y = p.paragraph(rng, 50, y, p.w - 100, rng.randint(3, 8))
+    return p
+
+
+def tables_page(rng) -> _Page:
+    p = _Page(A4)
+    p.frame()
+    y = p.h - 60
+    y = p.paragraph(rng, 50, y, p.w - 100, 2)
+    while y > 260:
+        y = p.table(rng, 50, y, rng.randint(4, 7), rng.randint(6, 12))
+    p.table(rng, p.w - 20 - 3 * 60, 20 + 5 * 12, 3, 5, cw=60, rh=12, subtype="stamp")
+    return p
+
+
+def sheet_page(rng) -> _Page:
+    """Лист A1: сетка осей, «чертёж» из линий, редкий текст, спецификация и штамп."""
+    p = _Page(A1)
+    p.frame()
+    for i in range(40):
+        x = 80 + i * 45
+        p.line(x, 120, x, p.h - 80, 0.3)
+    for i in range(30):
+        y = 120 + i * 48
+        p.line(80, y, 1900, y, 0.3)
+    for _ in range(300):
+        x, y = rng.uniform(100, 1850), rng.uniform(150, p.h - 100)
+        p.line(x, y, x + rng.uniform(-80, 80), y + rng.uniform(-80, 80), 0.8)
+    p.objects.append({"bbox": [80 * PX, 80 * PX, 1900 * PX, (p.h - 120) * PX],
+                      "class": "drawing", "subtype": "drawing"})
+    for _ in range(25):
+        p.text(rng.uniform(100, 1800), rng.uniform(150, p.h - 100), rng.choice(WORDS), 12)
+    y = p.table(rng, 1950, p.h - 60, 5, 30, cw=80, rh=18)
+    p.paragraph(rng, 1950, y, 400, 10)
+    p.table(rng, p.w - 20 - 5 * 70, 20 + 8 * 15, 5, 8, cw=70, rh=15, subtype="stamp")
+    return p
+
+
+def scanned_page(rng) -> _Page:
+    """Страница с текстом и таблицей, растеризованная в JPEG без текстового слоя."""
+    import numpy as np
+    import pypdfium2 as pdfium
+    from PIL import Image
+
+    src = text_page(rng) if rng.random() < 0.5 else tables_page(rng)
+    doc = pdfium.PdfDocument(io.BytesIO(build_pdf([src])))
+    try:
+        img = doc[0].render(scale=200 / 72).to_pil().convert("L")
+    finally:
+        doc.close()
+    # шум и лёгкий поворот, как у сканера
+    arr = np.asarray(img, dtype=np.int16)
+    noise = np.random.default_rng(rng.randint(0, 2**31)).normal(0, 12, arr.shape)
+    img = Image.fromarray(np.clip(arr + noise, 0, 255).astype("uint8"))
+    img = img.rotate(rng.uniform(-0.7, 0.7), fillcolor=255)
+    buf = io.BytesIO()
+    img.save(buf, "JPEG", quality=70)
+
+    p = _Page(A4)
+    p.image = (buf.getvalue(), img.width, img.height)
+    p.ops.append(b"q %d 0 0 %d 0 0 cm /Im1 Do Q" % (p.w, p.h))
+    p.objects = src.objects
+    return p
+
+
+KINDS = {
+    "text":    text_page,
+    "tables":  tables_page,
+    "scanned": scanned_page,
+    "sheet":   sheet_page,
+}
+
+
+# ── запись PDF ───────────────────────────────────────────────────────────────
+
+def build_pdf(pages: list) -> bytes:
+    objs: list = [None, None, _font_obj()]       # 1 — каталог, 2 — дерево страниц, 3 — шрифт
+    kids = []
+    for p in pages:
+        content = zlib.compress(b"\n".join(p.ops))
+        objs.append(b"<< /Length %d /Filter /FlateDecode >>\nstream\n" % len(content)
+                    + content + b"\nendstream")
+        content_id = len(objs)
+        xobj = b""
+        if p.image is not None:
+            jpeg, w, h = p.image
+            objs.append(b"<< /Type /XObject /Subtype /Image /Width %d /Height %d "
+                        b"/ColorSpace /DeviceGray /BitsPerComponent 8 /Filter /DCTDecode "
+                        b"/Length %d >>\nstream\n" % (w, h, len(jpeg)) + jpeg + b"\nendstream")
+            xobj = b" /XObject << /Im1 %d 0 R >>" % len(objs)
+        objs.append(b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 %d %d] "
+                    b"/Resources << /Font << /F1 3 0 R >>%s >> /Contents %d 0 R >>"
+                    % (p.w, p.h, xobj, content_id))
+        kids.append(len(objs))
+    objs[0] = b"<< /Type /Catalog /Pages 2 0 R >>"
+    objs[1] = (b"<< /Type /Pages /Count %d /Kids [" % len(kids)
+               + b" ".join(b"%d 0 R" % k for k in kids) + b"] >>")
+
+    out = io.BytesIO()
+    out.write(b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n")
+    offsets = []
+    for i, body in enumerate(objs, 1):
+        offsets.append(out.tell())
+        out.write(b"%d 0 obj\n" % i + body + b"\nendobj\n")
+    xref = out.tell()
+    out.write(b"xref\n0 %d\n0000000000 65535 f \n" % (len(objs) + 1))
+    for off in offsets:
+        out.write(b"%010d 00000 n \n" % off)
+    out.write(b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n"
+              % (len(objs) + 1, xref))
+    return out.getvalue()
+
+
+def generate(kind: str, pages: int = 5, seed: int = 0) -> tuple:
+    """(PDF, разметка {"pages": [...]} как у layout_analyzer) заданного вида."""
+    rng = random.Random(f"{kind}:{seed}")
+    made = [KINDS[kind](rng) for _ in range(pages)]
+    layout = {"pages": [{"page": n, "width": round(p.w * PX), "height": round(p.h * PX),
+                         "objects": p.objects} for n, p in enumerate(made, 1)]}
+    return build_pdf(made), layout
+
+
+def main(argv=None) -> None:
+    import json
+
+    ap = argparse.ArgumentParser(prog="python -m benchmarks.synth",
+                                 description="Синтетические PDF для замеров")
+    ap.add_argument("out", type=Path)
+    ap.add_argument("--pages", type=int, default=5)
+    ap.add_argument("--kinds", nargs="+", default=list(KINDS), choices=list(KINDS))
+    args = ap.parse_args(argv)
+
+    args.out.mkdir(parents=True, exist_ok=True)
+    for kind in args.kinds:
+        pdf, layout = generate(kind, args.pages)
+        (args.out / f"{kind}.pdf").write_bytes(pdf)
+        (args.out / f"{kind}.layout.json").write_text(json.dumps(layout), encoding="utf-8")
+        print(f"{kind}: {len(pdf) / 1024:.0f} КБ", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
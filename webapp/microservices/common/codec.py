@@ -0,0 +1,151 @@
+"""
+Форматы обмена между стадиями pipeline.
+
+JSON остаётся форматом по умолчанию; по заголовку Accept сервис может
+ответить msgpack, а по Accept-Encoding — сжать ответ zstd или gzip.
+Те же форматы понимаются и во входящих JSON-частях multipart
+(Content-Type части + её собственный Content-Encoding).
+"""
+import gzip
+import json
+from typing import Any, Optional
+
+from fastapi import Request, UploadFile
+from fastapi.responses import Response
+
+try:
+    import orjson                      # быстрый JSON, если установлен
+except ImportError:
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+JSON    = "application/json"
+MSGPACK = "application/msgpack"
+
+# принимаемые Content-Type → канонический
+MEDIA_TYPES = {
+    "application/json":      JSON,
+    "text/json":             JSON,
+    "application/msgpack":   MSGPACK,
+    "application/x-msgpack": MSGPACK,
+}
+
+# ответы меньше этого размера не сжимаем — не окупается
+MIN_COMPRESS_BYTES = 1024
+
+
+def available_formats() -> list:
+    return [JSON] + ([MSGPACK] if msgpack else [])
+
+
+def available_encodings() -> list:
+    return (["zstd"] if zstandard else []) + ["gzip"]
+
+
+# ── сериализация ─────────────────────────────────────────────────────────────
+def dumps(obj: Any, media_type: str = JSON) -> bytes:
+    if media_type == MSGPACK:
+        return msgpack.packb(obj, use_bin_type=True)
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, ensure_ascii=False).encode("utf-8")
+
+
+def loads(raw: bytes, media_type: str = JSON) -> Any:
+    if media_type == MSGPACK:
+        if msgpack is None:
+            raise ValueError("msgpack не установлен")
+        return msgpack.unpackb(raw, raw=False)
+    if orjson is not None:
+        return orjson.loads(raw)
+    return json.loads(raw)
+
+
+def compress(raw: bytes, encoding: Optional[str]) -> bytes:
+    if encoding == "zstd":
+        return zstandard.ZstdCompressor(level=3).compress(raw)
+    if encoding == "gzip":
+        return gzip.compress(raw, compresslevel=5)
+    return raw
+
+
+def decompress(raw: bytes, encoding: Optional[str]) -> bytes:
+    if not encoding or encoding == "identity":
+        return raw
+    if encoding == "zstd":
+        if zstandard is None:
+            raise ValueError("zstandard не установлен")
+        return zstandard.ZstdDecompressor().decompressobj().decompress(raw)
+    if encoding == "gzip":
+        return gzip.decompress(raw)
+    raise ValueError(f"Неизвестное сжатие: {encoding}")
+
+
+# ── согласование ─────────────────────────────────────────────────────────────
+def _preferences(header: str) -> list:
+    """Значения заголовка Accept/Accept-Encoding по убыванию q."""
+    prefs = []
+    for n, item in enumerate(header.split(",")):
+        value, _, params = item.strip().partition(";")
+        q = 1.0
+        for p in params.split(";"):
+            k, _, v = p.strip().partition("=")
+            if k == "q":
+                try:
+                    q = float(v)
+                except ValueError:
+                    q = 0.0
+        if value and q > 0:
+            prefs.append((-q, n, value.strip().lower()))
+    return [v for _, _, v in sorted(prefs)]
+
+
+def negotiate(accept: str, accept_encoding: str) -> tuple:
+    """(media_type, encoding) ответа; без явного запроса — несжатый JSON."""
+    media_type = JSON
+    for value in _preferences(accept or ""):
+        if MEDIA_TYPES.get(value) in available_formats():
+            media_type = MEDIA_TYPES[value]
+            break
+        if value in ("*/*", "application/*"):
+            break
+
+    encoding = None
+    for value in _preferences(accept_encoding or ""):
+        if value in available_encodings():
+            encoding = value
+            break
+    return media_type, encoding
+
+
+def encode_response(obj: Any, request: Request, status_code: int = 200) -> Response:
+    """Ответ в формате и сжатии, которые запросил клиент."""
+    media_type, encoding = negotiate(request.headers.get("accept", ""),
+                                     request.headers.get("accept-encoding", ""))
+    body = dumps(obj, media_type)
+    headers = {"Vary": "Accept, Accept-Encoding"}
+    if encoding and len(body) >= MIN_COMPRESS_BYTES:
+        body = compress(body, encoding)
+        headers["Content-Encoding"] = encoding
+    return Response(content=body, status_code=status_code,
+                    media_type=media_type, headers=headers)
+
+
+async def read_part(part: UploadFile) -> Any:
+    """
+    Разбирает JSON/msgpack-часть multipart с учётом её Content-Encoding;
+    часть без известного Content-Type читается как JSON, как и раньше.
+    """
+    media_type = MEDIA_TYPES.get((part.content_type or "").split(";")[0].strip(), JSON)
+    raw = await part.read()
+    raw = decompress(raw, part.headers.get("content-encoding"))
+    return loads(raw, media_type)
@@ -0,0 +1,207 @@
+"""
+Сквозной идентификатор запроса (trace id) и метрики Prometheus — общие
+для шлюза и сервисов.
+
+Шлюз выдаёт trace id при загрузке PDF (upload_and_process), хранит его
+в задаче и передаёт каждому сервису заголовком X-Trace-Id. Сервис берёт
+его из заголовка (или заводит свой), возвращает в ответе и по окончании
+запроса пишет в лог итог со временем внутренних фаз:
+
+    trace=3f2a… POST /analyze 200 12.41 с  render=1.20 inference=10.02 rasters_miss=3
+
+Фазы отмечаются в коде стадий — блоком или декоратором:
+
+    with timed("inference"):
+        res = model.predict(img)
+
+Метрики (GET /metrics, текстовый формат Prometheus, см. install):
+  dp_phase_seconds{service, phase}                  — время фаз;
+  dp_cache_total{service, cache, result}            — попадания (hit) и промахи (miss) кэшей;
+  dp_request_seconds{service, method, path, status} — время HTTP-запросов.
+"""
+import re
+import time
+import uuid
+import logging
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar, copy_context
+from typing import Callable, Iterable, Iterator, Optional
+
+from fastapi.responses import Response
+from prometheus_client import CONTENT_TYPE_LATEST, Counter, Histogram, generate_latest
+
+log = logging.getLogger("dp.trace")
+
+TRACE_HEADER = "X-Trace-Id"
+# чужой trace id принимаем, только если он похож на идентификатор (он попадает в логи)
+TRACE_RE     = re.compile(r"[0-9A-Za-z_.-]{1,64}")
+
+# от миллисекунд (кэш, пост-обработка) до минут (OCR листа A0, LanguageTool)
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+
+PHASE_SECONDS = Histogram("dp_phase_seconds", "Время внутренних фаз обработки",
+                          ["service", "phase"], buckets=BUCKETS)
+CACHE_TOTAL = Counter("dp_cache_total", "Обращения к кэшам",
+                      ["service", "cache", "result"])
+REQUEST_SECONDS = Histogram("dp_request_seconds", "Время HTTP-запросов",
+                            ["service", "method", "path", "status"], buckets=BUCKETS)
+
+# имя процесса в метках; install() заменяет его именем сервиса
+_service = "local"
+
+_trace  = ContextVar("trace_id", default=None)
+# фаза → секунды (и кэш → число обращений) текущего запроса или задачи;
+# словарь общий для потоков, в которые передан контекст, отсюда замок
+_phases = ContextVar("phases", default=None)
+_lock   = threading.Lock()
+
+
+# ── контекст запроса ─────────────────────────────────────────────────────────
+
+def new_trace_id() -> str:
+    return uuid.uuid4().hex
+
+
+def trace_id() -> Optional[str]:
+    """trace id текущего запроса или задачи (None — вне их)."""
+    return _trace.get()
+
+
+@contextmanager
+def trace(trace_id: Optional[str] = None) -> Iterator[str]:
+    """
+    Выполняет блок от имени trace_id (новый, если не задан или не похож
+    на идентификатор): его видят timed(), summary() и исходящие запросы
+    шлюза, в том числе из потоков asyncio.to_thread.
+    """
+    if not trace_id or not TRACE_RE.fullmatch(trace_id):
+        trace_id = new_trace_id()
+    tokens = _trace.set(trace_id), _phases.set({})
+    try:
+        yield trace_id
+    finally:
+        _phases.reset(tokens[1])
+        _trace.reset(tokens[0])
+
+
+def in_context(fn: Callable) -> Callable:
+    """
+    fn для ThreadPoolExecutor: выполняется в контексте вызывающего потока
+    (trace id, учёт фаз), которого потоки пула сами не наследуют.
+    """
+    ctx = copy_context()
+    return lambda *args, **kwargs: ctx.copy().run(fn, *args, **kwargs)
+
+
+def _account(key: str, value) -> None:
+    phases = _phases.get()
+    if phases is not None:
+        with _lock:
+            phases[key] = phases.get(key, 0) + value
+
+
+def summary() -> str:
+    """Фазы текущего запроса одной строкой: «render=1.20 inference=10.02 rasters_hit=3»."""
+    phases = _phases.get() or {}
+    with _lock:
+        items = list(phases.items())
+    return " ".join(f"{k}={v:.2f}" if isinstance(v, float) else f"{k}={v}" for k, v in items)
+
+
+# ── фазы и кэши ──────────────────────────────────────────────────────────────
+
+def observe(phase: str, seconds: float) -> None:
+    PHASE_SECONDS.labels(_service, phase).observe(seconds)
+    _account(phase, seconds)
+
+
+@contextmanager
+def timed(phase: str) -> Iterator[None]:
+    """Время блока (или вызова, если это декоратор) как фаза phase."""
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(phase, time.perf_counter() - t0)
+
+
+def timed_iter(items: Iterable, phase: str) -> Iterator:
+    """
+    Элементы items; время получения каждого (для ленивых генераторов —
+    сама работа над страницей) учитывается как фаза phase.
+    """
+    it = iter(items)
+    while True:
+        t0 = time.perf_counter()
+        try:
+            item = next(it)
+        except StopIteration:
+            return
+        observe(phase, time.perf_counter() - t0)
+        yield item
+
+
+def tally(key: str, value: float) -> None:
+    """Добавляет value к величине key в итоге запроса (summary), без метрики Prometheus."""
+    _account(key, value)
+
+
+def cache_result(cache: str, hit: bool) -> None:
+    result = "hit" if hit else "miss"
+    CACHE_TOTAL.labels(_service, cache, result).inc()
+    _account(f"{cache}_{result}", 1)
+
+
+# ── HTTP ─────────────────────────────────────────────────────────────────────
+
+class TraceRequests:
+    """
+    ASGI-middleware: trace id запроса (из X-Trace-Id или новый) — в контекст
+    и в заголовок ответа. Когда ответ отдан целиком (NDJSON — после последней
+    строки), время запроса уходит в dp_request_seconds, а итог с фазами — в лог.
+    """
+
+    def __init__(self, app, service: str):
+        self.app = app
+        self.service = service
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        incoming = dict(scope["headers"]).get(TRACE_HEADER.lower().encode())
+        status = 500
+        t0 = time.perf_counter()
+
+        with trace(incoming.decode("latin-1") if incoming else None) as trace_id:
+            async def traced_send(message):
+                nonlocal status
+                if message["type"] == "http.response.start":
+                    status = message["status"]
+                    message["headers"] = [*message.get("headers", []),
+                                          (TRACE_HEADER.lower().encode(), trace_id.encode())]
+                await send(message)
+
+            try:
+                await self.app(scope, receive, traced_send)
+            finally:
+                seconds = time.perf_counter() - t0
+                # шаблон маршрута, а не сам путь: job_id в метках не нужны
+                path = getattr(scope.get("route"), "path", "<unmatched>")
+                REQUEST_SECONDS.labels(self.service, scope["method"], path, str(status)).observe(seconds)
+                # запросы без фаз (опрос статуса, /metrics) — только в debug
+                phases = summary()
+                log.log(logging.INFO if phases else logging.DEBUG, "trace=%s %s %s %d %.2f с  %s",
+                        trace_id, scope["method"], scope["path"], status, seconds, phases)
+
+
+def install(app, service: str) -> None:
+    """Подключает к приложению FastAPI trace id, учёт запросов и GET /metrics."""
+    global _service
+    _service = service
+    app.add_middleware(TraceRequests, service=service)
+
+    @app.get("/metrics", include_in_schema=False)
+    def metrics() -> Response:
+        return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
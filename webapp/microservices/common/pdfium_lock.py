@@ -0,0 +1,12 @@
+"""
+Один замок на все вызовы pdfium в процессе.
+
+pdfium (pypdfium2) не потокобезопасен: одновременные вызовы из разных
+потоков портят его глобальное состояние, даже если документы разные.
+Поэтому всё, что открывает, читает, рендерит или закрывает документ из
+потока, делает это под pdfium_lock — по одной операции, не удерживая
+замок между шагами генераторов.
+"""
+import threading
+
+pdfium_lock = threading.RLock()
@@ -0,0 +1,143 @@
+"""
+Растры страниц, общие для стадий одной задачи.
+
+Страница рендерится pypdfium2 один раз и сохраняется в папке задачи
+(<job_dir>/rasters/page_<n>_<dpi>dpi.npy, BGR uint8 как у OpenCV).
+Следующие читатели — layout_analyzer, layout_combiner, превью шлюза —
+открывают файл через np.load(mmap_mode="r"): страница не копируется
+в память процесса, а отображается из page cache ОС.
+
+Кэш работает, когда PDF открыт из общего хранилища задач (job_id,
+SHARED_UPLOADS_DIR); для временных файлов загрузки страница просто
+рендерится. Отключить: RASTER_CACHE=0.
+"""
+import os
+import math
+import threading
+from pathlib import Path
+from typing import Optional
+
+import numpy as np
+import pypdfium2 as pdfium
+
+from .metrics import cache_result, timed
+from .pdfium_lock import pdfium_lock
+from .storage import SHARED_UPLOADS
+
+RASTER_CACHE = os.getenv("RASTER_CACHE", "1") != "0"
+RENDER_DPI   = 400
+
+
+
+def raster_dir(pdf_path) -> Optional[Path]:
+    """Папка растров для PDF задачи или None, если PDF не из общего хранилища."""
+    if not RASTER_CACHE:
+        return None
+    path = Path(pdf_path).resolve()
+    job_dir = path.parent
+    if job_dir.parent != SHARED_UPLOADS.resolve() or path.stem != job_dir.name:
+        return None
+    return job_dir / "rasters"
+
+
+def render_bgr(page, dpi: int = RENDER_DPI) -> np.ndarray:
+    """Рендер страницы pdfium в BGR — то же, что cvtColor(to_pil(), RGB2BGR)."""
+    rgb = np.asarray(page.render(scale=dpi / 72).to_pil())
+    return np.ascontiguousarray(rgb[..., ::-1])
+
+
+class PageRasters:
+    """
+    Страницы одного PDF в BGR при заданном dpi: из кэша задачи, а при
+    промахе — рендером с записью в кэш. Документ pdfium открывается,
+    только если что-то действительно нужно отрендерить или измерить.
+    """
+
+    def __init__(self, pdf_path, dpi: int = RENDER_DPI):
+        self.pdf_path  = str(pdf_path)
+        self.dpi       = dpi
+        self.cache_dir = raster_dir(pdf_path)
+        self._pdf      = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self) -> None:
+        with pdfium_lock:
+            if self._pdf is not None:
+                self._pdf.close()
+                self._pdf = None
+
+    @property
+    def pdf(self) -> pdfium.PdfDocument:
+        with pdfium_lock:
+            if self._pdf is None:
+                self._pdf = pdfium.PdfDocument(self.pdf_path)
+            return self._pdf
+
+    def __len__(self) -> int:
+        with pdfium_lock:
+            return len(self.pdf)
+
+    def size_pts(self, idx: int) -> tuple:
+        """(ширина, высота) страницы в пунктах."""
+        with pdfium_lock:
+            page = self.pdf.get_page(idx)
+            try:
+                return page.get_size()
+            finally:
+                page.close()
+
+    def size_px(self, idx: int, dpi: Optional[float] = None) -> tuple:
+        """(ширина, высота) рендера страницы при dpi (по умолчанию — своём), как у pdfium."""
+        w, h = self.size_pts(idx)
+        scale = (dpi or self.dpi) / 72
+        return math.ceil(w * scale), math.ceil(h * scale)
+
+    def fit_dpi(self, idx: int, long_side: int) -> float:
+        """dpi, при котором длинная сторона страницы — long_side пикселей (не выше своего)."""
+        return min(self.dpi, self.dpi * long_side / max(self.size_px(idx)))
+
+    def render(self, idx: int, dpi: float) -> np.ndarray:
+        """Страница idx при любом dpi, в обход кэша (например, в размер входа модели)."""
+        with pdfium_lock:
+            page = self.pdf.get_page(idx)
+            try:
+                with timed("render"):
+                    return render_bgr(page, dpi)
+            finally:
+                page.close()
+
+    def path(self, idx: int) -> Optional[Path]:
+        if self.cache_dir is None:
+            return None
+        return self.cache_dir / f"page_{idx + 1}_{self.dpi}dpi.npy"
+
+    def bgr(self, idx: int) -> np.ndarray:
+        """Страница idx (с 0): из кэша — только для чтения, без копирования."""
+        path = self.path(idx)
+        if path is not None:
+            try:
+                img = np.load(path, mmap_mode="r")
+            except (FileNotFoundError, ValueError):
+                cache_result("rasters", False)
+            else:
+                cache_result("rasters", True)
+                return img
+
+        img = self.render(idx, self.dpi)
+        if path is not None:
+            # пишем во временный файл и переименовываем: читатель другой
+            # стадии не увидит недописанную страницу
+            path.parent.mkdir(exist_ok=True)
+            tmp = path.with_name(f"{path.stem}.{os.getpid()}.{threading.get_ident()}.tmp.npy")
+            np.save(tmp, img)
+            os.replace(tmp, path)
+            # дальше — как при попадании: отображение файла вместо копии в
+            # памяти процесса (растр 400 dpi — сотни мегабайт)
+            del img
+            return np.load(path, mmap_mode="r")
+        return img
@@ -0,0 +1,53 @@
+import os
+import re
+import tempfile
+from contextlib import asynccontextmanager
+from pathlib import Path
+from typing import AsyncIterator, Optional
+
+from fastapi import HTTPException, UploadFile
+
+from .uploads import copy_upload
+
+# папка задач шлюза (static/uploads/<job_id>/<job_id>.pdf). На удалённых
+# узлах сюда монтируется общий том; без него работает только загрузка файла.
+SHARED_UPLOADS = Path(os.getenv(
+    "SHARED_UPLOADS_DIR",
+    Path(__file__).resolve().parents[2] / "app" / "static" / "uploads",
+))
+
+JOB_ID_RE = re.compile(r"^[0-9a-f]{32}$")
+
+
+def job_pdf_path(job_id: str) -> Path:
+    """Путь к исходному PDF задачи в общем хранилище."""
+    if not JOB_ID_RE.match(job_id):
+        raise HTTPException(400, "Некорректный job_id")
+    path = SHARED_UPLOADS / job_id / f"{job_id}.pdf"
+    if not path.is_file():
+        raise HTTPException(404, f"PDF задачи {job_id} не найден в общем хранилище")
+    return path
+
+
+@asynccontextmanager
+async def pdf_source(file: Optional[UploadFile], job_id: Optional[str]) -> AsyncIterator[str]:
+    """
+    Путь к PDF для обработки: по job_id открываем файл шлюза напрямую,
+    иначе кусками переливаем загрузку во временный файл и удаляем его после.
+    """
+    if job_id:
+        yield str(job_pdf_path(job_id))
+        return
+
+    if file is None:
+        raise HTTPException(400, "Нужен PDF: файл или job_id")
+    if file.content_type != "application/pdf":
+        raise HTTPException(400, "Нужен PDF")
+
+    tmp = tempfile.NamedTemporaryFile(delete=False, suffix=".pdf")
+    try:
+        with tmp:
+            await copy_upload(file, tmp)
+        yield tmp.name
+    finally:
+        os.remove(tmp.name)
@@ -0,0 +1,56 @@
+"""
+Постраничная выдача результатов (NDJSON): одна строка — одна страница.
+
+Клиент включает её заголовком `Accept: application/x-ndjson`; страницы
+уходят по мере готовности, и следующая стадия может начать работу над
+первыми листами, пока сервис обрабатывает остальные. Если обработка
+упала посреди документа, последней строкой приходит {"error": "..."}.
+"""
+from contextlib import AsyncExitStack
+from typing import AsyncContextManager, Callable, Iterator, Optional
+
+from fastapi import Request
+from fastapi.responses import StreamingResponse
+from starlette.concurrency import iterate_in_threadpool
+
+from .codec import dumps
+
+NDJSON = "application/x-ndjson"
+
+
+def wants_ndjson(request: Request) -> bool:
+    return NDJSON in request.headers.get("accept", "")
+
+
+def ndjson_response(pages: Iterator[dict], stack: Optional[AsyncExitStack] = None) -> StreamingResponse:
+    """
+    Отдаёт страницы синхронного генератора по мере готовности; сам генератор
+    крутится в пуле потоков. stack закрывается, когда поток закончен или
+    клиент отключился (в нём, например, временный файл с PDF).
+    """
+    async def body():
+        try:
+            async for page in iterate_in_threadpool(pages):
+                yield dumps(page) + b"\n"
+        except Exception as e:
+            yield dumps({"error": f"{type(e).__name__}: {e}"}) + b"\n"
+        finally:
+            if stack is not None:
+                await stack.aclose()
+
+    return StreamingResponse(body(), media_type=NDJSON)
+
+
+async def stream_pdf(source: AsyncContextManager[str], produce: Callable[[str], Iterator[dict]]) -> StreamingResponse:
+    """
+    NDJSON-ответ для обработки PDF: source (pdf_source) остаётся открытым,
+    пока produce(path) не выдаст последнюю страницу.
+    """
+    stack = AsyncExitStack()
+    try:
+        path = await stack.enter_async_context(source)
+        pages = produce(path)
+    except BaseException:
+        await stack.aclose()
+        raise
+    return ndjson_response(pages, stack)
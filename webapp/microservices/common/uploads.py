@@ -0,0 +1,57 @@
+import os
+from typing import BinaryIO
+
+from fastapi import HTTPException, UploadFile
+from fastapi.responses import JSONResponse
+
+# предел тела запроса (PDF + JSON-части); сканы проектов бывают в сотни МБ
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_MB", "1024")) * 1024 * 1024
+CHUNK_SIZE       = 1024 * 1024
+
+
+class LimitUploadSize:
+    """
+    ASGI-middleware: отклоняет запросы с телом больше max_bytes (413).
+    Честный Content-Length отсекается до чтения тела, а chunked-запрос —
+    как только прочитанная часть превысит предел, не дожидаясь конца.
+    """
+
+    def __init__(self, app, max_bytes: int = MAX_UPLOAD_BYTES):
+        self.app = app
+        self.max_bytes = max_bytes
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        headers = dict(scope["headers"])
+        length = headers.get(b"content-length")
+        if length is not None and length.isdigit() and int(length) > self.max_bytes:
+            resp = JSONResponse({"detail": self._detail()}, status_code=413)
+            return await resp(scope, receive, send)
+
+        received = 0
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.max_bytes:
+                    # FastAPI пропускает HTTPException из разбора тела как есть
+                    raise HTTPException(413, self._detail())
+            return message
+
+        await self.app(scope, limited_receive, send)
+
+    def _detail(self) -> str:
+        return f"Файл больше допустимого ({self.max_bytes // (1024 * 1024)} МБ)"
+
+
+async def copy_upload(file: UploadFile, out: BinaryIO) -> int:
+    """Переливает загруженный файл в out кусками, не держа его целиком в памяти."""
+    total = 0
+    while chunk := await file.read(CHUNK_SIZE):
+        out.write(chunk)
+        total += len(chunk)
+    return total
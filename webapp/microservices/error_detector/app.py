@@ -1,39 +1,49 @@
-import json
-import tempfile
+import sys
+from pathlib import Path
 
-from fastapi import FastAPI, UploadFile, File, HTTPException
-from fastapi.responses import JSONResponse
+from fastapi import FastAPI, UploadFile, File, HTTPException, Request
 
-from detector import detect_errors
+sys.path.append(str(Path(__file__).resolve().parent.parent))  # microservices/ → пакет common
+from common import metrics
+from common.codec import MEDIA_TYPES, encode_response, read_part
+from common.streaming import ndjson_response, wants_ndjson
+from common.uploads import LimitUploadSize
+from detector import detect_errors, iter_detect
 
 app = FastAPI(
     title="Error Detector Service",
     description="Принимает объединённый JSON и возвращает его же с полем errors",
     version="1.0.0",
 )
+app.add_middleware(LimitUploadSize)
+metrics.install(app, "error_detector")
 
 @app.post("/detect", summary="Найти ошибки в тексте по LanguageTool API")
 async def detect_endpoint(
+    request: Request,
     combined_file: UploadFile = File(..., description="JSON, полученный после combine")
 ):
     # Проверяем content-type
-    if combined_file.content_type not in ("application/json", "text/json"):
+    if combined_file.content_type not in MEDIA_TYPES:
         raise HTTPException(status_code=400, detail="Требуется JSON-файл")
 
-    # Читаем и парсим JSON
-    payload = await combined_file.read()
+    # Читаем и парсим JSON (или msgpack, возможно сжатый)
     try:
-        data = json.loads(payload)
+        data = await read_part(combined_file)
     except Exception as e:
         raise HTTPException(status_code=400, detail=f"Неверный JSON: {e}")
 
+    # Постранично: ошибки листа уходят клиенту сразу после его проверки
+    if wants_ndjson(request):
+        return ndjson_response(iter_detect(data))
+
     # Запускаем детектор ошибок
     try:
         result = detect_errors(data)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Ошибка при detect_errors: {e}")
 
-    return JSONResponse(content=result)
+    return encode_response(result, request)
 
 if __name__ == "__main__":
     import uvicorn
@@ -1,8 +1,15 @@
+import os
+import sys
 import json
 import requests
+from pathlib import Path
 from concurrent.futures import ThreadPoolExecutor
 
-LT_URL = "https://api.languagetool.org/v2/check"
+sys.path.append(str(Path(__file__).resolve().parent.parent))  # microservices/ → пакет common
+from common.metrics import in_context, timed
+
+# публичный LanguageTool по умолчанию; свой сервер (или заглушка из benchmarks/) — через LT_URL
+LT_URL = os.getenv("LT_URL", "https://api.languagetool.org/v2/check")
 
 def group_paragraphs(blocks, gap=20):
     """
@@ -22,6 +29,7 @@ def group_paragraphs(blocks, gap=20):
     paras.append(cur)
     return paras
 
+@timed("languagetool")
 def check_text_lt(text):
     """
     Отправляет текст в LanguageTool и возвращает список совпадений.
@@ -79,37 +87,47 @@ def detect_errors(data: list) -> list:
     добавляет поле 'errors' со списком ошибок и возвращает модифицированный data.
     """
     for page in data:
-        # 1) параграфы из plain_text
-        paras = group_paragraphs(page.get('plain_text', []))
-        page_errors = []
-        with ThreadPoolExecutor(max_workers=4) as ex:
-            for errs in ex.map(process_paragraph, paras):
-                page_errors.extend(errs)
+        detect_page(page)
+    return data
+
+def iter_detect(data):
+    """То же по одной странице: ошибки первых листов видны, пока идут остальные."""
+    for page in data:
+        yield detect_page(page)
 
-        # 2) ячейки таблиц
-        for tbl in page.get('tables', []):
-            for cell in tbl.get('cells', []):
-                txt = " ".join(t['text'] for t in cell.get('texts', []))
-                if not txt:
-                    continue
-                matches = check_text_lt(txt)
-                for m in matches:
-                    repl = [r['value'] for r in m['replacements']][:3]
-                    page_errors.append({
-                        'id':           cell['id'],
-                        'bbox':         cell['bbox'],
-                        'error_text':   txt[m['offset']:m['offset']+m['length']],
-                        'offset':       m['offset'],
-                        'length':       m['length'],
-                        'message':      m['message'],
-                        'shortMessage': m.get('shortMessage'),
-                        'replacements': repl,
-                        'ruleId':       m['rule']['id'],
-                        'issueType':    m['rule']['issueType'],
-                        'category':     m['rule']['category']['id'],
-                        'context':      m['context']['text']
-                    })
+def detect_page(page: dict) -> dict:
+    """Добавляет странице поле 'errors' и возвращает её."""
+    # 1) параграфы из plain_text
+    paras = group_paragraphs(page.get('plain_text', []))
+    page_errors = []
+    with ThreadPoolExecutor(max_workers=4) as ex:
+        for errs in ex.map(in_context(process_paragraph), paras):
+            page_errors.extend(errs)
+
+    # 2) ячейки таблиц
+    for tbl in page.get('tables', []):
+        for cell in tbl.get('cells', []):
+            txt = " ".join(t['text'] for t in cell.get('texts', []))
+            if not txt:
+                continue
+            matches = check_text_lt(txt)
+            for m in matches:
+                repl = [r['value'] for r in m['replacements']][:3]
+                page_errors.append({
+                    'id':           cell['id'],
+                    'bbox':         cell['bbox'],
+                    'error_text':   txt[m['offset']:m['offset']+m['length']],
+                    'offset':       m['offset'],
+                    'length':       m['length'],
+                    'message':      m['message'],
+                    'shortMessage': m.get('shortMessage'),
+                    'replacements': repl,
+                    'ruleId':       m['rule']['id'],
+                    'issueType':    m['rule']['issueType'],
+                    'category':     m['rule']['category']['id'],
+                    'context':      m['context']['text']
+                })
 
-        page['errors'] = page_errors
+    page['errors'] = page_errors
 
-    return data
\ No newline at end of file
+    return page
\ No newline at end of file
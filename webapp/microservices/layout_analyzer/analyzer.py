@@ -1,213 +1,365 @@
+import os
+import sys
 import json
+import time
+import queue
+import logging
+import threading
 import numpy as np
-import pypdfium2 as pdfium
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
 from doclayout_yolo import YOLOv10
 from ultralytics import YOLO
-from huggingface_hub import hf_hub_download
-
-# --- 1. Загрузка моделей один раз при старте --------------------------------
-
-weights1 = hf_hub_download(
-    repo_id="juliozhao/DocLayout-YOLO-DocStructBench",
-    filename="doclayout_yolo_docstructbench_imgsz1024.pt"
-)
-model1 = YOLOv10(weights1)
-
-# путь к вашей дообученной модели
-model2 = YOLO('weights/best.pt')
-
-
-# --- 2. Утилиты --------------------------------------------------------------
-
-def iou(boxA, boxB):
-    xA, yA = max(boxA[0], boxB[0]), max(boxA[1], boxB[1])
-    xB, yB = min(boxA[2], boxB[2]), min(boxA[3], boxB[3])
-    interW, interH = max(0, xB - xA), max(0, yB - yA)
-    inter = interW * interH
-    areaA = (boxA[2] - boxA[0]) * (boxA[3] - boxA[1])
-    areaB = (boxB[2] - boxB[0]) * (boxB[3] - boxB[1])
-    return inter / (areaA + areaB - inter + 1e-6)
-
-def nms(items, iou_thr=0.9):
-    items = sorted(items, key=lambda x: x['conf'], reverse=True)
-    keep = []
-    for it in items:
-        if all(iou(it['bbox'], k['bbox']) < iou_thr for k in keep):
-            keep.append(it)
-    return keep
-
-def classify_tables(items, page_w, page_h):
-    tables = [it for it in items if it['subtype']=='table']
-    if not tables: return
-    cands = []
-    for t in tables:
-        cx = (t['bbox'][0] + t['bbox'][2]) / 2
-        cy = (t['bbox'][1] + t['bbox'][3]) / 2
-        if cx > page_w * 0.5 and cy > page_h * 0.5:
-            cands.append(t)
-    stamp = max(cands, key=lambda x: x['conf']) if cands else tables[0]
-    for t in tables:
-        t['subtype'] = 'stamp' if t is stamp else 'specification'
-
-def drop_noisy_tables(items, max_overlaps=2):
-    tables = [it for it in items if it['class']=='table']
-    others = [it for it in items if it['class']!='table']
-    kept = []
-    for tbl in tables:
-        cnt = sum(
-            1 for o in others
-            if iou(tbl['bbox'], o['bbox']) > 0
-               or (o['bbox'][0] >= tbl['bbox'][0]
-                   and o['bbox'][1] >= tbl['bbox'][1]
-                   and o['bbox'][2] <= tbl['bbox'][2]
-                   and o['bbox'][3] <= tbl['bbox'][3])
-        )
-        if cnt <= max_overlaps:
-            kept.append(tbl)
-    return kept + others
-
-def drop_nested_tables(items):
-    tables = [it for it in items if it['class']=='table']
-    others = [it for it in items if it['class']!='table']
-    kept = []
-    for tbl in tables:
-        x1,y1,x2,y2 = tbl['bbox']
-        nested = False
-        for o in others:
-            ox1,oy1,ox2,oy2 = o['bbox']
-            if ox1 <= x1 and oy1 <= y1 and ox2 >= x2 and oy2 >= y2:
-                nested = True
-                break
-        if not nested:
-            kept.append(tbl)
-    return kept + others
-
-def merge_plain_text(items, gap_thr=7):
-    texts = [it for it in items if it['class']=='text']
-    others = [it for it in items if it['class']!='text']
-    n = len(texts)
-    adj = [[] for _ in range(n)]
-
-    for i in range(n):
-        bi = texts[i]['bbox']
-        for j in range(i+1, n):
-            bj = texts[j]['bbox']
-            # проверяем пересечения/соседство
-            inter = iou(bi, bj) > 0
-            inside = (
-                (bj[0]>=bi[0] and bj[1]>=bi[1] and bj[2]<=bi[2] and bj[3]<=bi[3]) or
-                (bi[0]>=bj[0] and bi[1]>=bj[1] and bi[2]<=bj[2] and bi[3]<=bj[3])
-            )
-            gap_x = max(0, max(bj[0] - bi[2], bi[0] - bj[2]))
-            vert_ov = min(bi[3], bj[3]) - max(bi[1], bj[1])
-            neigh_h = (gap_x <= gap_thr) and (vert_ov > 0)
-            gap_y = max(0, max(bj[1] - bi[3], bi[1] - bj[3]))
-            hor_ov = min(bi[2], bj[2]) - max(bi[0], bj[0])
-            neigh_v = (gap_y <= gap_thr) and (hor_ov > 0)
-
-            if inter or inside or neigh_h or neigh_v:
-                adj[i].append(j)
-                adj[j].append(i)
-
-    seen = [False]*n
-    merged_texts = []
-    for i in range(n):
-        if seen[i]: continue
-        stack, group = [i], []
-        while stack:
-            u = stack.pop()
-            if seen[u]: continue
-            seen[u] = True
-            group.append(u)
-            for v in adj[u]:
-                if not seen[v]:
-                    stack.append(v)
-        xs = [texts[k]['bbox'][0] for k in group] + [texts[k]['bbox'][2] for k in group]
-        ys = [texts[k]['bbox'][1] for k in group] + [texts[k]['bbox'][3] for k in group]
-        bbox = [min(xs), min(ys), max(xs), max(ys)]
-        conf = sum(texts[k]['conf'] for k in group) / len(group)
-        merged_texts.append({
-            'bbox': bbox,
-            'conf': conf,
-            'class': 'text',
-            'subtype': 'plain_text'
-        })
-    return merged_texts + others
-
-def drop_drawings_with_text(items, min_texts=2):
-    drawings = [it for it in items if it['class']=='drawing']
-    others   = [it for it in items if it['class']!='drawing']
-    texts    = [it for it in items if it['class']=='text' and it['subtype']=='plain_text']
-    kept = []
-    for dr in drawings:
-        cnt = sum(
-            1 for t in texts
-            if iou(dr['bbox'], t['bbox']) > 0
-               or (t['bbox'][0]>=dr['bbox'][0]
-                   and t['bbox'][1]>=dr['bbox'][1]
-                   and t['bbox'][2]<=dr['bbox'][2]
-                   and t['bbox'][3]<=dr['bbox'][3])
-        )
-        if cnt < min_texts:
-            kept.append(dr)
-    return kept + others
-
-
-# --- 3. Главная функция анализа -------------------------------------------
+
+sys.path.append(str(Path(__file__).resolve().parent.parent))  # microservices/ → пакет common
+from common.metrics import in_context, tally, timed
+from common.rasters import RENDER_DPI, PageRasters
+from layout_analyzer.backends import PREDICT, load, resolve_device
+from layout_analyzer.postprocess import postprocess
+
+log = logging.getLogger(__name__)
+
+# --- 1. Модели: загрузка, прогрев, готовность -------------------------------
+
+# GPU, если он есть; на CPU — экспорт в OpenVINO/ONNX, если он подготовлен
+# (см. layout_analyzer/backends.py и python -m layout_analyzer.export)
+DEVICE = resolve_device()
+
+# 1 — загрузить модели при импорте модуля. Так их загружает родительский
+# процесс gunicorn --preload, и воркеры делят веса copy-on-write:
+#   gunicorn app:app --preload -w 2 -k uvicorn.workers.UvicornWorker -b 0.0.0.0:8010
+# 0 — при первом обращении (сервис: в фоне сразу после старта, см. /ready)
+LAYOUT_PRELOAD = os.getenv("LAYOUT_PRELOAD", "1") != "0"
+
+_models = None     # имя → (модель, backend, imgsz)
+_warm   = None     # pid процесса, в котором модели прогреты
+_lock   = threading.Lock()
+
+def models() -> dict:
+    """
+    DocLayout-YOLO и ваша дообученная модель (веса — в weights/ рядом с
+    модулем, см. registry.py); первый вызов загружает их, остальные ждут.
+    """
+    global _models
+    with _lock:
+        if _models is None:
+            with timed("model_load"):
+                _models = {'doclayout': load(YOLOv10, "doclayout", DEVICE),
+                           'custom':    load(YOLO, "custom", DEVICE)}
+    return _models
+
+def warmup() -> None:
+    """
+    Прогон predict на пустой странице в этом процессе: инициализация
+    рантайма (потоки, CUDA, компиляция графа) — до первого PDF, а не на нём.
+    После fork воркер прогревается сам: пулы потоков родителя он не наследует.
+    """
+    global _warm
+    loaded = models()
+    with _lock:
+        if _warm == os.getpid():
+            return
+        with timed("warmup"):
+            for name, (model, _, imgsz) in loaded.items():
+                blank = np.full((imgsz, imgsz, 3), 255, dtype=np.uint8)
+                model.predict(blank, imgsz=imgsz, device=DEVICE, verbose=False, **PREDICT[name])
+        _warm = os.getpid()
+
+def ready() -> bool:
+    return _warm == os.getpid()
+
+def backends() -> dict:
+    return {name: backend for name, (_, backend, _) in (_models or {}).items()}
+
+if LAYOUT_PRELOAD:
+    models()
+
+# страниц в одном вызове predict: меньше накладных расходов на вызов и
+# полнее загружено устройство, но пачка растров целиком в памяти (в режиме
+# full — 400 dpi, лист A0 ~700 МБ), а на GPU ещё и тензоры пачки. По
+# умолчанию 1 — как до пачек; больше — на GPU и небольших листах
+LAYOUT_BATCH = max(1, int(os.getenv("LAYOUT_BATCH", "1")))
+
+# сколько пачек поток рендера готовит впрок, пока модели заняты предыдущей.
+# 0 — рендер и детекция по очереди в одном потоке
+LAYOUT_PREFETCH = max(0, int(os.getenv("LAYOUT_PREFETCH", "1")))
+# и сколько мегабайт растров при этом может быть в памяти — отрендеренных,
+# но ещё не размеченных (в очереди, у потока рендера и у моделей). Размер
+# страницы известен до рендера (size_px), поток ждёт, пока не освободится
+# место; страница больше всего бюджета рендерится, только когда остальные
+# размечены. 0 — без ограничения
+LAYOUT_PREFETCH_MB = max(0.0, float(os.getenv("LAYOUT_PREFETCH_MB", "1024")))
+
+# обе модели — одновременно, в двух потоках: auto — на GPU (пока одна ждёт
+# ядра, другая готовит вход и разбирает выход); на CPU модели и так делят
+# одни и те же ядра, поэтому по умолчанию по очереди
+LAYOUT_PARALLEL_MODELS = os.getenv("LAYOUT_PARALLEL_MODELS", "auto")
+PARALLEL_MODELS = (DEVICE != "cpu" if LAYOUT_PARALLEL_MODELS == "auto"
+                   else LAYOUT_PARALLEL_MODELS == "1")
+
+# модель ultralytics не выполняет два predict одновременно: свой замок
+# у каждой, чтобы параллельные запросы не сталкивались на одной модели
+_predict_locks = {'doclayout': threading.Lock(), 'custom': threading.Lock()}
+# вторая модель (при PARALLEL_MODELS) и пост-обработка страниц — в своих
+# потоках: она идёт, пока модели размечают следующую пачку
+_second_model = ThreadPoolExecutor(1, thread_name_prefix="layout-model")
+_postprocess  = ThreadPoolExecutor(1, thread_name_prefix="layout-post")
+
+# растр для детекторов:
+#   full     — рендер 400 dpi (по умолчанию), как у layout_combiner: растр
+#              ложится в кэш задачи, и combiner его не рендерит заново;
+#   detector — страница рендерится сразу в размер входа моделей (длинная
+#              сторона = наибольший imgsz), боксы пересчитываются в пиксели
+#              400 dpi; лист A1 — ~1 МП вместо ~100 МП, но combiner рендерит
+#              400 dpi сам. Вход моделей при этом другой (pdfium, а не
+#              уменьшение 400 dpi): включайте, когда на своих чертежах
+#              проходит python -m layout_analyzer.render_check
+LAYOUT_RENDER = os.getenv("LAYOUT_RENDER", "full")
+if LAYOUT_RENDER not in ("detector", "full"):
+    raise ValueError("LAYOUT_RENDER: detector или full")
+
+
+# --- 2. Главная функция анализа -------------------------------------------
+
+def iter_analyze(pdf_path: str):
+    """Страницы разметки по одной — следующая стадия может начать раньше."""
+    # в режиме full растры страниц кладутся в кэш задачи — layout_combiner их не рендерит заново
+    with PageRasters(pdf_path, dpi=RENDER_DPI) as rasters:
+        yield from _analyze_pages(rasters)
 
 def analyze_pdf(pdf_path: str) -> dict:
-    pdf = pdfium.PdfDocument(pdf_path)
-    pages = []
-    for idx in range(len(pdf)):
-        page = pdf.get_page(idx)
-        bmp = page.render(scale=400/72)
-        img = bmp.to_pil()
-        page_w, page_h = img.size
-        page.close()
-
-        # две детекции
-        res1 = model1.predict(img, imgsz=1024, conf=0.05, iou=0.35, device="cuda:0")[0]
-        res2 = model2.predict(img, conf=0.07, iou=0.1)[0]
-
-        items = []
-        # из первой модели
-        for box, conf, cid in zip(res1.boxes.xyxy.tolist(),
-                                   res1.boxes.conf.tolist(),
-                                   res1.boxes.cls.tolist()):
-            name = res1.names[int(cid)]
-            if name == 'figure': continue
-            if name == 'table':
-                items.append({'bbox': box, 'conf': conf, 'class': 'table', 'subtype': 'table'})
-            else:
-                items.append({'bbox': box, 'conf': conf, 'class': 'text', 'subtype': name.replace(' ', '_')})
-        # из второй модели
-        for box, conf, cid in zip(res2.boxes.xyxy.tolist(),
-                                   res2.boxes.conf.tolist(),
-                                   res2.boxes.cls.tolist()):
-            name = res2.names[int(cid)]
-            if name in ('specification','stamp','text'): continue
-            items.append({'bbox': box, 'conf': conf, 'class': 'drawing', 'subtype': name})
-
-        # пост-обработка
-        classify_tables(items, page_w, page_h)
-        items = nms(items)
-        items = drop_noisy_tables(items)
-        items = drop_nested_tables(items)
-        items = merge_plain_text(items)
-        items = drop_drawings_with_text(items)
-
-        # собираем выход
-        objs = [{
-            'bbox': [round(x,2) for x in it['bbox']],
-            'class': it['class'],
-            'subtype': it['subtype']
-        } for it in items]
-
-        pages.append({
-            'page': idx+1,
-            'width': page_w,
-            'height': page_h,
-            'objects': objs
-        })
-    pdf.close()
-    return {'pages': pages}
\ No newline at end of file
+    return {'pages': list(iter_analyze(pdf_path))}
+
+def _raster(rasters, idx: int, long_side: int) -> tuple:
+    """(растр для детекторов, (ширина, высота) страницы в пикселях 400 dpi)."""
+    if LAYOUT_RENDER == "full":
+        img = rasters.bgr(idx)
+        return img, (img.shape[1], img.shape[0])
+
+    full_w, full_h = rasters.size_px(idx)
+    dpi = rasters.fit_dpi(idx, long_side)
+    t0 = time.perf_counter()
+    img = rasters.render(idx, dpi)
+    # что сэкономлено против рендера 400 dpi — в итог запроса (render_saved_mb
+    # рядом с render) и постранично в debug-лог
+    saved_mb = (full_w * full_h * 3 - img.nbytes) / 2**20
+    tally("render_saved_mb", saved_mb)
+    log.debug("стр. %d: рендер %.0f dpi за %.2f с, %d×%d вместо %d×%d (−%.1f МБ)",
+              idx + 1, dpi, time.perf_counter() - t0, img.shape[1], img.shape[0], full_w, full_h, saved_mb)
+    return img, (full_w, full_h)
+
+def _raster_bytes(rasters, idx: int, long_side: int) -> int:
+    """Сколько займёт растр страницы для детекторов — ещё до рендера."""
+    dpi = None if LAYOUT_RENDER == "full" else rasters.fit_dpi(idx, long_side)
+    w, h = rasters.size_px(idx, dpi)
+    return w * h * 3
+
+class _Budget:
+    """
+    Байты растров, отрендеренных, но ещё не размеченных. acquire ждёт
+    места; если ничего не занято, пропускает и страницу больше лимита.
+    """
+
+    def __init__(self, limit: int):
+        self.limit  = limit
+        self.used   = 0
+        self.closed = False
+        self._cond  = threading.Condition()
+
+    def fits(self, n: int) -> bool:
+        with self._cond:
+            return not (self.limit and self.used and self.used + n > self.limit)
+
+    def acquire(self, n: int) -> bool:
+        with self._cond:
+            while self.limit and self.used and self.used + n > self.limit and not self.closed:
+                self._cond.wait()
+            if self.closed:
+                return False
+            self.used += n
+            return True
+
+    def release(self, n: int) -> None:
+        with self._cond:
+            self.used -= n
+            self._cond.notify_all()
+
+    def close(self) -> None:
+        """Читатель ушёл: ждущий поток рендера выходит без рендера."""
+        with self._cond:
+            self.closed = True
+            self._cond.notify_all()
+
+def _batches(rasters, size: int, budget: _Budget):
+    """
+    Пачки (номер, растр, размер 400 dpi, байт растра) подряд идущих страниц
+    по size штук. Страница другого размера начинает новую пачку: пачку
+    одинаковых страниц ultralytics готовит так же, как одну (letterbox без
+    лишних полей), и детекции совпадают с постраничными. Место под растр
+    берётся в budget до рендера; освобождает его читатель — поэтому
+    неполная пачка уходит сразу, если следующей странице нет места.
+    """
+    long_side = max(imgsz for _, _, imgsz in models().values())
+    batch = []
+    for idx in range(len(rasters)):
+        nbytes = _raster_bytes(rasters, idx, long_side)
+        if batch and not budget.fits(nbytes):
+            yield batch
+            batch = []
+        if not budget.acquire(nbytes):
+            return
+        # BGR-массив: для ultralytics это то же, что RGB-картинка PIL
+        img, size_400 = _raster(rasters, idx, long_side)
+        if batch and img.shape != batch[0][1].shape:
+            yield batch
+            batch = []
+        batch.append((idx, img, size_400, nbytes))
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+def _prefetch(items, depth: int):
+    """
+    Элементы items, которые отдельный поток готовит не больше чем на depth
+    вперёд. Ошибка потока поднимается у читателя; если читатель бросил
+    генератор, поток останавливается, и выход отсюда — только после него
+    (иначе PageRasters закрыл бы документ посреди рендера).
+    """
+    if depth <= 0:
+        yield from items
+        return
+
+    q    = queue.Queue(maxsize=depth)
+    stop = threading.Event()
+
+    def put(entry) -> bool:
+        while not stop.is_set():
+            try:
+                q.put(entry, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def produce():
+        try:
+            for item in items:
+                if not put(("item", item)):
+                    return
+            put(("done", None))
+        except BaseException as e:
+            put(("error", e))
+
+    worker = threading.Thread(target=in_context(produce), name="layout-render", daemon=True)
+    worker.start()
+    try:
+        while True:
+            kind, value = q.get()
+            if kind == "done":
+                return
+            if kind == "error":
+                raise value
+            yield value
+    finally:
+        stop.set()
+        worker.join()
+
+def _predict(name: str, imgs: list) -> list:
+    model, _, imgsz = models()[name]
+    with _predict_locks[name]:
+        return model.predict(imgs, imgsz=imgsz, device=DEVICE, **PREDICT[name])
+
+def _analyze_pages(rasters, batch_size: int = LAYOUT_BATCH):
+    """
+    Конвейер: поток рендера держится на LAYOUT_PREFETCH пачек (и не больше
+    LAYOUT_PREFETCH_MB растров) впереди, модели размечают пачку,
+    пост-обработка её страниц идёт в своём потоке уже во время детекции
+    следующей. Страницы выходят по порядку, и результат тот же, что при
+    обработке по очереди.
+    """
+    budget  = _Budget(int(LAYOUT_PREFETCH_MB * 2**20))
+    batches = _prefetch(_batches(rasters, batch_size, budget), LAYOUT_PREFETCH)
+    pending = deque()       # пост-обработка страниц, по порядку
+    try:
+        for batch in batches:
+            meta   = [(idx, img.shape, size_400) for idx, img, size_400, _ in batch]
+            imgs   = [img for _, img, _, _ in batch]
+            nbytes = sum(n for *_, n in batch)
+            del batch
+            # две детекции на всю пачку
+            with timed("inference"):
+                if PARALLEL_MODELS:
+                    second = _second_model.submit(in_context(_predict), 'custom', imgs)
+                    res1 = _predict('doclayout', imgs)
+                    res2 = second.result()
+                else:
+                    res1 = _predict('doclayout', imgs)
+                    res2 = _predict('custom', imgs)
+            # растры пачки больше не нужны (и результатам predict тоже) —
+            # место под них отдаём потоку рендера
+            for r in (*res1, *res2):
+                r.orig_img = None
+            del imgs
+            budget.release(nbytes)
+            # дальше — постранично
+            for (idx, shape, size_400), r1, r2 in zip(meta, res1, res2):
+                pending.append(_postprocess.submit(in_context(_page), idx, shape, size_400, r1, r2))
+            # готовые страницы — сразу дальше; не готовые ждём, только
+            # если их накопилось больше двух пачек
+            while pending and (pending[0].done() or len(pending) > 2 * batch_size):
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+    finally:
+        for fut in pending:
+            fut.cancel()
+        budget.close()
+        batches.close()     # дождаться потока рендера, пока документ открыт
+
+def _page(idx: int, shape: tuple, size_400: tuple, res1, res2) -> dict:
+    page_w, page_h = size_400
+    # боксы моделей — в пикселях растра; выход и пост-обработка — в пикселях 400 dpi
+    sx, sy = page_w / shape[1], page_h / shape[0]
+
+    def scaled(box):
+        return [box[0] * sx, box[1] * sy, box[2] * sx, box[3] * sy]
+
+    items = []
+    # из первой модели
+    for box, conf, cid in zip(res1.boxes.xyxy.tolist(),
+                               res1.boxes.conf.tolist(),
+                               res1.boxes.cls.tolist()):
+        name = res1.names[int(cid)]
+        if name == 'figure': continue
+        if name == 'table':
+            items.append({'bbox': scaled(box), 'conf': conf, 'class': 'table', 'subtype': 'table'})
+        else:
+            items.append({'bbox': scaled(box), 'conf': conf, 'class': 'text', 'subtype': name.replace(' ', '_')})
+    # из второй модели
+    for box, conf, cid in zip(res2.boxes.xyxy.tolist(),
+                               res2.boxes.conf.tolist(),
+                               res2.boxes.cls.tolist()):
+        name = res2.names[int(cid)]
+        if name in ('specification','stamp','text'): continue
+        items.append({'bbox': scaled(box), 'conf': conf, 'class': 'drawing', 'subtype': name})
+
+    # пост-обработка
+    with timed("postprocess"):
+        items = postprocess(items, page_w, page_h)
+
+    # собираем выход
+    objs = [{
+        'bbox': [round(x,2) for x in it['bbox']],
+        'class': it['class'],
+        'subtype': it['subtype']
+    } for it in items]
+
+    return {
+        'page': idx+1,
+        'width': page_w,
+        'height': page_h,
+        'objects': objs
+    }
\ No newline at end of file
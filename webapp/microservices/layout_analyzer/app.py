@@ -1,16 +1,40 @@
-import os,tempfile
-from fastapi import FastAPI,UploadFile,File,HTTPException
+import sys
+import asyncio
+from contextlib import asynccontextmanager
+from pathlib import Path
+from typing import Optional
+from fastapi import FastAPI,UploadFile,File,Form,Request
 from fastapi.responses import JSONResponse
-from analyzer import analyze_pdf
-app=FastAPI(title="Layout Analyzer")
+sys.path.append(str(Path(__file__).resolve().parent.parent))  # microservices/ → пакет common
+from common import metrics
+from common.codec import encode_response
+from common.storage import pdf_source
+from common.streaming import stream_pdf, wants_ndjson
+from common.uploads import LimitUploadSize
+from analyzer import DEVICE, analyze_pdf, backends, iter_analyze, ready, warmup
+@asynccontextmanager
+async def lifespan(app:FastAPI):
+    # загрузка (если не при импорте) и прогрев — в фоне: сервис сразу отвечает, /ready — когда всё готово
+    app.state.loading=asyncio.create_task(asyncio.to_thread(warmup))
+    yield
+app=FastAPI(title="Layout Analyzer",lifespan=lifespan)
+app.add_middleware(LimitUploadSize)
+metrics.install(app, "layout_analyzer")
 @app.post("/analyze")
-async def analyze_endpoint(file:UploadFile=File(...)):
-    if file.content_type!="application/pdf": raise HTTPException(400,"Нужен PDF")
-    data=await file.read()
-    with tempfile.NamedTemporaryFile(delete=False,suffix=".pdf") as tmp:
-        tmp.write(data); path=tmp.name
-    try: res=analyze_pdf(path)
-    finally: os.remove(path)
-    return JSONResponse(content=res)
+async def analyze_endpoint(request:Request,file:Optional[UploadFile]=File(None),job_id:Optional[str]=Form(None)):
+    # job_id — PDF уже лежит в общем хранилище шлюза, иначе берём загруженный файл
+    if wants_ndjson(request): return await stream_pdf(pdf_source(file,job_id),iter_analyze)  # постранично
+    # разметка — минуты CPU/GPU: в пуле потоков, чтобы /ready и /metrics отвечали
+    async with pdf_source(file,job_id) as path: res=await asyncio.to_thread(analyze_pdf,path)
+    return encode_response(res,request)  # JSON | msgpack по Accept
 
-if __name__=="__main__": import uvicorn; uvicorn.run(app,host="0.0.0.0",port=8010,reload=True)
\ No newline at end of file
+@app.get("/ready")
+async def ready_endpoint():
+    # 200 — модели загружены и прогреты в этом воркере; 503 — ещё нет (или загрузка упала)
+    if ready(): return {"ready":True,"device":DEVICE,"backends":backends()}
+    loading=app.state.loading
+    error=loading.exception() if loading.done() else None
+    return JSONResponse({"ready":False,"error":f"{type(error).__name__}: {error}" if error else None},status_code=503)
+
+# без reload: перезапуск на каждую правку заново грузил бы модели
+if __name__=="__main__": import uvicorn; uvicorn.run(app,host="0.0.0.0",port=8010)
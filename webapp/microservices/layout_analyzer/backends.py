@@ -0,0 +1,113 @@
+"""
+Где и чем выполнять детекторы layout_analyzer.
+
+    LAYOUT_DEVICE  — auto (GPU, если есть, иначе CPU) | cpu | cuda:0 | …
+    LAYOUT_BACKEND — auto | pytorch | onnx | openvino
+    LAYOUT_INT8    — 1: квантованные int8-варианты экспорта
+
+Все веса — и PyTorch, и экспортированные модели (ONNX Runtime, OpenVINO) —
+лежат в weights/ и сверяются с закреплёнными sha256 (см. registry.py);
+экспорт готовит python -m layout_analyzer.export. С auto на GPU
+работает PyTorch, а на CPU — OpenVINO или ONNX, если такой экспорт есть
+и его рантайм установлен, иначе тоже PyTorch. Явно заданный backend без
+экспорта — ошибка при старте, а не тихий откат.
+"""
+import os
+import importlib.util
+from pathlib import Path
+
+from layout_analyzer.registry import WEIGHTS, fetch, verify
+
+BACKENDS = ("pytorch", "onnx", "openvino")
+RUNTIMES = {"onnx": "onnxruntime", "openvino": "openvino"}
+
+LAYOUT_DEVICE  = os.getenv("LAYOUT_DEVICE", "auto")
+LAYOUT_BACKEND = os.getenv("LAYOUT_BACKEND", "auto")
+LAYOUT_INT8    = os.getenv("LAYOUT_INT8", "0") == "1"
+
+# детекторы: имя → (репозиторий HF или None, файл весов, imgsz).
+# imgsz None — тот, с которым модель обучена (так predict делает по умолчанию).
+# У экспортированной модели вход фиксирован: imgsz берётся из её метаданных
+DETECTORS = {
+    "doclayout": ("juliozhao/DocLayout-YOLO-DocStructBench",
+                  "doclayout_yolo_docstructbench_imgsz1024.pt", 1024),
+    "custom":    (None, "best.pt", None),
+}
+# пороги predict — одни и те же в сервисе и при проверке экспорта
+PREDICT = {
+    "doclayout": {"conf": 0.05, "iou": 0.35},
+    "custom":    {"conf": 0.07, "iou": 0.1},
+}
+
+
+def weights_path(name: str) -> Path:
+    """Веса PyTorch детектора в weights/ (при первом запуске — из HF Hub)."""
+    repo, filename, _ = DETECTORS[name]
+    return fetch(repo, filename)
+
+
+def trained_imgsz(name: str, model) -> int:
+    """imgsz для predict и экспорта модели PyTorch."""
+    return DETECTORS[name][2] or model.overrides.get("imgsz", 640)
+
+
+def exported_imgsz(path: Path) -> int:
+    """imgsz, с которым модель экспортирована (ultralytics пишет его в метаданные)."""
+    if path.is_dir():                                       # OpenVINO
+        import yaml
+        size = yaml.safe_load((path / "metadata.yaml").read_text(encoding="utf-8"))["imgsz"]
+    else:                                                   # ONNX
+        import ast
+        import onnxruntime
+        meta = onnxruntime.InferenceSession(str(path), providers=["CPUExecutionProvider"]).get_modelmeta()
+        size = ast.literal_eval(meta.custom_metadata_map["imgsz"])
+    return max(size) if isinstance(size, (list, tuple)) else int(size)
+
+
+def resolve_device(device: str = LAYOUT_DEVICE) -> str:
+    if device != "auto":
+        return device
+    try:
+        import torch
+    except ImportError:
+        return "cpu"
+    return "cuda:0" if torch.cuda.is_available() else "cpu"
+
+
+def exported_path(name: str, backend: str, int8: bool = LAYOUT_INT8) -> Path:
+    stem = Path(DETECTORS[name][1]).stem + ("_int8" if int8 else "")
+    if backend == "onnx":
+        return WEIGHTS / f"{stem}.onnx"
+    if backend == "openvino":
+        return WEIGHTS / f"{stem}_openvino_model"
+    raise ValueError(f"нет экспорта для backend={backend}")
+
+
+def resolve_backend(name: str, device: str, backend: str = LAYOUT_BACKEND,
+                    int8: bool = LAYOUT_INT8) -> str:
+    if backend != "auto":
+        if backend not in BACKENDS:
+            raise ValueError(f"LAYOUT_BACKEND: одно из auto, {', '.join(BACKENDS)}")
+        return backend
+    if device != "cpu":
+        return "pytorch"
+    for candidate in ("openvino", "onnx"):
+        if (importlib.util.find_spec(RUNTIMES[candidate]) is not None
+                and exported_path(name, candidate, int8).exists()):
+            return candidate
+    return "pytorch"
+
+
+def load(cls, name: str, device: str, backend: str = LAYOUT_BACKEND, int8: bool = LAYOUT_INT8) -> tuple:
+    """(модель класса cls — YOLO или YOLOv10, выбранный backend, imgsz для predict)."""
+    backend = resolve_backend(name, device, backend, int8)
+    if backend == "pytorch":
+        model = cls(str(verify(weights_path(name))))
+        return model, backend, trained_imgsz(name, model)
+    path = exported_path(name, backend, int8)
+    if not path.exists():
+        raise FileNotFoundError(
+            f"{path} не найден; экспортируйте модели: python -m layout_analyzer.export "
+            f"--format {backend}" + (" --int8 --calib <PDF>" if int8 else ""))
+    # у экспортированной модели задача не записана в сам файл
+    return cls(str(verify(path)), task="detect"), backend, exported_imgsz(path)
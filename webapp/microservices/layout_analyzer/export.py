@@ -0,0 +1,250 @@
+"""
+Экспорт детекторов layout_analyzer для CPU и проверка экспорта.
+
+    cd microservices
+    python -m layout_analyzer.export --format openvino
+    python -m layout_analyzer.export --format openvino --int8 --calib образцы/*.pdf
+    python -m layout_analyzer.export --format onnx --int8 --calib образцы/*.pdf --check a.pdf
+
+Модели кладутся в layout_analyzer/weights/ под именами, которые ищет
+backends.exported_path; сервис подхватывает их сам (LAYOUT_BACKEND=auto
+на CPU) или по явному LAYOUT_BACKEND / LAYOUT_INT8.
+
+int8 калибруется на страницах --calib (десятки страниц типичных
+чертежей): OpenVINO — через NNCF самого ultralytics, ONNX — статической
+квантизацией onnxruntime (QDQ) по входам, подготовленным как у predict.
+
+--check сравнивает экспорт с PyTorch на страницах PDF: детекции сопоставляются
+по классу и IoU ≥ --iou, доля совпавших (recall — от PyTorch, precision —
+от экспорта) должна быть не ниже --tolerance, иначе код выхода 1. Там же
+время predict обоих вариантов, страниц в секунду.
+"""
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+from pathlib import Path
+
+import numpy as np
+import pypdfium2 as pdfium
+
+sys.path.append(str(Path(__file__).resolve().parent.parent))  # microservices/ → пакет common
+from common.rasters import RENDER_DPI, render_bgr
+from layout_analyzer.backends import (DETECTORS, PREDICT, WEIGHTS, exported_path, load,
+                                      trained_imgsz, weights_path)
+from layout_analyzer.postprocess import iou_matrix
+
+CALIB_DPI   = 150    # калибровочные страницы всё равно ужимаются до imgsz
+CALIB_PAGES = 300    # больше калибровке не нужно, а NNCF/onnxruntime считают долго
+
+
+def model_class(name: str):
+    if name == "doclayout":
+        from doclayout_yolo import YOLOv10
+        return YOLOv10
+    from ultralytics import YOLO
+    return YOLO
+
+
+def _pages(pdfs: list, dpi: int, limit: int = 0):
+    """BGR-страницы PDF по порядку, не больше limit (0 — все)."""
+    n = 0
+    for pdf_path in pdfs:
+        pdf = pdfium.PdfDocument(str(pdf_path))
+        try:
+            for page in pdf:
+                if limit and n >= limit:
+                    return
+                yield render_bgr(page, dpi)
+                n += 1
+        finally:
+            pdf.close()
+
+
+# ── экспорт ──────────────────────────────────────────────────────────────────
+
+def _calib_dataset(tmp: Path, pdfs: list, names: dict) -> Path:
+    """Датасет ultralytics из страниц PDF: калибровке нужны только картинки."""
+    import cv2
+
+    images = tmp / "images"
+    images.mkdir()
+    for n, img in enumerate(_pages(pdfs, CALIB_DPI, CALIB_PAGES), start=1):
+        cv2.imwrite(str(images / f"page_{n}.png"), img)
+    if not any(images.iterdir()):
+        sys.exit("в --calib нет ни одной страницы")
+    data = tmp / "calib.yaml"
+    data.write_text(json.dumps({"path": str(tmp), "train": "images", "val": "images",
+                                "names": {int(k): v for k, v in names.items()}}), encoding="utf-8")
+    return data                     # JSON — подмножество YAML
+
+
+class _CalibReader:
+    """Входы модели для onnxruntime.quantization — letterbox и нормировка, как у predict."""
+
+    def __init__(self, pdfs: list, imgsz: int, input_name: str):
+        from ultralytics.data.augment import LetterBox
+        self.letterbox  = LetterBox(new_shape=(imgsz, imgsz), auto=False)
+        self.input_name = input_name
+        self.pages      = _pages(pdfs, CALIB_DPI, CALIB_PAGES)
+
+    def get_next(self):
+        img = next(self.pages, None)
+        if img is None:
+            return None
+        x = self.letterbox(image=img)[..., ::-1].transpose(2, 0, 1)    # BGR HWC → RGB CHW
+        return {self.input_name: np.ascontiguousarray(x[None], dtype=np.float32) / 255}
+
+
+def _quantize_onnx(fp32: Path, out: Path, pdfs: list, imgsz: int) -> None:
+    import onnx
+    import onnxruntime
+    from onnxruntime.quantization import QuantFormat, QuantType, quantize_static
+
+    session = onnxruntime.InferenceSession(str(fp32), providers=["CPUExecutionProvider"])
+    reader  = _CalibReader(pdfs, imgsz, session.get_inputs()[0].name)
+    quantize_static(str(fp32), str(out), reader, quant_format=QuantFormat.QDQ,
+                    activation_type=QuantType.QUInt8, weight_type=QuantType.QInt8,
+                    per_channel=True)
+    # метаданные ultralytics (imgsz, names, stride) квантизация не переносит
+    meta = {p.key: p.value for p in onnx.load(str(fp32), load_external_data=False).metadata_props}
+    quantized = onnx.load(str(out))
+    onnx.helper.set_model_props(quantized, meta)
+    onnx.save(quantized, str(out))
+
+
+def _replace(src: Path, dst: Path) -> None:
+    if dst.is_dir():
+        shutil.rmtree(dst)
+    elif dst.exists():
+        dst.unlink()
+    shutil.move(str(src), str(dst))
+
+
+def export(name: str, fmt: str, int8: bool, calib: list) -> Path:
+    model = model_class(name)(str(weights_path(name)))
+    imgsz = trained_imgsz(name, model)
+    dst   = exported_path(name, fmt, int8)
+    WEIGHTS.mkdir(exist_ok=True)
+
+    # dynamic: вход любого размера пачки (LAYOUT_BATCH), imgsz в метаданных тот же
+    with tempfile.TemporaryDirectory() as tmp:
+        if fmt == "openvino":
+            extra = {"int8": True, "data": str(_calib_dataset(Path(tmp), calib, model.names))} if int8 else {}
+            _replace(Path(model.export(format="openvino", imgsz=imgsz, dynamic=True, **extra)), dst)
+        else:
+            fp32 = Path(model.export(format="onnx", imgsz=imgsz, dynamic=True, simplify=True))
+            if int8:
+                _quantize_onnx(fp32, dst, calib, imgsz)
+                fp32.unlink()
+            else:
+                _replace(fp32, dst)
+    print(f"{name}: {dst} (imgsz {imgsz})", file=sys.stderr)
+    return dst
+
+
+# ── проверка ─────────────────────────────────────────────────────────────────
+
+def match(ref_xyxy, ref_cls, other_xyxy, other_cls, threshold: float) -> list:
+    """
+    Пары (i, j) детекций одного класса — жадно от самых похожих, без
+    повторов. Боксы — массивы N×4 и M×4, классы — массивы меток.
+    """
+    if not len(ref_cls) or not len(other_cls):
+        return []
+    scores = iou_matrix(np.asarray(ref_xyxy, dtype=float), np.asarray(other_xyxy, dtype=float))
+    scores[np.asarray(ref_cls)[:, None] != np.asarray(other_cls)[None, :]] = 0
+    pairs, used_ref, used_other = [], set(), set()
+    for i, j in zip(*np.unravel_index(np.argsort(-scores, axis=None), scores.shape)):
+        if scores[i, j] < threshold:
+            break
+        if i in used_ref or j in used_other:
+            continue
+        used_ref.add(i)
+        used_other.add(j)
+        pairs.append((i, j))
+    return pairs
+
+
+def check(name: str, fmt: str, int8: bool, pdfs: list, threshold: float) -> dict:
+    cls = model_class(name)
+    ref_model, _, ref_imgsz = load(cls, name, "cpu", "pytorch")
+    exp_model, _, exp_imgsz = load(cls, name, "cpu", fmt, int8)
+    seconds = {"torch": 0.0, "export": 0.0}
+
+    def predict(model, imgsz, img, key=None):
+        t0 = time.perf_counter()
+        boxes = model.predict(img, imgsz=imgsz, device="cpu", verbose=False, **PREDICT[name])[0].boxes
+        if key:
+            seconds[key] += time.perf_counter() - t0
+        return boxes
+
+    # страницы 400 dpi по одной: чертёж A0 в памяти — сотни мегабайт
+    n_pages = n_ref = n_exp = matched = 0
+    conf_diff = []
+    for img in _pages(pdfs, RENDER_DPI):
+        if not n_pages:                                     # прогрев
+            predict(ref_model, ref_imgsz, img)
+            predict(exp_model, exp_imgsz, img)
+        n_pages += 1
+        r = predict(ref_model, ref_imgsz, img, "torch")
+        e = predict(exp_model, exp_imgsz, img, "export")
+        pairs = match(r.xyxy.cpu().numpy(), r.cls.cpu().numpy(),
+                      e.xyxy.cpu().numpy(), e.cls.cpu().numpy(), threshold)
+        n_ref, n_exp, matched = n_ref + len(r.cls), n_exp + len(e.cls), matched + len(pairs)
+        rc, ec = r.conf.cpu().numpy(), e.conf.cpu().numpy()
+        conf_diff += [abs(float(rc[i]) - float(ec[j])) for i, j in pairs]
+    return {
+        "pages":              n_pages,
+        "detections_torch":   n_ref,
+        "detections_export":  n_exp,
+        "recall":             round(matched / n_ref, 3) if n_ref else 1.0,
+        "precision":          round(matched / n_exp, 3) if n_exp else 1.0,
+        "mean_conf_diff":     round(sum(conf_diff) / len(conf_diff), 4) if conf_diff else None,
+        "torch_pages_per_s":  round(n_pages / seconds["torch"], 2),
+        "export_pages_per_s": round(n_pages / seconds["export"], 2),
+        "speedup":            round(seconds["torch"] / seconds["export"], 2),
+    }
+
+
+def main(argv=None) -> None:
+    ap = argparse.ArgumentParser(prog="python -m layout_analyzer.export",
+                                 description="Экспорт детекторов layout_analyzer в ONNX / OpenVINO")
+    ap.add_argument("--format", choices=("onnx", "openvino"), required=True)
+    ap.add_argument("--int8", action="store_true", help="квантовать в int8 (нужен --calib)")
+    ap.add_argument("--calib", nargs="+", type=Path, default=[], help="PDF для калибровки int8")
+    ap.add_argument("--models", nargs="+", choices=list(DETECTORS), default=list(DETECTORS))
+    ap.add_argument("--check", nargs="+", type=Path, default=[],
+                    help="PDF для сравнения экспорта с PyTorch")
+    ap.add_argument("--no-export", action="store_true", help="только проверить готовый экспорт")
+    ap.add_argument("--iou", type=float, default=0.5, help="порог IoU для пары детекций")
+    ap.add_argument("--tolerance", type=float, default=0.95,
+                    help="минимальная доля совпавших детекций (recall и precision)")
+    ap.add_argument("--out", type=Path, help="куда записать результаты проверки (JSON)")
+    args = ap.parse_args(argv)
+    if args.int8 and not args.calib and not args.no_export:
+        ap.error("--int8 требует --calib")
+
+    report, failed = {}, False
+    for name in args.models:
+        if not args.no_export:
+            export(name, args.format, args.int8, args.calib)
+        if args.check:
+            report[name] = r = check(name, args.format, args.int8, args.check, args.iou)
+            ok = min(r["recall"], r["precision"]) >= args.tolerance
+            failed |= not ok
+            print(f"{name:10} {'OK  ' if ok else 'FAIL'} recall {r['recall']}  precision {r['precision']}  "
+                  f"Δconf {r['mean_conf_diff']}  PyTorch {r['torch_pages_per_s']} стр/с  "
+                  f"{args.format}{'-int8' if args.int8 else ''} {r['export_pages_per_s']} стр/с  "
+                  f"×{r['speedup']}", file=sys.stderr)
+
+    if args.out:
+        args.out.write_text(json.dumps(report, ensure_ascii=False, indent=2), encoding="utf-8")
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,204 @@
+"""
+Пост-обработка детекций layout_analyzer: из сырых боксов двух моделей —
+объекты страницы. Отдельно от analyzer.py, чтобы её можно было вызывать
+и замерять без моделей (см. benchmarks/).
+
+Элемент — {'bbox': [x1, y1, x2, y2], 'conf', 'class', 'subtype'} в пикселях
+рендера 400 dpi.
+
+При conf=0.05 на плотном листе детекций сотни, а строк текста в
+спецификации — тысячи, и попарные циклы Python были квадратичными. Поэтому
+фильтры сравнивают боксы матрицами NumPy (iou_matrix, inside_matrix), а
+merge_plain_text — только соседей по сетке (candidate_pairs). Формулы те
+же, что у скалярной iou(), поэтому и результат тот же; сравнение и
+замер — python -m benchmarks.boxes.
+"""
+import math
+from collections import defaultdict
+
+import numpy as np
+
+def boxes(items) -> np.ndarray:
+    """bbox элементов массивом N×4 (float64, как float Python)."""
+    return np.array([it['bbox'] for it in items], dtype=np.float64).reshape(-1, 4)
+
+def iou_matrix(a, b):
+    """IoU всех пар боксов a (N×4) и b (M×4) — та же формула, что у iou()."""
+    xA = np.maximum(a[:, None, 0], b[None, :, 0])
+    yA = np.maximum(a[:, None, 1], b[None, :, 1])
+    xB = np.minimum(a[:, None, 2], b[None, :, 2])
+    yB = np.minimum(a[:, None, 3], b[None, :, 3])
+    inter = np.maximum(0, xB - xA) * np.maximum(0, yB - yA)
+    areaA = ((a[:, 2] - a[:, 0]) * (a[:, 3] - a[:, 1]))[:, None]
+    areaB = ((b[:, 2] - b[:, 0]) * (b[:, 3] - b[:, 1]))[None, :]
+    return inter / (areaA + areaB - inter + 1e-6)
+
+def inside_matrix(outer, inner):
+    """[i, j] — бокс inner[j] целиком внутри outer[i] (границы включительно)."""
+    return ((inner[None, :, 0] >= outer[:, None, 0]) & (inner[None, :, 1] >= outer[:, None, 1])
+            & (inner[None, :, 2] <= outer[:, None, 2]) & (inner[None, :, 3] <= outer[:, None, 3]))
+
+def iou(boxA, boxB):
+    xA, yA = max(boxA[0], boxB[0]), max(boxA[1], boxB[1])
+    xB, yB = min(boxA[2], boxB[2]), min(boxA[3], boxB[3])
+    interW, interH = max(0, xB - xA), max(0, yB - yA)
+    inter = interW * interH
+    areaA = (boxA[2] - boxA[0]) * (boxA[3] - boxA[1])
+    areaB = (boxB[2] - boxB[0]) * (boxB[3] - boxB[1])
+    return inter / (areaA + areaB - inter + 1e-6)
+
+def nms(items, iou_thr=0.9):
+    items = sorted(items, key=lambda x: x['conf'], reverse=True)
+    b = boxes(items)
+    # оставленный бокс гасит все следующие, похожие на него; строка матрицы
+    # за раз — память O(N), а не O(N²)
+    suppressed = np.zeros(len(items), dtype=bool)
+    keep = []
+    for i, it in enumerate(items):
+        if suppressed[i]:
+            continue
+        keep.append(it)
+        suppressed[i+1:] |= ~(iou_matrix(b[i:i+1], b[i+1:])[0] < iou_thr)
+    return keep
+
+def classify_tables(items, page_w, page_h):
+    tables = [it for it in items if it['subtype']=='table']
+    if not tables: return
+    cands = []
+    for t in tables:
+        cx = (t['bbox'][0] + t['bbox'][2]) / 2
+        cy = (t['bbox'][1] + t['bbox'][3]) / 2
+        if cx > page_w * 0.5 and cy > page_h * 0.5:
+            cands.append(t)
+    stamp = max(cands, key=lambda x: x['conf']) if cands else tables[0]
+    for t in tables:
+        t['subtype'] = 'stamp' if t is stamp else 'specification'
+
+def drop_noisy_tables(items, max_overlaps=2):
+    tables = [it for it in items if it['class']=='table']
+    others = [it for it in items if it['class']!='table']
+    tb, ob = boxes(tables), boxes(others)
+    # сколько других боксов задевает каждую таблицу или лежит в ней
+    cnt = ((iou_matrix(tb, ob) > 0) | inside_matrix(tb, ob)).sum(axis=1)
+    kept = [tbl for tbl, c in zip(tables, cnt) if c <= max_overlaps]
+    return kept + others
+
+def drop_nested_tables(items):
+    tables = [it for it in items if it['class']=='table']
+    others = [it for it in items if it['class']!='table']
+    # таблица внутри любого другого бокса отбрасывается
+    nested = inside_matrix(boxes(others), boxes(tables)).any(axis=0)
+    kept = [tbl for tbl, n in zip(tables, nested) if not n]
+    return kept + others
+
+def touching(bi, bj, gap_thr):
+    """Боксы пересекаются, вложены или соседи ближе gap_thr по x или по y."""
+    inter = iou(bi, bj) > 0
+    inside = (
+        (bj[0]>=bi[0] and bj[1]>=bi[1] and bj[2]<=bi[2] and bj[3]<=bi[3]) or
+        (bi[0]>=bj[0] and bi[1]>=bj[1] and bi[2]<=bj[2] and bi[3]<=bj[3])
+    )
+    gap_x = max(0, max(bj[0] - bi[2], bi[0] - bj[2]))
+    vert_ov = min(bi[3], bj[3]) - max(bi[1], bj[1])
+    neigh_h = (gap_x <= gap_thr) and (vert_ov > 0)
+    gap_y = max(0, max(bj[1] - bi[3], bi[1] - bj[3]))
+    hor_ov = min(bi[2], bj[2]) - max(bi[0], bj[0])
+    neigh_v = (gap_y <= gap_thr) and (hor_ov > 0)
+    return inter or inside or neigh_h or neigh_v
+
+def candidate_pairs(bboxes, gap_thr):
+    """
+    Пары (i, j), i < j, по возрастанию, которые могут касаться: боксы
+    раскладываются по равномерной сетке, и сравниваются только лежащие
+    в общих ячейках после расширения на gap_thr. Касающиеся боксы всегда
+    в общей ячейке, так что пар не теряется, а на листе с тысячами строк
+    их число почти линейно, а не квадратично.
+    """
+    n = len(bboxes)
+    if n < 2:
+        return
+    b = np.array(bboxes, dtype=np.float64).reshape(-1, 4)
+    x1, x2 = np.minimum(b[:, 0], b[:, 2]), np.maximum(b[:, 0], b[:, 2])
+    y1, y2 = np.minimum(b[:, 1], b[:, 3]), np.maximum(b[:, 1], b[:, 3])
+    # ячейка — медианный бокс: строка текста занимает в сетке пару ячеек;
+    # но не меньше 1/128 страницы, чтобы бокс во весь лист не лёг в миллионы ячеек
+    cw = max(float(np.median(x2 - x1)), float(x2.max() - x1.min()) / 128, gap_thr, 1.0)
+    ch = max(float(np.median(y2 - y1)), float(y2.max() - y1.min()) / 128, gap_thr, 1.0)
+    pad = gap_thr + 1      # запас на округление: лишняя пара не страшна, потерянная — да
+
+    cells = defaultdict(list)
+    spans = []
+    for i in range(n):
+        cx1, cx2 = math.floor(x1[i] / cw), math.floor(x2[i] / cw)
+        cy1, cy2 = math.floor(y1[i] / ch), math.floor(y2[i] / ch)
+        for cx in range(cx1, cx2 + 1):
+            for cy in range(cy1, cy2 + 1):
+                cells[cx, cy].append(i)
+        spans.append((math.floor((x1[i] - pad) / cw), math.floor((x2[i] + pad) / cw),
+                      math.floor((y1[i] - pad) / ch), math.floor((y2[i] + pad) / ch)))
+
+    for i, (cx1, cx2, cy1, cy2) in enumerate(spans):
+        near = set()
+        for cx in range(cx1, cx2 + 1):
+            for cy in range(cy1, cy2 + 1):
+                near.update(cells.get((cx, cy), ()))
+        for j in sorted(near):
+            if j > i:
+                yield i, j
+
+def merge_plain_text(items, gap_thr=7):
+    texts = [it for it in items if it['class']=='text']
+    others = [it for it in items if it['class']!='text']
+    n = len(texts)
+    adj = [[] for _ in range(n)]
+
+    # пары в том же порядке, что при переборе всех: списки соседей, а с ними
+    # обход групп и порядок сложения conf — прежние, результат побитово тот же
+    for i, j in candidate_pairs([t['bbox'] for t in texts], gap_thr):
+        if touching(texts[i]['bbox'], texts[j]['bbox'], gap_thr):
+            adj[i].append(j)
+            adj[j].append(i)
+
+    seen = [False]*n
+    merged_texts = []
+    for i in range(n):
+        if seen[i]: continue
+        stack, group = [i], []
+        while stack:
+            u = stack.pop()
+            if seen[u]: continue
+            seen[u] = True
+            group.append(u)
+            for v in adj[u]:
+                if not seen[v]:
+                    stack.append(v)
+        xs = [texts[k]['bbox'][0] for k in group] + [texts[k]['bbox'][2] for k in group]
+        ys = [texts[k]['bbox'][1] for k in group] + [texts[k]['bbox'][3] for k in group]
+        bbox = [min(xs), min(ys), max(xs), max(ys)]
+        conf = sum(texts[k]['conf'] for k in group) / len(group)
+        merged_texts.append({
+            'bbox': bbox,
+            'conf': conf,
+            'class': 'text',
+            'subtype': 'plain_text'
+        })
+    return merged_texts + others
+
+def drop_drawings_with_text(items, min_texts=2):
+    drawings = [it for it in items if it['class']=='drawing']
+    others   = [it for it in items if it['class']!='drawing']
+    texts    = [it for it in items if it['class']=='text' and it['subtype']=='plain_text']
+    db, tb = boxes(drawings), boxes(texts)
+    cnt = ((iou_matrix(db, tb) > 0) | inside_matrix(db, tb)).sum(axis=1)
+    kept = [dr for dr, c in zip(drawings, cnt) if c < min_texts]
+    return kept + others
+
+def postprocess(items, page_w, page_h):
+    """Все шаги пост-обработки по порядку; items изменяются на месте."""
+    classify_tables(items, page_w, page_h)
+    items = nms(items)
+    items = drop_noisy_tables(items)
+    items = drop_nested_tables(items)
+    items = merge_plain_text(items)
+    items = drop_drawings_with_text(items)
+    return items
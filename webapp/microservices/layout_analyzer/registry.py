@@ -0,0 +1,148 @@
+"""
+Веса layout_analyzer на диске: всё, что загружают модели, лежит в weights/
+и сверяется с закреплёнными sha256 (weights/SHA256SUMS, формат sha256sum).
+Сервис стартует без сети и не загрузит молча подменённый или недокачанный файл.
+
+    cd microservices
+    python -m layout_analyzer.registry fetch     # скачать недостающие веса из HF Hub
+    python -m layout_analyzer.registry pin       # закрепить sha256 всех файлов weights/
+    python -m layout_analyzer.registry verify    # сверить (код 1 при расхождении)
+
+Файл, которого нет в weights/, скачивается из HF Hub один раз прямо в
+weights/ (без второй копии в кэше HF) и дальше берётся локально; с
+LAYOUT_OFFLINE=1 в сеть не ходим вовсе — отсутствующий файл будет ошибкой.
+Файл с другой суммой — ошибка. Файл без закреплённой суммы загружается с
+предупреждением в лог, а с LAYOUT_OFFLINE=1 — тоже ошибка: в изолированной
+установке веса приходят только вместе с их суммами.
+"""
+import os
+import sys
+import hashlib
+import logging
+import argparse
+from pathlib import Path
+from typing import Optional
+
+log = logging.getLogger(__name__)
+
+WEIGHTS = Path(__file__).resolve().parent / "weights"
+SUMS    = WEIGHTS / "SHA256SUMS"
+HEADER  = ("# sha256 весов layout_analyzer (формат sha256sum), пути — от weights/\n"
+           "# обновить: python -m layout_analyzer.registry fetch && python -m layout_analyzer.registry pin\n")
+
+LAYOUT_OFFLINE = os.getenv("LAYOUT_OFFLINE", "0") == "1"
+
+
+def sha256(path: Path) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def pins() -> dict:
+    """Закреплённые суммы: путь относительно weights/ → sha256."""
+    if not SUMS.exists():
+        return {}
+    out = {}
+    for line in SUMS.read_text(encoding="utf-8").splitlines():
+        if line.strip() and not line.startswith("#"):
+            digest, name = line.split(maxsplit=1)
+            out[name.lstrip("*")] = digest
+    return out
+
+
+def _files(path: Path) -> list:
+    """
+    Файлы модели: сам файл или всё содержимое папки (экспорт OpenVINO).
+    Скрытые пропускаются — в том числе .cache/, служебная папка загрузок HF.
+    """
+    if path.is_file():
+        return [path]
+    return sorted(p for p in path.rglob("*")
+                  if p.is_file() and not any(part.startswith(".") for part in p.relative_to(path).parts))
+
+
+def verify(path: Path, offline: bool = LAYOUT_OFFLINE) -> Path:
+    """
+    path, если его файлы совпадают с закреплёнными суммами; иначе ValueError.
+    Незакреплённый файл — предупреждение, а offline — тоже ValueError.
+    """
+    pinned = pins()
+    for f in _files(path):
+        rel = f.relative_to(WEIGHTS).as_posix()
+        if rel not in pinned:
+            if offline:
+                raise ValueError(f"{rel}: sha256 не закреплён в {SUMS}, а LAYOUT_OFFLINE=1; "
+                                 f"закрепите: python -m layout_analyzer.registry pin")
+            log.warning("%s: sha256 не закреплён (python -m layout_analyzer.registry pin)", rel)
+        elif sha256(f) != pinned[rel]:
+            raise ValueError(f"{rel}: sha256 не совпадает с закреплённым в {SUMS}")
+    return path
+
+
+def fetch(repo: Optional[str], filename: str, offline: bool = LAYOUT_OFFLINE) -> Path:
+    """weights/<filename>; если его нет — скачивается из HF Hub (кроме offline)."""
+    dst = WEIGHTS / filename
+    if dst.exists():
+        return dst
+    if repo is None:
+        raise FileNotFoundError(f"{dst} не найден")
+    if offline:
+        raise FileNotFoundError(f"{dst} не найден, а LAYOUT_OFFLINE=1; "
+                                f"скачайте заранее: python -m layout_analyzer.registry fetch")
+    from huggingface_hub import hf_hub_download
+    # с local_dir файл докачивается во временный в weights/.cache/huggingface
+    # и переименовывается на место — недокачанный не подхватится
+    dst = Path(hf_hub_download(repo_id=repo, filename=filename, local_dir=WEIGHTS))
+    log.info("%s скачан из %s", dst, repo)
+    return dst
+
+
+def pin() -> dict:
+    """Записывает суммы всех файлов weights/ в SHA256SUMS."""
+    WEIGHTS.mkdir(exist_ok=True)
+    sums = {f.relative_to(WEIGHTS).as_posix(): sha256(f)
+            for f in _files(WEIGHTS) if f != SUMS and not f.name.endswith(".part")}
+    SUMS.write_text(HEADER + "".join(f"{d}  {name}\n" for name, d in sorted(sums.items())),
+                    encoding="utf-8")
+    return sums
+
+
+def main(argv=None) -> None:
+    from layout_analyzer.backends import DETECTORS
+
+    ap = argparse.ArgumentParser(prog="python -m layout_analyzer.registry",
+                                 description="Веса layout_analyzer: скачать, закрепить, сверить")
+    ap.add_argument("command", choices=("fetch", "pin", "verify"))
+    args = ap.parse_args(argv)
+
+    if args.command == "fetch":
+        for repo, filename, _ in DETECTORS.values():
+            if repo is None and not (WEIGHTS / filename).exists():
+                print(f"{WEIGHTS / filename}: нет в HF Hub, положите файл вручную", file=sys.stderr)
+                continue
+            print(fetch(repo, filename, offline=False), file=sys.stderr)
+    elif args.command == "pin":
+        for name in pin():
+            print(name, file=sys.stderr)
+        print(f"закреплено в {SUMS}", file=sys.stderr)
+    else:
+        bad, pinned = 0, pins()
+        for name, digest in pinned.items():
+            path = WEIGHTS / name
+            ok = path.exists() and sha256(path) == digest
+            bad += not ok
+            print(f"{'OK  ' if ok else 'FAIL'} {name}", file=sys.stderr)
+        for f in _files(WEIGHTS) if WEIGHTS.is_dir() else []:
+            name = f.relative_to(WEIGHTS).as_posix()
+            if f != SUMS and name not in pinned and not f.name.endswith(".part"):
+                bad += LAYOUT_OFFLINE      # в offline сервис такой файл не загрузит
+                print(f"{'FAIL' if LAYOUT_OFFLINE else '??? '} {name}: sha256 не закреплён", file=sys.stderr)
+        if bad:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,144 @@
+"""
+Проверка LAYOUT_RENDER=detector против full на страницах PDF.
+
+    cd microservices
+    python -m layout_analyzer.render_check                # синтетические PDF (benchmarks/synth.py)
+    python -m layout_analyzer.render_check образцы/*.pdf
+    python -m layout_analyzer.render_check образцы/ --iou 0.5 --tolerance 0.95 --out render.json
+
+Те же детекторы (LAYOUT_DEVICE / LAYOUT_BACKEND, как в сервисе) размечают
+каждую страницу дважды: по растру 400 dpi (full) и по растру в размер
+входа моделей (detector). Боксы detector пересчитываются в пиксели 400 dpi,
+как в сервисе, и сопоставляются с full так же, как в export --check: по
+классу и IoU ≥ --iou. Доля совпавших (recall — от full, precision — от
+detector) считается для каждой модели и для итоговой разметки после
+пост-обработки; если где-то она ниже --tolerance — код выхода 1.
+
+Делать detector режимом по умолчанию — только когда проверка проходит на
+типичных чертежах. Входы моделей в двух режимах заметно различаются и без
+моделей: на листе A1 (synth sheet) уменьшение 400 dpi без сглаживания теряет
+тонкие линии — PSNR 13.7 дБ, «чернил» 1.7% против 9.1% у detector
+(python -m benchmarks.render).
+"""
+import sys
+import json
+import time
+import argparse
+import tempfile
+from pathlib import Path
+
+import numpy as np
+
+sys.path.append(str(Path(__file__).resolve().parent.parent))  # microservices/ → пакет common
+from common.rasters import RENDER_DPI, PageRasters
+from layout_analyzer.analyzer import _page, _predict, models
+from layout_analyzer.export import match
+
+
+def _boxes(res, sx: float = 1.0, sy: float = 1.0) -> tuple:
+    """(боксы N×4 в пикселях 400 dpi, классы) одного результата predict."""
+    xyxy = res.boxes.xyxy.cpu().numpy().reshape(-1, 4) * [sx, sy, sx, sy]
+    return xyxy, res.boxes.cls.cpu().numpy()
+
+
+def _objects(page: dict) -> tuple:
+    """(боксы, метки класс/подтип) итоговой разметки страницы."""
+    objs = page["objects"]
+    xyxy = np.array([o["bbox"] for o in objs], dtype=float).reshape(-1, 4)
+    return xyxy, np.array([f"{o['class']}/{o['subtype']}" for o in objs])
+
+
+def check(pdfs: list, threshold: float) -> dict:
+    names = ["doclayout", "custom"]             # порядок аргументов _page
+    long_side = max(imgsz for _, _, imgsz in models().values())
+    counts = {key: {"full": 0, "detector": 0, "matched": 0} for key in names + ["layout"]}
+    seconds = {"full": 0.0, "detector": 0.0}
+    n_pages = 0
+
+    def add(key, ref, other):
+        c = counts[key]
+        c["full"]     += len(ref[1])
+        c["detector"] += len(other[1])
+        c["matched"]  += len(match(*ref, *other, threshold))
+
+    for pdf_path in pdfs:
+        # PDF не из хранилища задач — кэш растров не участвует
+        with PageRasters(pdf_path, dpi=RENDER_DPI) as rasters:
+            for idx in range(len(rasters)):
+                t0 = time.perf_counter()
+                full = rasters.bgr(idx)
+                full_res = {name: _predict(name, [full])[0] for name in names}
+                seconds["full"] += time.perf_counter() - t0
+
+                t0 = time.perf_counter()
+                small = rasters.render(idx, rasters.fit_dpi(idx, long_side))
+                small_res = {name: _predict(name, [small])[0] for name in names}
+                seconds["detector"] += time.perf_counter() - t0
+
+                size_400 = (full.shape[1], full.shape[0])
+                sx, sy = size_400[0] / small.shape[1], size_400[1] / small.shape[0]
+                for name in names:
+                    add(name, _boxes(full_res[name]), _boxes(small_res[name], sx, sy))
+                add("layout",
+                    _objects(_page(idx, full.shape, size_400, full_res[names[0]], full_res[names[1]])),
+                    _objects(_page(idx, small.shape, size_400, small_res[names[0]], small_res[names[1]])))
+                n_pages += 1
+                del full, full_res
+
+    report = {"pages": n_pages}
+    for key, c in counts.items():
+        report[key] = {
+            "detections_full":     c["full"],
+            "detections_detector": c["detector"],
+            "recall":              round(c["matched"] / c["full"], 3) if c["full"] else 1.0,
+            "precision":           round(c["matched"] / c["detector"], 3) if c["detector"] else 1.0,
+        }
+    report["full_pages_per_s"]     = round(n_pages / seconds["full"], 2) if seconds["full"] else None
+    report["detector_pages_per_s"] = round(n_pages / seconds["detector"], 2) if seconds["detector"] else None
+    return report
+
+
+def main(argv=None) -> None:
+    ap = argparse.ArgumentParser(prog="python -m layout_analyzer.render_check",
+                                 description="Разметка по растру detector против full (400 dpi)")
+    ap.add_argument("inputs", nargs="*", type=Path,
+                    help="PDF или папки (по умолчанию — синтетические документы)")
+    ap.add_argument("--pages", type=int, default=3, help="страниц в синтетических документах")
+    ap.add_argument("--iou", type=float, default=0.5, help="порог IoU для пары детекций")
+    ap.add_argument("--tolerance", type=float, default=0.95,
+                    help="минимальная доля совпавших детекций (recall и precision)")
+    ap.add_argument("--out", type=Path, help="куда записать результаты (JSON)")
+    args = ap.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        pdfs = []
+        for p in args.inputs:
+            pdfs += sorted(p.rglob("*.pdf")) if p.is_dir() else [p]
+        if not args.inputs:
+            # те же документы, что у python -m benchmarks.render (webapp/benchmarks)
+            sys.path.append(str(Path(__file__).resolve().parents[2]))
+            from benchmarks import synth
+            for kind in synth.KINDS:
+                pdfs.append(Path(tmp) / f"{kind}.pdf")
+                pdfs[-1].write_bytes(synth.generate(kind, args.pages)[0])
+        report = check(pdfs, args.iou)
+
+    failed = False
+    for key, r in report.items():
+        if not isinstance(r, dict):
+            continue
+        ok = min(r["recall"], r["precision"]) >= args.tolerance
+        failed |= not ok
+        print(f"{key:10} {'OK  ' if ok else 'FAIL'} recall {r['recall']}  precision {r['precision']}  "
+              f"({r['detections_full']} full / {r['detections_detector']} detector)", file=sys.stderr)
+    print(f"{report['pages']} стр.: full {report['full_pages_per_s']} стр/с, "
+          f"detector {report['detector_pages_per_s']} стр/с", file=sys.stderr)
+
+    if args.out:
+        args.out.write_text(json.dumps(report, ensure_ascii=False, indent=2), encoding="utf-8")
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,29 +1,40 @@
-import os
+import sys
 import json
-import tempfile
+from pathlib import Path
+from typing import Optional
 
-from fastapi import FastAPI, UploadFile, File, HTTPException
-from fastapi.responses import JSONResponse
+from fastapi import FastAPI, UploadFile, File, Form, HTTPException, Request
 
-from combiner import combine_structure
+sys.path.append(str(Path(__file__).resolve().parent.parent))  # microservices/ → пакет common
+from common import metrics
+from common.codec import encode_response, read_part
+from common.storage import pdf_source
+from common.streaming import stream_pdf, wants_ndjson
+from common.uploads import LimitUploadSize
+from combiner import combine_structure, iter_combine
 
 app = FastAPI(title="Layout Combiner Service")
+app.add_middleware(LimitUploadSize)
+metrics.install(app, "layout_combiner")
 
 @app.post("/combine", summary="Объединить layout и pdfminer JSON")
 async def combine_endpoint(
-    file: UploadFile = File(..., description="Исходный PDF"),
+    request: Request,
+    file: Optional[UploadFile] = File(None, description="Исходный PDF"),
     struct_file: UploadFile = File(..., description="JSON от layout_analyzer"),
-    pdfminer_file: UploadFile = File(..., description="JSON от pdf_parser")
+    pdfminer_file: UploadFile = File(..., description="JSON от pdf_parser"),
+    job_id: Optional[str] = Form(None, description="Задача шлюза, PDF которой лежит в общем хранилище"),
+    id_counters: Optional[str] = Form(None, description="JSON {table, cell, text}: продолжить нумерацию id"),
+    first_page: int = Form(1, description="Номер страницы документа, с которой начинается PDF")
 ):
-    # 1) Проверяем, что первым пришёл PDF
-    if file.content_type != "application/pdf":
+    # 1) PDF приходит либо файлом, либо ссылкой на задачу (job_id)
+    if job_id is None and (file is None or file.content_type != "application/pdf"):
         raise HTTPException(status_code=400, detail="Требуется PDF-файл")
 
-    # 2) Загружаем JSON с layout-анализом
-    raw_struct = await struct_file.read()
+    # 2) Загружаем JSON с layout-анализом (JSON или msgpack, возможно сжатый)
     try:
-        struct_dict = json.loads(raw_struct)
-    except json.JSONDecodeError as e:
+        struct_dict = await read_part(struct_file)
+    except Exception as e:
         raise HTTPException(status_code=400, detail=f"Невалидный JSON struct_file: {e}")
 
     pages = struct_dict.get("pages")
@@ -34,28 +45,36 @@ async def combine_endpoint(
         )
 
     # 3) Загружаем JSON от PDFParser
-    raw_pdfm = await pdfminer_file.read()
     try:
-        pdfm_dict = json.loads(raw_pdfm)
-    except json.JSONDecodeError as e:
+        pdfm_dict = await read_part(pdfminer_file)
+    except Exception as e:
         raise HTTPException(status_code=400, detail=f"Невалидный JSON pdfminer_file: {e}")
 
-    # 4) Сохраняем PDF во временный файл
-    pdf_bytes = await file.read()
-    with tempfile.NamedTemporaryFile(delete=False, suffix=".pdf") as tmp:
-        tmp.write(pdf_bytes)
-        pdf_path = tmp.name
-
+    # при обработке по страницам шлюз передаёт счётчики id с прошлых страниц,
+    # чтобы id совпадали с обработкой всего документа за раз
     try:
-        # 5) Вызываем объединитель, передаём список страниц и полный pdfminer-словарь
-        combined = combine_structure(pages, pdfm_dict, pdf_path)
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Ошибка в combine_structure: {e}")
-    finally:
-        os.remove(pdf_path)
+        counters = json.loads(id_counters) if id_counters else {}
+    except json.JSONDecodeError as e:
+        raise HTTPException(status_code=400, detail=f"Невалидный JSON id_counters: {e}")
+
+    if wants_ndjson(request):
+        # постранично: PDF (и временный файл) живут, пока не уйдёт последняя страница
+        return await stream_pdf(pdf_source(file, job_id), lambda pdf_path:
+                                iter_combine(pages, pdfm_dict, pdf_path, counters, first_page))
+
+    # 4) Берём PDF из общего хранилища или сохраняем во временный файл
+    async with pdf_source(file, job_id) as pdf_path:
+        try:
+            # 5) Вызываем объединитель, передаём список страниц и полный pdfminer-словарь
+            combined = combine_structure(pages, pdfm_dict, pdf_path, counters, first_page)
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Ошибка в combine_structure: {e}")
 
-    # 6) Возвращаем готовый объединённый JSON
-    return JSONResponse(content=combined)
+    # 6) Возвращаем готовый объединённый JSON (или msgpack — по Accept);
+    #    счётчики id для следующей порции страниц — в заголовке
+    resp = encode_response(combined, request)
+    resp.headers["X-Id-Counters"] = json.dumps(counters)
+    return resp
 
 if __name__ == "__main__":
     import uvicorn
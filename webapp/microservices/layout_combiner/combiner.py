@@ -1,8 +1,9 @@
+import sys
 import json
 import cv2
 import numpy as np
-import pypdfium2 as pdfium
 import pytesseract
+from pathlib import Path
 
 try:
     import easyocr
@@ -12,6 +13,10 @@ except ImportError:
 
 from sklearn.cluster import DBSCAN
 
+sys.path.append(str(Path(__file__).resolve().parent.parent))  # microservices/ → пакет common
+from common.metrics import timed
+from common.rasters import PageRasters
+
 # параметры рендеринга
 RENDER_DPI = 400
 SCALE = RENDER_DPI / 72.0
@@ -51,6 +56,7 @@ def ocr_tesseract(img):
     text = " ".join(words).strip()
     return text, conf
 
+@timed("ocr")
 def ocr_combined(img):
     text, conf = ocr_tesseract(img)
     source = 'ocr_tesseract'
@@ -62,6 +68,7 @@ def ocr_combined(img):
         conf = None
     return text, source, conf
 
+@timed("table_cells")
 def detect_table_cells(img):
     if img.size == 0:
         return []
@@ -96,34 +103,44 @@ def detect_table_cells(img):
             })
     return cells
 
-def combine_structure(struct_data: list, pdfminer_data: dict, pdf_path: str) -> list:
+def render_page(rasters, idx):
+    """
+    Страница в BGR при RENDER_DPI и её высота в пунктах. Растр берётся из
+    кэша задачи, если layout_analyzer его уже отрендерил (только чтение).
+    """
+    _, h_pts = rasters.size_pts(idx)
+    return rasters.bgr(idx), h_pts
+
+def combine_structure(struct_data: list, pdfminer_data: dict, pdf_path: str,
+                      id_counters: dict = None, first_page: int = 1) -> list:
     """
     struct_data: output from layout_analyzer (list of pages with 'objects')
     pdfminer_data: output from pdf_parser {'pages': [...]}
     pdf_path: path to PDF file to render pages
+    id_counters: счётчики id, с которых продолжить (при обработке по страницам)
+    first_page: номер страницы документа, которой соответствует 1-я страница pdf_path
     """
-    # 1. Рендерим все страницы и запоминаем высоты
-    pdf = pdfium.PdfDocument(pdf_path)
-    page_images = []
-    page_heights_pts = []
-    for i in range(len(pdf)):
-        pg = pdf.get_page(i)
-        _, h_pts = pg.get_size()
-        page_heights_pts.append(h_pts)
-        bmp = pg.render(scale=RENDER_DPI/72.0)
-        img = bmp.to_pil()
-        page_images.append(cv2.cvtColor(np.array(img), cv2.COLOR_RGB2BGR))
-        pg.close()
-    pdf.close()
+    return list(iter_combine(struct_data, pdfminer_data, pdf_path, id_counters, first_page))
 
-    combined = []
-    id_counters = {'table': 0, 'cell': 0, 'text': 0}
+def iter_combine(struct_data, pdfminer_data, pdf_path, id_counters=None, first_page=1):
+    """
+    То же, что combine_structure, но отдаёт страницы по одной.
+    id_counters изменяется на месте: после прохода в нём значения,
+    с которых нужно продолжить нумерацию на следующих страницах.
+    """
+    # 1. Страницы берём по мере обработки, а не все сразу
+    with PageRasters(pdf_path, dpi=RENDER_DPI) as rasters:
+        yield from _combine_pages(struct_data, pdfminer_data, rasters, id_counters, first_page)
+
+def _combine_pages(struct_data, pdfminer_data, rasters, id_counters, first_page):
+    if id_counters is None:
+        id_counters = {}
+    for key in ('table', 'cell', 'text'):
+        id_counters.setdefault(key, 0)
 
     # 2. Проходим по каждому результату layout_analyzer
     for pg in struct_data:
-        idx = pg['page'] - 1
-        img = page_images[idx]
-        h_pts = page_heights_pts[idx]
+        img, h_pts = render_page(rasters, pg['page'] - first_page)
         # находим соответствующую страницу из pdfminer
         pm_page = next(
             (p for p in pdfminer_data.get('pages', [])
@@ -251,6 +268,4 @@ def combine_structure(struct_data: list, pdfminer_data: dict, pdf_path: str) ->
                 'subtype': dr['subtype']
             })
 
-        combined.append(out)
-
-    return combined
+        yield out
@@ -1,21 +1,37 @@
-import os,tempfile
-from fastapi import FastAPI,UploadFile,File,HTTPException
-from fastapi.responses import JSONResponse
-from parser import parse_pdf
+import sys
+from pathlib import Path
+from typing import Optional
+from fastapi import FastAPI,UploadFile,File,Form,Request,HTTPException
+sys.path.append(str(Path(__file__).resolve().parent.parent))  # microservices/ → пакет common
+from common import metrics
+from common.codec import encode_response
+from common.storage import pdf_source
+from common.streaming import stream_pdf, wants_ndjson
+from common.uploads import LimitUploadSize
+from parser import ENGINES, parse_pdf, iter_pages
 
 app=FastAPI(title="PDFParser Service")
+app.add_middleware(LimitUploadSize)
+metrics.install(app, "pdf_parser")
 
 @app.post("/parse")
-async def parse_endpoint(file:UploadFile=File(...)):
-    if file.content_type!="application/pdf": raise HTTPException(400,"Нужен PDF")
-    data=await file.read()
-    with tempfile.NamedTemporaryFile(delete=False,suffix=".pdf") as tmp:
-        tmp.write(data); path=tmp.name
-    try:
-        res=parse_pdf(path)
-    finally:
-        os.remove(path)
-    return JSONResponse(content=res)
+async def parse_endpoint(request:Request,file:Optional[UploadFile]=File(None),job_id:Optional[str]=Form(None),
+                         first_page:int=Form(1),last_page:Optional[int]=Form(None),
+                         engine:Optional[str]=Form(None)):
+    # job_id — PDF уже лежит в общем хранилище шлюза, иначе берём загруженный файл
+    # first_page..last_page — только эти страницы (с 1, включительно; по умолчанию все)
+    if first_page<1 or (last_page is not None and last_page<first_page):
+        raise HTTPException(status_code=400,detail="Неверный диапазон страниц")
+    # engine — pdfminer | pdfium, по умолчанию PARSE_ENGINE сервиса
+    if engine is not None and engine not in ENGINES:
+        raise HTTPException(status_code=400,detail=f"engine: одно из {', '.join(ENGINES)}")
+    last=last_page or 0
+    if wants_ndjson(request):  # постранично, по мере разбора: в памяти одна страница
+        return await stream_pdf(pdf_source(file,job_id),lambda path:iter_pages(path,first=first_page,last=last,engine=engine))
+    async with pdf_source(file,job_id) as path:
+        res=parse_pdf(path,first=first_page,last=last,engine=engine)
+    # формат и сжатие ответа — по Accept / Accept-Encoding, по умолчанию JSON
+    return encode_response(res,request)
 
 if __name__=="__main__":
-    import uvicorn; uvicorn.run(app,host="0.0.0.0",port=8001,reload=True)
\ No newline at end of file
+    import uvicorn; uvicorn.run(app,host="0.0.0.0",port=8001,reload=True)
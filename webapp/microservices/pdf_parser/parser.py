@@ -1,6 +1,35 @@
+import os
+import sys
 import json
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
 from pdfminer.high_level import extract_pages
 from pdfminer.layout import LTTextBox, LTTextLine, LTImage, LTFigure
+from pdfminer.pdfpage import PDFPage
+import pypdfium2 as pdfium
+
+sys.path.append(str(Path(__file__).resolve().parent.parent))  # microservices/ → пакет common
+from common.metrics import timed_iter
+from common.pdfium_lock import pdfium_lock
+from pdf_parser.pdfium_text import page_objects
+
+# движок извлечения текста (можно выбрать и в запросе /parse):
+#   pdfminer — эталонный, медленный (чистый Python);
+#   pdfium   — pypdfium2, во много раз быстрее; блоки близки к pdfminer, но не
+#              идентичны. Повёрнутые страницы и PDF, которые pdfium не открыл,
+#              всё равно разбирает pdfminer. При смене движка поднимите
+#              CACHE_VERSION_PARSE шлюза
+ENGINES      = ("pdfminer", "pdfium")
+PARSE_ENGINE = os.getenv("PARSE_ENGINE", "pdfminer")
+
+# разбор layout в pdfminer — чистый Python на одном ядре. С PARSE_WORKERS > 1
+# документ делится на куски по PARSE_CHUNK_PAGES страниц, которые разбирают
+# процессы пула; страницы отдаются по порядку, результат тот же, что без пула
+PARSE_WORKERS     = int(os.getenv("PARSE_WORKERS", "1"))
+PARSE_CHUNK_PAGES = int(os.getenv("PARSE_CHUNK_PAGES", "8"))
+
+_pools = {}
 
 def parse_layout(element):
     objs = []
@@ -23,11 +52,99 @@ def parse_layout(element):
             objs.extend(parse_layout(child))
     return objs
 
-def parse_pdf(pdf_path):
-    document = {"pages": []}
-    for page_number, layout in enumerate(extract_pages(pdf_path), start=1):
+def iter_pages(pdf_path, workers=None, first=1, last=0, engine=None):
+    """
+    Страницы по одной: для потоковой выдачи (NDJSON), пока парсятся следующие.
+    first..last — диапазон страниц (с 1; last=0 — до конца документа),
+    номера страниц в ответе остаются номерами в документе.
+    workers — процессов pdfminer (по умолчанию PARSE_WORKERS).
+    engine — pdfminer | pdfium (по умолчанию PARSE_ENGINE).
+    """
+    engine  = engine or PARSE_ENGINE
+    workers = PARSE_WORKERS if workers is None else workers
+    if engine == "pdfium":
+        pages = _iter_pdfium(pdf_path, first, last)
+    elif workers > 1:
+        pages = _iter_parallel(pdf_path, workers, first, last)
+    else:
+        pages = _iter_range(pdf_path, first, last)
+    # время каждого шага — разбор страницы (или ожидание её от пула)
+    yield from timed_iter(pages, engine)
+
+def parse_pdf(pdf_path, workers=None, first=1, last=0, engine=None):
+    return {"pages": list(iter_pages(pdf_path, workers, first, last, engine))}
+
+def page_count(pdf_path) -> int:
+    with open(pdf_path, "rb") as f:
+        return sum(1 for _ in PDFPage.get_pages(f))
+
+def _iter_range(pdf_path, first=1, last=0):
+    """Страницы first..last (с 1; last=0 — до конца); extract_pages ленив."""
+    if last and first > last:
+        # пустой page_numbers pdfminer понимает как «все страницы»
+        return
+    page_numbers = range(first - 1, last or sys.maxsize) if first > 1 or last else None
+    layouts = extract_pages(pdf_path, page_numbers=page_numbers, maxpages=last)
+    for page_number, layout in enumerate(layouts, start=first):
         page_obj = {"page_number": page_number, "objects": []}
         for element in layout:
             page_obj["objects"].extend(parse_layout(element))
-        document["pages"].append(page_obj)
-    return document
\ No newline at end of file
+        yield page_obj
+
+def _iter_pdfium(pdf_path, first=1, last=0):
+    # pdfium не потокобезопасен, а потоковые /parse идут в пуле потоков:
+    # каждый вызов — под общим замком, но не между страницами (шаги
+    # генератора выполняют разные потоки пула)
+    try:
+        with pdfium_lock:
+            pdf = pdfium.PdfDocument(str(pdf_path))
+    except pdfium.PdfiumError:
+        yield from _iter_range(pdf_path, first, last)
+        return
+    try:
+        with pdfium_lock:
+            last = min(last, len(pdf)) if last else len(pdf)
+        for page_number in range(first, last + 1):
+            with pdfium_lock:
+                page = pdf[page_number - 1]
+                try:
+                    objs = page_objects(page)
+                finally:
+                    page.close()
+            if objs is None:             # повёрнутая страница — pdfminer
+                yield from _iter_range(pdf_path, page_number, page_number)
+            else:
+                yield {"page_number": page_number, "objects": objs}
+    finally:
+        with pdfium_lock:
+            pdf.close()
+
+def _parse_range(pdf_path, first, last) -> list:
+    """Выполняется в процессе пула: кусок документа целиком."""
+    return list(_iter_range(pdf_path, first, last))
+
+def _pool(workers) -> ProcessPoolExecutor:
+    # spawn: сервис многопоточный (пул anyio), а fork копирует чужие замки
+    if workers not in _pools:
+        _pools[workers] = ProcessPoolExecutor(max_workers=workers,
+                                              mp_context=multiprocessing.get_context("spawn"))
+    return _pools[workers]
+
+def _iter_parallel(pdf_path, workers, first=1, last=0):
+    total = page_count(pdf_path)
+    last  = min(last, total) if last else total
+    if first > last:                        # диапазон за концом документа
+        return
+    if last - first + 1 <= PARSE_CHUNK_PAGES:
+        yield from _iter_range(pdf_path, first, last)
+        return
+    pool = _pool(workers)
+    futures = [pool.submit(_parse_range, str(pdf_path), start, min(start + PARSE_CHUNK_PAGES - 1, last))
+               for start in range(first, last + 1, PARSE_CHUNK_PAGES)]
+    try:
+        for fut in futures:
+            yield from fut.result()
+    finally:
+        # клиент отключился или кусок упал — остальные куски не нужны
+        for fut in futures:
+            fut.cancel()
@@ -0,0 +1,109 @@
+"""
+Текст и изображения страницы через pdfium (pypdfium2): content stream и
+шрифты разбираются в C, на Python остаётся только сборка символов в строки
+и строк в блоки — во много раз быстрее pdfminer.
+
+Объекты — в формате parser.parse_layout: {"type": "text", "text", "bbox"}
+и {"type": "image", "name", "bbox"}, bbox в пунктах PDF от нижнего левого
+угла. Блоки собираются по правилам LAParams pdfminer по умолчанию
+(char_margin=2, line_margin=0.5, соседние строки выровнены и одной высоты),
+поэтому близки к его LTTextBox, но побайтно не совпадают; насколько —
+показывает python -m benchmarks.engines. Имена изображений порядковые
+(Im1, Im2, …): имён ресурсов pdfium не отдаёт.
+"""
+from typing import Optional
+
+import pypdfium2.raw as pdfium_c
+
+CHAR_MARGIN = 2.0    # разрыв больше CHAR_MARGIN ширин символа — новая строка
+LINE_MARGIN = 0.5    # строки ближе LINE_MARGIN высоты строки — один блок
+
+BREAKS = ("\r", "\n")
+
+
+def page_objects(page) -> Optional[list]:
+    """
+    Объекты страницы или None, если её нужно разобрать pdfminer:
+    у повёрнутой страницы pdfium отдаёт координаты без учёта /Rotate.
+    """
+    if page.get_rotation():
+        return None
+    textpage = page.get_textpage()
+    try:
+        lines = _lines(textpage)
+    finally:
+        textpage.close()
+
+    objs = [{"type": "text", "text": text, "bbox": bbox} for text, bbox in _boxes(lines)]
+    # изображения и внутри форм (как LTImage внутри LTFigure у pdfminer)
+    images = page.get_objects(filter=(pdfium_c.FPDF_PAGEOBJ_IMAGE,), max_depth=15)
+    for n, img in enumerate(images, start=1):
+        objs.append({"type": "image", "name": f"Im{n}", "bbox": list(img.get_bounds())})
+    return objs
+
+
+def _lines(textpage) -> list:
+    """Строки [x0, y0, x1, y1, символы] в порядке content stream."""
+    lines, cur = [], None
+    for i in range(textpage.count_chars()):
+        ch = chr(pdfium_c.FPDFText_GetUnicode(textpage.raw, i))
+        if ch in BREAKS:                 # перевод строки, вставленный pdfium
+            cur = None
+            continue
+        if ch.isspace():
+            if cur is not None:
+                cur[4].append(" ")
+            continue
+        # «свободный» бокс: по размеру шрифта, а не контуру глифа — у шрифтов
+        # без встроенных контуров точный бокс бывает нулевой высоты
+        x0, y0, x1, y1 = textpage.get_charbox(i, loose=True)
+        if cur is not None:
+            height  = min(y1 - y0, cur[3] - cur[1])
+            overlap = min(y1, cur[3]) - max(y0, cur[1])
+            if (overlap < 0.5 * height
+                    or x0 - cur[2] > CHAR_MARGIN * max(x1 - x0, 0.5 * height)
+                    or x1 < cur[0]):
+                cur = None
+        if cur is None:
+            cur = [x0, y0, x1, y1, []]
+            lines.append(cur)
+        else:
+            cur[0], cur[1] = min(cur[0], x0), min(cur[1], y0)
+            cur[2], cur[3] = max(cur[2], x1), max(cur[3], y1)
+        cur[4].append(ch)
+    return [ln[:4] + ["".join(ln[4]).strip()] for ln in lines]
+
+
+def _neighbours(a: list, b: list) -> bool:
+    """b продолжает блок строки a — те же условия, что LTTextLine.find_neighbors."""
+    d = LINE_MARGIN * (a[3] - a[1])
+    return (b[0] <= a[2] and a[0] <= b[2]                       # перекрываются по x
+            and b[3] >= a[1] - d and b[1] <= a[3] + d           # близко по y
+            and abs((b[3] - b[1]) - (a[3] - a[1])) <= d         # одной высоты
+            and (abs(b[0] - a[0]) <= d                          # выровнены слева,
+                 or abs(b[2] - a[2]) <= d                       # справа
+                 or abs((b[0] + b[2]) - (a[0] + a[2])) <= 2 * d))   # или по центру
+
+
+def _boxes(lines: list) -> list:
+    """(текст, bbox) блоков: строки сверху вниз, соседние — в один блок."""
+    lines = sorted((ln for ln in lines if ln[4]), key=lambda ln: (-ln[3], ln[0]))
+    boxes, open_ = [], []
+    for ln in lines:
+        # блоки, до последней строки которых уже дальше любого допуска, закрыты
+        open_ = [b for b in open_ if b[-1][1] - ln[3] <= 2 * LINE_MARGIN * (b[-1][3] - b[-1][1])]
+        for box in open_:
+            if _neighbours(box[-1], ln):
+                box.append(ln)
+                break
+        else:
+            box = [ln]
+            boxes.append(box)
+            open_.append(box)
+
+    out = []
+    for box in boxes:
+        bbox = [min(ln[0] for ln in box), min(ln[1] for ln in box),
+                max(ln[2] for ln in box), max(ln[3] for ln in box)]
+        out.append(("\n".join(ln[4] for ln in box), bbox))
+    return out
@@ -0,0 +1,123 @@
+"""
+Pipeline целиком в одном процессе — без HTTP, multipart и временных файлов.
+
+Те же функции, что стоят за сервисами pdf_parser, layout_analyzer,
+layout_combiner и error_detector, но результаты стадий передаются между
+ними объектами Python. Для пакетной обработки, небольших установок
+(GATEWAY_PIPELINE_MODE=local) и замеров производительности; HTTP-сервисы
+остаются для распределённого развёртывания.
+
+    import sys; sys.path.append("webapp/microservices")
+    from pipeline import run_pipeline
+    results = run_pipeline("doc.pdf")       # {"parse", "layout", "combine", "errors"}
+
+Модули стадий (и модели layout_analyzer) загружаются при первом обращении.
+"""
+import sys
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Iterator, Optional
+
+sys.path.append(str(Path(__file__).resolve().parent))  # microservices/ → пакет common
+
+# модели ultralytics не потокобезопасны: страницы размечаются по одной,
+# как в сервисе layout_analyzer
+_layout_lock = threading.Lock()
+
+
+def share_layout_lock(lock) -> None:
+    """
+    Заменяет замок разметки общим для нескольких процессов (например,
+    multiprocessing.Semaphore(n)): столько страниц одновременно занимают GPU.
+    """
+    global _layout_lock
+    _layout_lock = lock
+
+
+def _locked(pages: Iterator, lock: threading.Lock) -> Iterator:
+    """Генератор, каждый шаг которого выполняется под lock (а не весь проход)."""
+    while True:
+        with lock:
+            page = next(pages, None)
+        if page is None:
+            return
+        yield page
+
+
+# ── стадии ───────────────────────────────────────────────────────────────────
+
+def iter_parse(pdf_path, first_page: int = 1, last_page: int = 0) -> Iterator[dict]:
+    from pdf_parser.parser import iter_pages
+    return iter_pages(str(pdf_path), first=first_page, last=last_page)
+
+
+def parse(pdf_path, first_page: int = 1, last_page: int = 0) -> dict:
+    """
+    Текст и изображения pdfminer: {"pages": [...]}, как ответ /parse;
+    first_page..last_page — диапазон страниц (last_page=0 — до конца).
+    """
+    return {"pages": list(iter_parse(pdf_path, first_page, last_page))}
+
+
+def iter_layout(pdf_path) -> Iterator[dict]:
+    from layout_analyzer.analyzer import iter_analyze
+    return _locked(iter_analyze(str(pdf_path)), _layout_lock)
+
+
+def layout(pdf_path) -> dict:
+    """Разметка страниц: {"pages": [...]}, как ответ /analyze."""
+    return {"pages": list(iter_layout(pdf_path))}
+
+
+def iter_combine(pdf_path, parse: dict, layout: dict, id_counters: Optional[dict] = None,
+                 first_page: int = 1) -> Iterator[dict]:
+    from layout_combiner.combiner import iter_combine
+    return iter_combine(layout["pages"], parse, str(pdf_path), id_counters, first_page)
+
+
+def combine(pdf_path, parse: dict, layout: dict, id_counters: Optional[dict] = None,
+            first_page: int = 1) -> list:
+    """
+    Объединённая структура страниц, как ответ /combine. id_counters
+    изменяется на месте — как заголовок X-Id-Counters у сервиса.
+    """
+    return list(iter_combine(pdf_path, parse, layout, id_counters, first_page))
+
+
+def iter_errors(combine: list) -> Iterator[dict]:
+    from error_detector.detector import detect_page
+    # detect_page дописывает errors в саму страницу; результат combine не трогаем
+    return (detect_page(dict(page)) for page in combine)
+
+
+def errors(combine: list) -> list:
+    """Страницы combine с полем errors, как ответ /detect."""
+    return list(iter_errors(combine))
+
+
+# ── весь документ ────────────────────────────────────────────────────────────
+
+def run_pipeline(pdf_path, timings: Optional[dict] = None) -> dict:
+    """
+    Все стадии для одного PDF: parse и layout одновременно (в потоках),
+    затем combine и errors. Возвращает результаты стадий по имени;
+    в timings, если передан, — секунды каждой стадии.
+    """
+    timings = {} if timings is None else timings
+
+    def timed(name, fn, *args):
+        t0 = time.perf_counter()
+        try:
+            return fn(*args)
+        finally:
+            timings[name] = time.perf_counter() - t0
+
+    with ThreadPoolExecutor(max_workers=2) as ex:
+        parsed = ex.submit(timed, "parse", parse, pdf_path)
+        laid   = ex.submit(timed, "layout", layout, pdf_path)
+        results = {"parse": parsed.result(), "layout": laid.result()}
+    results["combine"] = timed("combine", combine, pdf_path, results["parse"], results["layout"])
+    results["errors"]  = timed("errors", errors, results["combine"])
+    return results
@@ -0,0 +1,108 @@
+"""Общие модули сервисов: согласование формата ответа и предел размера загрузки."""
+import sys
+import asyncio
+from pathlib import Path
+
+import pytest
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.testclient import TestClient
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path[:0] = [str(ROOT), str(ROOT / "microservices")]
+
+from common import codec
+from common.codec import JSON, MSGPACK, negotiate
+from common.uploads import LimitUploadSize
+
+
+# ── codec.negotiate ──────────────────────────────────────────────────────────
+
+@pytest.fixture
+def full_codec(monkeypatch):
+    """Как будто msgpack и zstandard установлены: negotiate смотрит только на их наличие."""
+    monkeypatch.setattr(codec, "msgpack", object())
+    monkeypatch.setattr(codec, "zstandard", object())
+
+
+@pytest.mark.parametrize("accept, accept_encoding, expected", [
+    ("", "", (JSON, None)),                                           # без запроса — несжатый JSON
+    ("application/msgpack", "zstd", (MSGPACK, "zstd")),
+    ("application/x-msgpack", "gzip", (MSGPACK, "gzip")),
+    ("application/json, application/msgpack", "", (JSON, None)),      # порядок при равных q
+    ("application/json;q=0.5, application/msgpack", "", (MSGPACK, None)),
+    ("application/msgpack;q=0, */*", "", (JSON, None)),               # q=0 — «не присылать»
+    ("*/*, application/msgpack", "", (JSON, None)),                   # до звёздочки — только JSON
+    ("text/html, application/msgpack;q=0.9", "", (MSGPACK, None)),    # неизвестное пропускается
+    ("", "gzip;q=0.5, zstd", (JSON, "zstd")),
+    ("", "br, gzip", (JSON, "gzip")),
+    ("", "identity", (JSON, None)),
+    ("", "gzip;q=bad", (JSON, None)),                                 # кривое q — как q=0
+])
+def test_negotiate(full_codec, accept, accept_encoding, expected):
+    assert negotiate(accept, accept_encoding) == expected
+
+
+def test_negotiate_without_optional_packages(monkeypatch):
+    # без msgpack и zstandard отвечаем тем, что есть, а не ошибкой
+    monkeypatch.setattr(codec, "msgpack", None)
+    monkeypatch.setattr(codec, "zstandard", None)
+    assert negotiate("application/msgpack", "zstd, gzip;q=0.1") == (JSON, "gzip")
+
+
+# ── LimitUploadSize ──────────────────────────────────────────────────────────
+
+@pytest.fixture
+def client():
+    app = FastAPI()
+    app.add_middleware(LimitUploadSize, max_bytes=100)
+
+    @app.post("/upload")
+    async def upload(request: Request):
+        return {"size": len(await request.body())}
+
+    @app.get("/ping")
+    async def ping():
+        return {"ok": True}
+
+    return TestClient(app)
+
+
+def test_upload_within_limit(client):
+    assert client.post("/upload", content=b"x" * 100).json() == {"size": 100}
+    assert client.get("/ping").status_code == 200
+
+
+def test_upload_content_length_over_limit(client):
+    resp = client.post("/upload", content=b"x" * 101)
+    assert resp.status_code == 413 and "Файл больше допустимого" in resp.json()["detail"]
+
+
+def test_upload_chunked_over_limit(client):
+    resp = client.post("/upload", content=(b"x" * 30 for _ in range(10)))
+    assert resp.status_code == 413
+
+
+def test_upload_chunked_stops_early():
+    # TestClient читает тело целиком заранее — здесь сообщения ASGI отдаются по одному
+    read, sent = [], []
+
+    async def app(scope, receive, send):
+        while (await receive()).get("more_body"):
+            pass
+
+    async def receive():
+        read.append(len(read))
+        return {"type": "http.request", "body": b"x" * 30, "more_body": len(read) < 10}
+
+    async def send(message):
+        sent.append(message)
+
+    scope = {"type": "http", "method": "POST", "path": "/", "headers": []}
+    with pytest.raises(HTTPException) as e:
+        asyncio.run(LimitUploadSize(app, max_bytes=100)(scope, receive, send))
+    assert e.value.status_code == 413 and len(read) == 4
+
+
+def test_upload_chunked_within_limit(client):
+    resp = client.post("/upload", content=(b"x" * 25 for _ in range(4)))
+    assert resp.json() == {"size": 100}
@@ -0,0 +1,228 @@
+"""Очередь задач, кэш результатов и сборка мусора шлюза — на временных папках."""
+import os
+import sys
+import time
+import tempfile
+import threading
+from pathlib import Path
+
+import pytest
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path[:0] = [str(ROOT), str(ROOT / "microservices")]
+# модули шлюза при импорте открывают базу в DATA_DIR — не в рабочей webapp/data
+os.environ.setdefault("GATEWAY_DATA_DIR", tempfile.mkdtemp(prefix="gateway-tests-"))
+
+from app import pipeline, retention
+from app.cache import ResultCache, stage_tags
+from app.jobs import DONE, QUEUED, RUNNING, JobQueue
+from app.retention import UsageIndex
+
+DAY = 86400
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    """Свои очередь, индекс, кэш и static/uploads — подменяются в модулях шлюза."""
+    uploads = tmp_path / "uploads"
+    uploads.mkdir()
+    db = tmp_path / "jobs.sqlite3"
+    st = {"uploads": uploads, "queue": JobQueue(db), "usage": UsageIndex(db),
+          "cache": ResultCache(tmp_path / "cache")}
+    for module in (retention, pipeline):
+        monkeypatch.setattr(module, "UPLOAD_BASE", uploads)
+        monkeypatch.setattr(module, "queue", st["queue"])
+        monkeypatch.setattr(module, "usage", st["usage"])
+        monkeypatch.setattr(module, "cache", st["cache"])
+    monkeypatch.setattr(pipeline, "CACHE_ENABLED", True)
+    monkeypatch.setattr(retention, "RETENTION_DAYS", 0)
+    monkeypatch.setattr(retention, "RETENTION_QUOTA_BYTES", 0)
+    monkeypatch.setattr(retention, "RETENTION_PREVIEWS_FIRST", True)
+    return st
+
+
+def _job(st, job_id: str, result: int, preview: int = 0, age_days: float = 0,
+         status: str = DONE, digest: str = None) -> Path:
+    """Папка задачи с итогом result байт и превью preview байт, открытая age_days назад."""
+    job_dir = st["uploads"] / job_id
+    job_dir.mkdir()
+    (job_dir / f"{job_id}_errors.json").write_bytes(b"x" * result)
+    if preview:
+        (job_dir / "previews").mkdir()
+        (job_dir / "previews" / "1.png").write_bytes(b"p" * preview)
+    if status == DONE:
+        st["queue"].add_done(job_id, "doc.pdf", digest)
+    else:
+        st["queue"].enqueue(job_id, "doc.pdf", digest)
+    st["usage"].add(job_id, result, preview, created=time.time() - age_days * DAY)
+    return job_dir
+
+
+# ── очередь ──────────────────────────────────────────────────────────────────
+
+def test_claim_oldest_first(tmp_path):
+    q = JobQueue(tmp_path / "jobs.sqlite3")
+    assert q.claim() is None
+    for job_id in ("a", "b", "c"):
+        q.enqueue(job_id, f"{job_id}.pdf", digest=job_id * 4, trace_id="t")
+    job = q.claim()
+    assert job == {"job_id": "a", "filename": "a.pdf", "digest": "aaaa", "trace_id": "t"}
+    row = q.get("a")
+    assert row["status"] == RUNNING and row["attempts"] == 1 and row["started"]
+    assert [q.claim()["job_id"], q.claim()["job_id"], q.claim()] == ["b", "c", None]
+
+
+def test_claim_concurrent(tmp_path):
+    # каждый поток — своё соединение, как воркеры разных процессов шлюза
+    q = JobQueue(tmp_path / "jobs.sqlite3")
+    for n in range(40):
+        q.enqueue(f"job{n}", "doc.pdf")
+    claimed, lock = [], threading.Lock()
+
+    def worker():
+        while (job := q.claim()) is not None:
+            with lock:
+                claimed.append(job["job_id"])
+
+    threads = [threading.Thread(target=worker) for _ in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert sorted(claimed) == sorted(f"job{n}" for n in range(40))
+
+
+def test_requeue_running(tmp_path):
+    q = JobQueue(tmp_path / "jobs.sqlite3")
+    q.enqueue("a", "a.pdf")
+    q.enqueue("b", "b.pdf")
+    q.claim()
+    q.set_stage("a", "layout")
+    assert q.requeue_running() == 1
+    row = q.get("a")
+    assert row["status"] == QUEUED and row["stage"] is None
+    assert q.claim()["job_id"] == "a"            # прежнее место в очереди
+    assert q.get("a")["attempts"] == 2
+    assert q.requeue_running() == 1 and q.requeue_running() == 0
+
+
+def test_done_jobs_stay_done(tmp_path):
+    q = JobQueue(tmp_path / "jobs.sqlite3")
+    q.add_done("cached", "doc.pdf", digest="d")
+    q.enqueue("a", "a.pdf")
+    q.claim()
+    q.fail("a", "boom")
+    assert q.requeue_running() == 0 and q.claim() is None
+    assert q.active_ids() == set() and q.ids_with_digest("d") == ["cached"]
+
+
+# ── кэш результатов ──────────────────────────────────────────────────────────
+
+STAGES = {"parse": (None, ()), "layout": (None, ()),
+          "combine": (None, ("parse", "layout")), "errors": (None, ("combine",))}
+
+
+def test_stage_tags():
+    base = stage_tags(STAGES, {})
+    assert base == stage_tags(STAGES, {"parse": "0"})         # версия по умолчанию — "0"
+    assert len(set(base.values())) == 4
+    bumped = stage_tags(STAGES, {"layout": "2"})
+    # новая версия стадии сбрасывает её и всё, что от неё зависит
+    assert [bumped[s] == base[s] for s in STAGES] == [True, False, False, False]
+    assert stage_tags(STAGES, {"errors": "2"})["combine"] == base["combine"]
+
+
+def test_link_cached_result(store):
+    digest = "ab" * 32
+    assert not pipeline.link_cached_result("job", digest)      # в кэше пусто
+    store["cache"].put(digest, "errors", pipeline.TAGS["errors"], {"errors": []})
+    store["usage"].refresh_cache(digest, created=time.time() - DAY)
+    (store["uploads"] / "job").mkdir()
+
+    assert pipeline.link_cached_result("job", digest)
+    dest = store["uploads"] / "job" / "job_errors.json"
+    src = store["cache"].path(digest, "errors", pipeline.TAGS["errors"])
+    assert dest.read_bytes() == src.read_bytes()
+    assert dest.stat().st_ino == src.stat().st_ino             # ссылка, не копия
+    # попадание продлевает жизнь записи кэша
+    assert store["usage"].cache_lru()[0]["last_access"] > time.time() - 60
+
+
+def test_link_cached_result_stale_or_disabled(store, monkeypatch):
+    digest = "cd" * 32
+    store["cache"].put(digest, "errors", "old-tag", {"errors": []})
+    (store["uploads"] / "job").mkdir()
+    assert not pipeline.link_cached_result("job", digest)      # другая версия стадии
+    store["cache"].put(digest, "errors", pipeline.TAGS["errors"], {"errors": []})
+    monkeypatch.setattr(pipeline, "CACHE_ENABLED", False)
+    assert not pipeline.link_cached_result("job", digest)
+    assert not (store["uploads"] / "job" / "job_errors.json").exists()
+
+
+# ── сборка мусора ────────────────────────────────────────────────────────────
+
+def test_collect_ttl(store, monkeypatch):
+    monkeypatch.setattr(retention, "RETENTION_DAYS", 30)
+    old     = _job(store, "old", 100, age_days=40)
+    fresh   = _job(store, "fresh", 100, age_days=1)
+    running = _job(store, "running", 100, age_days=40, status=QUEUED)
+
+    assert retention.collect(dry_run=True)["jobs_removed"] == 1
+    assert old.exists()
+
+    stats = retention.collect()
+    assert stats["jobs_removed"] == 1 and stats["bytes_freed"] == 100
+    assert not old.exists() and fresh.exists() and running.exists()
+    assert store["queue"].get("old") is None and "old" not in store["usage"].job_ids()
+
+
+def test_collect_quota_previews_first(store, monkeypatch):
+    monkeypatch.setattr(retention, "RETENTION_QUOTA_BYTES", 2500)
+    a = _job(store, "a", 100, preview=1000, age_days=3)
+    b = _job(store, "b", 100, preview=1000, age_days=2)
+    _job(store, "c", 100, preview=1000, age_days=1)
+
+    stats = retention.collect()
+    # 3300 → 2300: хватает превью самой давней задачи
+    assert stats == {"jobs_removed": 0, "previews_removed": 1, "cache_removed": 0, "bytes_freed": 1000}
+    assert a.exists() and not (a / "previews").exists() and (b / "previews").exists()
+
+    monkeypatch.setattr(retention, "RETENTION_QUOTA_BYTES", 150)
+    stats = retention.collect()
+    assert stats["previews_removed"] == 2 and stats["jobs_removed"] == 2
+    assert sorted(p.name for p in store["uploads"].iterdir()) == ["c"]
+
+
+def test_collect_quota_counts_running_jobs(store, monkeypatch):
+    monkeypatch.setattr(retention, "RETENTION_QUOTA_BYTES", 1500)
+    old = _job(store, "old", 1000)
+    running = _job(store, "running", 0, status=QUEUED)
+    # растры задачи в работе индекс ещё не видел — меряются по диску
+    (running / "rasters").mkdir()
+    (running / "rasters" / "0.npy").write_bytes(b"r" * 1000)
+
+    assert retention.collect()["jobs_removed"] == 1
+    assert not old.exists() and running.exists()
+
+
+def test_collect_shared_cache_file(store, monkeypatch):
+    digest = "ef" * 32
+    store["cache"].put(digest, "errors", pipeline.TAGS["errors"], {"errors": ["x" * 500]})
+    store["usage"].refresh_cache(digest, created=time.time() - 5 * DAY)
+    job_dir = store["uploads"] / "job"
+    job_dir.mkdir()
+    store["queue"].add_done("job", "doc.pdf", digest)
+    assert pipeline.link_cached_result("job", digest)
+    store["usage"].refresh("job")
+    # общий файл считается один раз — за кэшем
+    assert store["usage"].lru()[0]["result_bytes"] == 0
+
+    monkeypatch.setattr(retention, "RETENTION_QUOTA_BYTES", 1)
+    monkeypatch.setattr(retention, "RETENTION_PREVIEWS_FIRST", False)
+    stats = retention.collect(dry_run=True)
+    assert stats["cache_removed"] == 1 and store["cache"].digests() == {digest}
+
+    stats = retention.collect()
+    # запись кэша ушла первой, её файл остался за задачей — и вытеснил её следом
+    assert stats["cache_removed"] == 1 and stats["jobs_removed"] == 1
+    assert store["cache"].digests() == set() and not job_dir.exists()
@@ -0,0 +1,35 @@
+"""Диапазоны страниц pdf_parser: с пулом процессов и без него — одно и то же."""
+import sys
+from pathlib import Path
+
+import pytest
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path[:0] = [str(ROOT), str(ROOT / "microservices")]
+
+from benchmarks import synth
+from pdf_parser import parser
+
+
+@pytest.fixture(scope="module")
+def pdf_path(tmp_path_factory):
+    path = tmp_path_factory.mktemp("pdf") / "doc.pdf"
+    path.write_bytes(synth.generate("text", 3)[0])
+    return path
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+@pytest.mark.parametrize("first, last, expected", [
+    (1, 0, [1, 2, 3]),          # весь документ
+    (2, 3, [2, 3]),
+    (2, 0, [2, 3]),             # до конца
+    (2, 9, [2, 3]),             # last за концом
+    (3, 3, [3]),
+    (5, 0, []),                 # first за концом
+    (5, 9, []),
+])
+def test_page_range(pdf_path, monkeypatch, workers, first, last, expected):
+    # куски по странице — чтобы с workers=2 работал пул, а не разбор в процессе
+    monkeypatch.setattr(parser, "PARSE_CHUNK_PAGES", 1)
+    pages = parser.parse_pdf(pdf_path, workers=workers, first=first, last=last, engine="pdfminer")["pages"]
+    assert [p["page_number"] for p in pages] == expected
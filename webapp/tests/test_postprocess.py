@@ -0,0 +1,129 @@
+"""Фильтры пост-обработки layout_analyzer: матрицы NumPy — то же, что прежние циклы."""
+import sys
+import copy
+import random
+from pathlib import Path
+
+import pytest
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path[:0] = [str(ROOT), str(ROOT / "microservices")]
+
+from benchmarks import boxes as bench
+from layout_analyzer import postprocess as pp
+
+MATRIX_FILTERS = ["nms", "drop_noisy_tables", "drop_nested_tables", "drop_drawings_with_text"]
+
+
+def _item(bbox, conf=0.5, cls="text", subtype="plain_text") -> dict:
+    return {"bbox": list(bbox), "conf": conf, "class": cls, "subtype": subtype}
+
+
+def _same(name: str, items: list) -> None:
+    ref, new = bench.FILTERS[name]
+    assert new(copy.deepcopy(items)) == ref(copy.deepcopy(items))
+
+
+@pytest.mark.parametrize("name", MATRIX_FILTERS)
+@pytest.mark.parametrize("seed", range(5))
+@pytest.mark.parametrize("objects", [3, 40])
+def test_random(name, seed, objects):
+    raw = bench.detections(objects, random.Random(seed))
+    # как в postprocess: nms получает сырые детекции, остальные — его выход
+    _same(name, raw if name == "nms" else bench.reference_nms(raw))
+
+
+@pytest.mark.parametrize("name", MATRIX_FILTERS)
+def test_empty(name):
+    _same(name, [])
+
+
+@pytest.mark.parametrize("name", MATRIX_FILTERS)
+@pytest.mark.parametrize("cls", ["text", "drawing", "table"])
+def test_single(name, cls):
+    _same(name, [_item((10, 10, 50, 30), cls=cls)])
+
+
+@pytest.mark.parametrize("name", MATRIX_FILTERS)
+def test_ties(name):
+    # равные conf и одинаковые боксы: порядок и выбор зависят только от стабильной сортировки
+    items = [_item((0, 0, 100, 100), 0.5, "table", "specification"),
+             _item((0, 0, 100, 100), 0.5, "drawing", "section"),
+             _item((0, 0, 100, 100), 0.5),
+             _item((0, 0, 100, 100), 0.5),
+             _item((10, 10, 90, 90), 0.5),
+             _item((100, 0, 200, 100), 0.5, "drawing", "section")]   # касается только ребром
+    _same(name, items)
+
+
+def test_nms_threshold_boundary():
+    # IoU ровно на пороге гасит бокс в обеих реализациях (условие — iou < порога)
+    a, b = _item((0, 0, 100, 100), 0.9), _item((0, 0, 100, 100), 0.8)
+    thr = pp.iou(a["bbox"], b["bbox"])
+    assert pp.nms([a, b], thr) == bench.reference_nms([a, b], thr) == [a]
+
+
+# ── merge_plain_text: сетка кандидатов против всех пар ───────────────────────
+
+GAP = 7
+
+
+def _all_touching(bboxes, gap_thr=GAP) -> set:
+    n = len(bboxes)
+    return {(i, j) for i in range(n) for j in range(i + 1, n) if pp.touching(bboxes[i], bboxes[j], gap_thr)}
+
+
+def _rows(step: float, h: float = 20, w: float = 100, n: int = 6) -> list:
+    """Строки текста в сетку с шагом step: при step = w + GAP соседи ровно на пороге."""
+    return [(x * step, y * (h + GAP), x * step + w, y * (h + GAP) + h) for x in range(n) for y in range(n)]
+
+
+def _check_candidates(bboxes) -> None:
+    pairs = list(pp.candidate_pairs(bboxes, GAP))
+    assert pairs == sorted(set(pairs)) and all(i < j for i, j in pairs)
+    assert _all_touching(bboxes) <= set(pairs)
+
+
+LAYOUTS = {
+    "edges":      _rows(100),                 # соседи касаются только ребром, границы ячеек — по рёбрам
+    "at_gap":     _rows(100 + GAP),           # зазор ровно gap_thr — ещё касаются
+    "over_gap":   _rows(100 + GAP + 1e-6),    # чуть больше — уже нет
+    "corners":    [(0, 0, 100, 20), (100, 20, 200, 40), (200 + GAP, 40 + GAP, 300, 60)],   # только углами
+    "spanning":   _rows(107, n=4) + [(-50, -50, 2000, 2000), (350, 10, 360, 500)],      # через много ячеек
+    "negative":   [(-300, -40, -200, -20), (-200 + GAP, -40, -100, -20), (-100, -20, 0, 0)],
+}
+
+
+@pytest.mark.parametrize("layout", LAYOUTS)
+def test_candidate_pairs_layouts(layout):
+    _check_candidates(LAYOUTS[layout])
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_candidate_pairs_random(seed):
+    rng = random.Random(seed)
+    bboxes = []
+    for _ in range(200):
+        # координаты на сетке кратно 10 — много совпадающих рёбер и зазоров ровно gap_thr
+        x, y = rng.randrange(0, 2000, 10), rng.randrange(0, 2000, 10)
+        w, h = rng.choice([3, 7, 10, 50, 100, 300]), rng.choice([7, 10, 20, 40])
+        bboxes.append((x, y, x + w, y + h))
+    _check_candidates(bboxes)
+
+
+@pytest.mark.parametrize("n", [0, 1])
+def test_candidate_pairs_small(n):
+    assert list(pp.candidate_pairs([(0, 0, 10, 10)] * n, GAP)) == []
+
+
+@pytest.mark.parametrize("layout", LAYOUTS)
+def test_merge_layouts(layout):
+    items = [_item(b, conf=0.1 + 0.01 * k) for k, b in enumerate(LAYOUTS[layout])]
+    items.append(_item((0, 0, 50, 50), cls="drawing", subtype="section"))
+    _same("merge_plain_text", items)
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_merge_random(seed):
+    raw = bench.detections(60, random.Random(seed))
+    _same("merge_plain_text", bench.reference_nms(raw))